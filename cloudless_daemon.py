@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+#
+#------------------------------------------------------------------------------
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+#
+#
+#       Daemon mode of create_cloudless.py (--daemon):
+#       a long-running worker process keeping GDAL, the configuration, the
+#       wcsClient (limits, latency statistics) and the shared listing and
+#       coverage caches warm. Jobs are submitted over a local HTTP API, queued
+#       and processed by a bounded number of workers (see: cloudless_jobs).
+#
+#       API  (JSON, on [daemon] host:port):
+#         POST /jobs                  submit a job - same fields as a line of a jobs-file
+#                                     -> 202 {job record}, 400 invalid, 503 queue full
+#         GET  /jobs                  the records of all known jobs
+#         GET  /jobs/<job_id>         the record of a job: status (queued|running|done|failed),
+#                                     outputs, error, times
+#         GET  /jobs/<job_id>/log     the progress messages (print_log) of a job, from byte
+#                                     ?offset=<n>; with ?follow=1 streamed until the job ends
+#         GET  /status                workers, queue length, number of jobs per status
+#
+#
+# Project: DeltaDREAM
+# Name:    cloudless_daemon.py
+# Authors: Christian Schiller <christian dot schiller at eox dot at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2014 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+#
+#
+
+import sys
+import os
+import re
+import time
+import json
+import itertools
+import threading
+import collections
+import Queue
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+import wcs_client
+import cloudless_jobs
+from util import print_log
+
+
+    # job ids:  letters, digits, '.', '_', '-'  (they are used as log-file names)
+job_id_pattern = re.compile(r'^[A-Za-z0-9._-]+$')
+
+
+#/************************************************************************/
+#/*                              JobQueue()                              */
+#/************************************************************************/
+
+class JobQueue(object):
+    """
+        the jobs of the daemon:  a bounded queue (scheduled by the JobScheduler) processed
+        by a fixed number of worker threads, and the records (status) of the known jobs
+    """
+    def __init__(self, settings, workers, max_queue, log_dir, max_history=1000):
+        self.settings = settings
+        self.log_dir = log_dir
+        self.pending = cloudless_jobs.JobScheduler(settings, max_queue, workers)
+        self.records = collections.OrderedDict()
+        self.max_history = max_history
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.manifest = open(os.path.join(log_dir, 'daemon.manifest.jsonl'), 'a')
+        self.workers = []
+        for idx in range(workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+#---------
+    def submit(self, job):
+        """
+            queue a job (dict, see: cloudless_jobs.read_jobs)
+            Returns:  the record of the job
+            Raises:   ValueError (invalid job)  or  Queue.Full
+        """
+        if not isinstance(job, dict):
+            raise ValueError('a job has to be a JSON object')
+        with self.lock:
+            if job.get('job_id') is None:
+                job['job_id'] = time.strftime('%Y%m%dT%H%M%S_') + str(self.ids.next())
+            job['job_id'] = str(job['job_id'])
+            if job_id_pattern.match(job['job_id']) is None:
+                raise ValueError('invalid job_id: ' + job['job_id'])
+            if self.records.has_key(job['job_id']) and self.records[job['job_id']]['status'] in ('queued', 'running'):
+                raise ValueError('job already queued or running: ' + job['job_id'])
+
+            record = {'job_id': job['job_id'], 'status': 'queued', 'outputs': [],
+                      'log': os.path.join(self.log_dir, job['job_id']+'.log'),
+                      'submitted': time.strftime('%Y-%m-%dT%H:%M:%S')}
+            self.pending.put(job)
+            if self.records.pop(job['job_id'], None) is not None and os.path.exists(record['log']):
+                os.remove(record['log'])        # the log of a previous run of the job_id
+            self.records[job['job_id']] = record
+            self._trim()
+
+        return dict(record)
+
+#---------
+    def get(self, job_id):
+        with self.lock:
+            record = self.records.get(job_id)
+            if record is None:
+                return None
+            return dict(record)
+
+#---------
+    def list(self):
+        with self.lock:
+            return [dict(record) for record in self.records.values()]
+
+#---------
+    def status(self):
+        with self.lock:
+            counts = collections.Counter(record['status'] for record in self.records.values())
+        return {'workers': len(self.workers), 'queued': self.pending.qsize(), 'jobs': dict(counts)}
+
+#---------
+    def _trim(self):
+        """
+            forget the oldest finished jobs beyond max_history
+        """
+        finished = [job_id for job_id, record in self.records.items() if record['status'] in ('done', 'failed')]
+        for job_id in finished[:max(0, len(self.records) - self.max_history)]:
+            del self.records[job_id]
+
+#---------
+    def _work(self):
+        """
+            worker thread:  process the queued jobs one after the other
+        """
+        while True:
+            job = self.pending.get()
+            with self.lock:
+                self.records[job['job_id']]['status'] = 'running'
+            try:
+                result = cloudless_jobs.run_job(job, self.settings, self.log_dir)
+            except Exception as e:
+                result = {'status': 'failed', 'error': '%s: %s' % (e.__class__.__name__, e)}
+            finally:
+                self.pending.done(job)
+            with self.lock:
+                self.records[job['job_id']].update(result)
+                self.manifest.write(json.dumps(self.records[job['job_id']], sort_keys=True)+'\n')
+                self.manifest.flush()
+            lmsg = '[%s] %s' % (result['status'], job['job_id'])
+            print_log(self.settings, lmsg)
+
+
+#/************************************************************************/
+#/*                       DaemonRequestHandler()                         */
+#/************************************************************************/
+
+class DaemonRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+        handles the requests of the job API (see above)
+    """
+    server_version = 'CloudfreeDaemon/0.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def send_json(self, code, data):
+        body = json.dumps(data, sort_keys=True, indent=1)+'\n'
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        path = urlparse.urlsplit(self.path)[2].rstrip('/')
+        if path != '/jobs':
+            self.send_json(404, {'error': 'unknown resource: '+path})
+            return
+        try:
+            length = int(self.headers.getheader('Content-Length', 0))
+            job = json.loads(self.rfile.read(length))
+            record = self.server.jobs.submit(job)
+        except ValueError as err:
+            self.send_json(400, {'error': str(err)})
+            return
+        except Queue.Full:
+            self.send_json(503, {'error': 'the job queue is full, retry later'})
+            return
+
+        self.send_json(202, record)
+
+    def do_GET(self):
+        parts = urlparse.urlsplit(self.path)
+        path = parts[2].rstrip('/').split('/')[1:]
+        params = dict(urlparse.parse_qsl(parts[3]))
+
+        if path == ['status']:
+            self.send_json(200, self.server.jobs.status())
+        elif path == ['jobs']:
+            self.send_json(200, self.server.jobs.list())
+        elif len(path) in (2, 3) and path[0] == 'jobs':
+            record = self.server.jobs.get(path[1])
+            if record is None:
+                self.send_json(404, {'error': 'unknown job: '+path[1]})
+            elif len(path) == 2:
+                self.send_json(200, record)
+            elif path[2] == 'log':
+                self.send_log(record, int(params.get('offset', 0)), params.get('follow', '0') in ('1', 'yes', 'true'))
+            else:
+                self.send_json(404, {'error': 'unknown resource: '+parts[2]})
+        else:
+            self.send_json(404, {'error': 'unknown resource: '+parts[2]})
+
+    def send_log(self, record, offset, follow):
+        """
+            send the log of a job from offset - if follow is set, the log is streamed
+            (the connection is kept open) until the job has finished
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.end_headers()
+        while True:
+            finished = self.server.jobs.get(record['job_id'])['status'] in ('done', 'failed')
+            if os.path.exists(record['log']):
+                in_handle = open(record['log'], 'rb')
+                in_handle.seek(offset)
+                chunk = in_handle.read()
+                in_handle.close()
+                if chunk:
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+                    offset += len(chunk)
+            if not follow or finished:
+                return
+            time.sleep(0.5)
+
+
+#/************************************************************************/
+#/*                           DaemonServer()                             */
+#/************************************************************************/
+
+class DaemonServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+        the local HTTP server of the job API
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host, port, jobs, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, int(port)), DaemonRequestHandler)
+        self.jobs = jobs
+        self.verbose = verbose
+
+    @property
+    def url(self):
+        return 'http://%s:%d/' % self.server_address
+
+
+#/************************************************************************/
+#/*                              serve()                                 */
+#/************************************************************************/
+
+def serve(settings):
+    """
+        run the daemon (until interrupted):  warm up, start the workers and the job API
+    """
+        # load the readers and processors (and with them GDAL and numpy) once
+    import dataset_reader
+    import dataset_processor
+    dataset_reader.open_catalog(settings)
+
+    log_dir = settings.get('daemon.log_dir', './tmp/daemon_logs/')
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+
+        # the listings and coverage downloads are shared by all jobs
+    wcs_client.set_shared_caches(settings.get('batch.listing_ttl', 600),
+                                 settings.get('batch.coverage_cache', './tmp/coverage_cache/') or None)
+    cache_max_age = float(settings.get('daemon.coverage_cache_max_age', 3600))
+
+    jobs = JobQueue(settings, int(settings.get('daemon.workers', settings.get('batch.workers', 4))),
+                    int(settings.get('daemon.max_queue', 100)), log_dir)
+    server = DaemonServer(settings.get('daemon.host', '127.0.0.1'), settings.get('daemon.port', 8811), jobs)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+
+    lmsg = 'Cloudfree daemon accepting jobs at: ', server.url, '  workers: ', len(jobs.workers), '  logs: ', log_dir
+    print_log(settings, lmsg)
+
+    try:
+        while True:
+            time.sleep(60)
+            wcs_client.prune_shared_caches(cache_max_age)
+    except KeyboardInterrupt:
+        lmsg = 'Cloudfree daemon stopped'
+        print_log(settings, lmsg)
+    finally:
+        server.shutdown()
+        server.server_close()
+        wcs_client.clear_shared_caches()
@@ -0,0 +1,435 @@
+#!/usr/bin/env python
+#
+#------------------------------------------------------------------------------
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+#
+#
+#       Batch mode of create_cloudless.py (--jobs <jobs_file>):
+#       runs many cloud-free requests in one process - concurrently, sharing
+#       the configuration, the per-server limits of the wcsClient, the cached
+#       listings and the coverage downloads (identical requests of different
+#       jobs are coalesced). Each job gets its own log-file and a line in the
+#       result manifest.
+#
+#       The jobs_file holds one request per line (JSON), with the same fields
+#       as the cmd-line parameters (see: create_cloudless.get_cmdline), e.g.
+#         {"job_id": "tile_17", "dataset": "landsat5_2a", "aoi": "3.5,3.6,43.3,43.4",
+#          "toi": "20110513", "scenario": "T", "period": 90, "bands": "3,2,1", "output_dir": "./out"}
+#       empty lines and lines starting with '#' are skipped. An optional "priority"
+#       (integer, higher = earlier) is used by the JobScheduler.
+#
+#
+# Project: DeltaDREAM
+# Name:    cloudless_jobs.py
+# Authors: Christian Schiller <christian dot schiller at eox dot at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2014 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+#
+#
+
+import sys
+import os
+import time
+import json
+import threading
+import traceback
+import urlparse
+import Queue
+
+import wcs_client
+from util import print_log
+
+
+    # the input parameters of a request (see: create_cloudless.get_cmdline)
+job_fields = ['dataset', 'aoi', 'toi', 'scenario', 'extract', 'period', 'output_crs', 'bands',
+              'output_datatype', 'output_dir', 'output_format', 'keep_temporary']
+
+
+#/************************************************************************/
+#/*                             read_jobs()                              */
+#/************************************************************************/
+
+def read_jobs(jobs_file):
+    """
+        read the requests of the jobs_file (one JSON object per line)
+        Returns:  list of job dicts - each with a 'job_id' (default: job_<line number>)
+    """
+    jobs = []
+    in_handle = open(jobs_file, 'r')
+    for lineno, line in enumerate(in_handle):
+        line = line.strip()
+        if line == '' or line.startswith('#'):
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError as e:
+            raise ValueError('%s, line %d: %s' % (jobs_file, lineno+1, e))
+        if not isinstance(job, dict):
+            raise ValueError('%s, line %d: a job has to be a JSON object' % (jobs_file, lineno+1))
+        job.setdefault('job_id', 'job_%d' % (lineno+1))
+        jobs.append(job)
+    in_handle.close()
+
+    return jobs
+
+
+#/************************************************************************/
+#/*                           get_job_params()                           */
+#/************************************************************************/
+
+def get_job_params(job, settings):
+    """
+        the input_params of a job - the same as created by the cmd-line parsing,
+        incl. the defaults and the AOI/TOI limits (which exit on failure)
+    """
+    import create_cloudless
+
+    input_params = dict((key, None) for key in job_fields)
+    input_params['keep_temporary'] = False
+    for key in job_fields:
+        if job.get(key) is not None:
+            input_params[key] = job[key]
+
+    for key in ('dataset', 'aoi', 'toi', 'output_dir'):
+        if input_params[key] is None:
+            raise ValueError("'%s' is a required job parameter" % key)
+
+    if isinstance(input_params['aoi'], basestring):
+        input_params['aoi'] = input_params['aoi'].split(',')     # as minx, maxx, miny, maxy
+    input_params['aoi'] = [str(elem).strip() for elem in input_params['aoi']]
+    if len(input_params['aoi']) != 4:
+        raise ValueError("the aoi requires 4 parameters 'minx, maxx, miny, maxy'")
+
+    input_params['dataset'] = str(input_params['dataset'])
+    input_params['toi'] = str(input_params['toi'])
+    if input_params['bands'] is not None:
+        if isinstance(input_params['bands'], basestring):
+            input_params['bands'] = input_params['bands'].split(',')
+        input_params['bands'] = [str(elem).strip() for elem in input_params['bands']]
+    if input_params['period'] is not None:
+        input_params['period'] = int(input_params['period'])
+    for key in ('scenario', 'extract', 'output_format'):
+        if input_params[key] is not None:
+            input_params[key] = str.upper(str(input_params[key]))
+    if input_params['output_datatype'] is not None:
+        input_params['output_datatype'] = str.lower(str(input_params['output_datatype']))
+    input_params['output_dir'] = os.path.join(str(input_params['output_dir']), '')
+    input_params['keep_temporary'] = input_params['keep_temporary'] is True
+
+    create_cloudless.set_default_params(input_params, settings)
+    create_cloudless.check_toiinput(settings, input_params['period'])
+    create_cloudless.check_aoiinput(settings, input_params['aoi'])
+
+    return input_params
+
+
+#/************************************************************************/
+#/*                          estimate_cost()                             */
+#/************************************************************************/
+
+def estimate_cost(job, settings):
+    """
+        the estimated cost of a job:  AOI area (sq. degrees - the max. AOI for FULL
+        extracts) * period * number of bands;  1.0 if it can not be estimated
+    """
+    import create_cloudless
+
+    try:
+        aoi = job['aoi']
+        if isinstance(aoi, basestring):
+            aoi = aoi.split(',')
+        extract = str(job.get('extract') or settings.get('general.def_extract', 'SUB')).upper()
+        if extract == 'FULL':
+            area = float(settings['general.def_maxaoi'])**2
+        else:
+            area = abs(create_cloudless.get_aoi_area(aoi))
+
+        period = int(job.get('period') or settings.get('general.def_period', 10))
+        bands = job.get('bands') or settings.get('general.def_bands', '999')
+        if isinstance(bands, basestring):
+            bands = bands.split(',')
+        if bands == ['999']:
+            nbands = int(settings.get('scheduler.all_bands', 6))
+        else:
+            nbands = len(bands)
+
+        return max(area * period * nbands, 1e-6)
+
+    except (KeyError, ValueError, TypeError, IndexError):
+        return 1.0
+
+
+#/************************************************************************/
+#/*                           get_job_server()                           */
+#/************************************************************************/
+
+def get_job_server(job, settings):
+    """
+        the server a job is sent to (host of the dataset location) - 'local' for local datasets
+    """
+    service = settings.get('dataset.'+str(job.get('dataset')), '')
+    service = wcs_client.split_mirrors(service)[0] if service != '' else ''
+
+    return urlparse.urlsplit(service)[1] or 'local'
+
+
+#/************************************************************************/
+#/*                            JobScheduler()                            */
+#/************************************************************************/
+
+class JobScheduler(object):
+    """
+        fair-share scheduling of the queued jobs (batch and daemon mode):
+         - a queue per (server, dataset); the queues are served by weighted fair queuing,
+           i.e. the queue which has received the least (estimated) cost so far is next
+         - within a queue: highest priority first, then the cheapest job (its cost aged
+           by the waiting time, so big jobs are not starved)
+         - a higher priority is served first across all queues
+         - at most 'max_per_server' jobs run against the same server at a time, so a
+           slow server can not block all workers (0 = the number of workers, i.e. no limit)
+        get() / done() are used like Queue.get() / task_done()
+    """
+    def __init__(self, settings, max_queue=0, workers=None):
+        self.settings = settings
+        self.max_queue = max_queue
+        self.max_per_server = int(settings.get('scheduler.max_per_server', 0) or 0)
+        if workers is None:
+            workers = int(settings.get('batch.workers', 4))
+        if self.max_per_server <= 0:
+            self.max_per_server = workers
+        elif self.max_per_server < workers:
+            lmsg = '[Warning] -- scheduler.max_per_server (', self.max_per_server, ') is below the number of workers (', \
+                   workers, ') - jobs against the same server will not use all workers'
+            print_log(settings, lmsg)
+        self.aging_time = float(settings.get('scheduler.aging_time', 300))
+        self.default_priority = int(settings.get('scheduler.default_priority', 0))
+        self.queues = {}            # (server, dataset) -> {'jobs': [...], 'vtime': float}
+        self.running = {}           # server -> number of running jobs
+        self.count = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+#---------
+    def put(self, job):
+        """
+            queue a job - raises Queue.Full if max_queue (>0) jobs are queued
+        """
+        entry = {'job': job, 'server': get_job_server(job, self.settings), 'cost': estimate_cost(job, self.settings),
+                 'priority': int(job.get('priority', self.default_priority)), 'queued': time.time()}
+        key = (entry['server'], str(job.get('dataset')))
+        with self.cond:
+            if self.max_queue > 0 and self.count >= self.max_queue:
+                raise Queue.Full()
+            queue = self.queues.get(key)
+            if queue is None or len(queue['jobs']) == 0:
+                    # a (re-)activated queue starts at the current virtual time - no saved-up credit
+                active = [elem['vtime'] for elem in self.queues.values() if len(elem['jobs']) > 0]
+                vtime = min(active) if len(active) > 0 else 0.0
+                if queue is not None:
+                    vtime = max(vtime, queue['vtime'])
+                queue = {'jobs': [], 'vtime': vtime}
+                self.queues[key] = queue
+            queue['jobs'].append(entry)
+            self.count += 1
+            self.cond.notify()
+
+#---------
+    def close(self):
+        """
+            no more jobs will be queued - get() returns None once all are taken
+        """
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+#---------
+    def qsize(self):
+        with self.cond:
+            return self.count
+
+#---------
+    def _rank(self, entry, now):
+        aged_cost = entry['cost'] / (1.0 + (now - entry['queued']) / self.aging_time)
+        return (-entry['priority'], aged_cost, entry['queued'])
+
+#---------
+    def get(self):
+        """
+            wait for the next job to run
+            Returns:  job  or  None (closed and empty)
+        """
+        with self.cond:
+            while True:
+                now = time.time()
+                best = None
+                for key, queue in self.queues.items():
+                    if len(queue['jobs']) == 0 or self.running.get(key[0], 0) >= self.max_per_server:
+                        continue
+                    head = min(queue['jobs'], key=lambda entry: self._rank(entry, now))
+                    order = (-head['priority'], queue['vtime'], head['queued'])
+                    if best is None or order < best[0]:
+                        best = (order, queue, head)
+
+                if best is not None:
+                    order, queue, entry = best
+                    queue['jobs'].remove(entry)
+                    queue['vtime'] += entry['cost']
+                    self.running[entry['server']] = self.running.get(entry['server'], 0) + 1
+                    self.count -= 1
+                    entry['job']['_server'] = entry['server']
+                    return entry['job']
+
+                if self.closed and self.count == 0:
+                    return None
+                self.cond.wait(1.0)
+
+#---------
+    def done(self, job):
+        """
+            a job (returned by get) has finished - its server slot is free again
+        """
+        with self.cond:
+            server = job.pop('_server', None)
+            if server is not None:
+                self.running[server] -= 1
+            self.cond.notify_all()
+
+
+#/************************************************************************/
+#/*                              run_job()                               */
+#/************************************************************************/
+
+def run_job(job, settings, log_dir):
+    """
+        process a single job with its own copy of the settings, logging to its own
+        log-file (<log_dir>/<job_id>.log) - a failing job (SystemExit or exception)
+        does not affect the others
+        Returns:  the manifest record of the job
+    """
+    import create_cloudless
+
+    startTime = time.time()
+    log_file = os.path.join(log_dir, job['job_id']+'.log')
+    job_settings = dict(settings)
+    job_settings['logging.log_fsock'] = open(log_file, 'a')
+
+    record = {'job_id': job['job_id'], 'status': 'failed', 'exit_code': None, 'outputs': [],
+              'log': log_file, 'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(startTime))}
+    try:
+        input_params = get_job_params(job, job_settings)
+        cf_result = create_cloudless.process_request(input_params, job_settings)
+        record['outputs'] = [input_params['output_dir']+os.path.basename(elem) for elem in cf_result]
+        record['status'] = 'done'
+        record['exit_code'] = 0
+
+    except SystemExit as e:
+        record['exit_code'] = e.code
+        record['error'] = 'exited with code: %s' % e.code
+
+    except Exception as e:
+        record['error'] = '%s: %s' % (e.__class__.__name__, e)
+        print_log(job_settings, traceback.format_exc())
+
+    record['runtime'] = round(time.time() - startTime, 3)
+    lmsg = 'Job ', job['job_id'], ' ', record['status'], ' - RUNTIME in sec: ', record['runtime']
+    print_log(job_settings, lmsg)
+    job_settings['logging.log_fsock'].close()
+
+    return record
+
+
+#/************************************************************************/
+#/*                              run_jobs()                              */
+#/************************************************************************/
+
+def run_jobs(jobs_file, settings, workers=None, manifest_file=None):
+    """
+        run all jobs of the jobs_file concurrently ([batch] workers), in the order of the
+        JobScheduler, and write a line per finished job to the result manifest
+        (default: <jobs_file>.manifest.jsonl)
+        Returns:  number of failed jobs
+    """
+    jobs = read_jobs(jobs_file)
+    if workers is None:
+        workers = int(settings.get('batch.workers', 4))
+    log_dir = settings.get('batch.log_dir', '')
+    if log_dir == '':
+        log_dir = os.path.dirname(os.path.abspath(jobs_file))
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+    if manifest_file is None:
+        manifest_file = os.path.join(log_dir, os.path.basename(jobs_file)+'.manifest.jsonl')
+
+        # the listings and coverage downloads are shared by the jobs
+    wcs_client.set_shared_caches(settings.get('batch.listing_ttl', 600),
+                                 settings.get('batch.coverage_cache', './tmp/coverage_cache/') or None)
+
+    cache_max_age = float(settings.get('batch.coverage_cache_max_age', 3600))
+
+    lmsg = 'Running ', len(jobs), ' jobs from: ', jobs_file, ' using ', workers, ' workers'
+    print_log(settings, lmsg)
+    startTime = time.time()
+
+    pending = JobScheduler(settings, workers=workers)
+    for job in jobs:
+        pending.put(job)
+    pending.close()
+    manifest = open(manifest_file, 'a')
+    manifest_lock = threading.Lock()
+    failed = [0]
+
+    def worker():
+        while True:
+            job = pending.get()
+            if job is None:
+                return
+            try:
+                record = run_job(job, settings, log_dir)
+            finally:
+                pending.done(job)
+                wcs_client.prune_shared_caches(cache_max_age)
+            with manifest_lock:
+                manifest.write(json.dumps(record, sort_keys=True)+'\n')
+                manifest.flush()
+                if record['status'] != 'done':
+                    failed[0] += 1
+                lmsg = '[%s] %s: %s' % (record['status'], job['job_id'], ', '.join(record['outputs']) or record.get('error'))
+                print_log(settings, lmsg)
+
+    threads = [threading.Thread(target=worker) for idx in range(max(1, min(workers, len(jobs))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(1.0)
+
+    manifest.close()
+    wcs_client.clear_shared_caches()
+
+    lmsg = 'Batch - RUNTIME in sec: ', time.time() - startTime, '  jobs: ', len(jobs), '  failed: ', failed[0], \
+           '  manifest: ', manifest_file
+    print_log(settings, lmsg)
+
+    return failed[0]
@@ -51,7 +51,7 @@ import tempfile
 import shutil
 from osgeo import gdal
 
-from util import  handle_error, set_logging, print_log, parse_xml
+from util import  handle_error, set_logging, print_log, parse_xml, run_async, move_file
 
 
     # check for OS Platform and set the Directory-Separator to be used
@@ -73,9 +73,6 @@ xml_bbox_tag = ['ows:LowerCorner', 'ows:UpperCorner']
 global wcs
 wcs = wcs_client.wcsClient()
 
-# indicator that:  output_format  and/or  output_datatype   has been set at the cmd-line
-# and a conversion of the results is needed
-change_output = False
 
 
 # ----------
@@ -125,6 +122,13 @@ def usage():
     print "   -y|--output_datatype      --  the datatype of the desired output [default = same as input];  Valids are:  Byte/Int16/ "
     print "                                 UInt16/UInt32/Int32/Float32/Float64/CInt16/CInt32/CFloat32/CFloat64 "
     print "   -e|--extract  <SUB|FULL>  --  work on an extracted subset (AOI) or use datsets as full files [default=SUB]"
+    print "   --record <archive_dir>    --  record all WCS requests, their responses and timings in the archive_dir"
+    print "   --replay <archive_dir>    --  replay the WCS responses from the archive_dir (no network access needed)"
+    print "   --jobs <jobs_file>        --  batch mode: run all requests of the jobs_file (JSON lines with the parameters above"
+    print "                                 e.g. {\"dataset\": ..., \"aoi\": ..., \"toi\": ..., \"output_dir\": ...}) concurrently,"
+    print "                                 sharing the listings and downloads - see: cloudless_jobs.py"
+    print "   --daemon                  --  daemon mode: keep running and process the requests submitted via the local"
+    print "                                 HTTP job API ([daemon] host:port) - see: cloudless_daemon.py"
     print " "
     print " "
     print "Example: ./create_cloudless.py -d landsat5_2a -a 3.5,3.6,43.3,43.4 -t 20110513 -s T -b 3,2,1 -p 90 -o ./out "
@@ -163,6 +167,16 @@ def check_toiinput(settings, period_in):
         sys.exit()
 
     
+#/************************************************************************/
+#/*                          get_aoi_area()                              */
+#/************************************************************************/
+def get_aoi_area(aoi_in):
+    """
+        the area of the AOI (minx, maxx, miny, maxy) in square degrees
+    """
+    return (float(aoi_in[1])-float(aoi_in[0])) * (float(aoi_in[3])-float(aoi_in[2]))
+
+
 #/************************************************************************/
 #/*                         check_aoiinput()                             */
 #/************************************************************************/
@@ -172,13 +186,24 @@ def check_aoiinput(settings, aoi_in):
         the def_maxaoi represents one-side of a square (in degree) 
     """
     def_aoi = float(settings['general.def_maxaoi'])**2
-    aoi = (float(aoi_in[1])-float(aoi_in[0])) * (float(aoi_in[3])-float(aoi_in[2]))
+    aoi = get_aoi_area(aoi_in)
     #print aoi,  '-- ', def_aoi
     if aoi > def_aoi:
         print '[Error] -- The chosen AOI is larger then the configured "def_maxaoi" of:  ', settings['general.def_maxaoi'], '*', settings['general.def_maxaoi'], ' degrees.'
         sys.exit()
 
 
+#/************************************************************************/
+#/*                              is_http_cog()                           */
+#/************************************************************************/
+def is_http_cog(service):
+    """
+        tests if a dataset location is a GeoTiff archive on a plain http server
+        (i.e. http(s)://.../<filename_pattern>.tif) and not a WCS service
+    """
+    return service.startswith('http') and service.lower().endswith(('.tif', '.tiff'))
+
+
 #/************************************************************************/
 #/*                               dss_info()                              */
 #/************************************************************************/
@@ -191,17 +216,28 @@ def dss_info(settings):
     serv_list = []
         # just grab the server info - strip off the rest
     for vv in settings.itervalues():
-        if vv.__class__ is str and  vv.startswith('http'):
-            ss = vv.split('?')
-            serv_list.append(ss[0]+'?')
+        if vv.__class__ is str and  vv.startswith('http') and not is_http_cog(vv):
+                # datasets may list several mirror urls
+            for service in wcs_client.split_mirrors(vv):
+                ss = service.split('?')
+                serv_list.append(ss[0]+'?')
 
         # get the uniqu server listing
     serv_list = sorted(set(serv_list))
 
-        # call each server and ask for a GetCapabilities-DatasetSeriesSummary
-    for target_server in serv_list:
-#        result_list = list_available_dss(target_server, True)
-        list_available_dss(target_server, True)
+        # call all servers concurrently and ask for a GetCapabilities-DatasetSeriesSummary,
+        # servers not answering within the deadline are skipped
+    deadline = time.time() + float(settings.get('wcs_requests.info_deadline', 30))
+    calls = [run_async(list_available_dss, target_server, False) for target_server in serv_list]
+
+        # print the results in the (stable) order of the servers
+    for target_server, call in zip(serv_list, calls):
+        call.join(max(0, deadline - time.time()))
+        if call.isAlive():
+            print 'Server not responding within the deadline (', settings.get('wcs_requests.info_deadline', 30), 'sec):', target_server, ' -- Skipping...'
+        else:
+            for line in call.result():
+                print line
         print '-----------'
 
     sys.exit()
@@ -234,57 +270,64 @@ def list_available_dss(target_server, printit):
         
     else:
         err_msg = 'Server not responding -- Skipping...'
-        print err_msg
-        return
+        if printit is True:
+            print err_msg
+        return [err_msg]
 
 
+        # the available DatasetSeriesIds and their Coverage time-ranges
+    lines = ["The following DatasetSeries [Name: From-To / LL-UR BBox] are available from: \t" + request['server_url']]
+    for i in range(len(dss_ids)):
+        lines.append(" -  %s : \n \t \t \t %s  -  %s \n \t \t \t %s  -  %s" % (dss_ids[i], dss_date1[i], dss_date2[i], dss_ll[i], dss_ur[i]))
+
     if printit is True:
-            # prints the available DatasetSeriesIds and theri Coverage time-ranges to the screen
-        print "The following DatasetSeries [Name: From-To / LL-UR BBox] are available from: \t", request['server_url']
-        for i in range(len(dss_ids)):
-            #print " - ", dss_ids[i] , ": \t", dss_date1[i], " - ", dss_date2[i], '\n \t \t \t',  dss_ll[i], " - ", dss_ur[i]
-            print " - ", dss_ids[i] , ': \n \t \t \t', dss_date1[i], " - ", dss_date2[i], '\n \t \t \t',  dss_ll[i], " - ", dss_ur[i]
+            # prints the available DatasetSeriesIds and their Coverage time-ranges to the screen
+        for line in lines:
+            print line
+
+    return lines
     
 
 #/************************************************************************/
 #/*                              do_cleanup()                            */
 #/************************************************************************/
-def do_cleanup_tmp(temp_storage, cf_result, input_params, settings):
+def do_cleanup_tmp(temp_storage, out_storage, cf_result, input_params, settings):
     """
-        clean up the temporary storagespace  used during download and processing
+        publish the results - created in their staging directory within the output_dir
+        (out_storage), they are renamed into the output_dir once complete - and clean up
+        the temporary storagespace  used during download and processing
     """
+    if type(cf_result) is unicode or type(cf_result) is str:
+        cf_result = [cf_result]
+    for elem in cf_result:
+        if os.path.exists(out_storage+os.path.basename(elem)):
+            move_file(out_storage+os.path.basename(elem), input_params['output_dir'])
+    shutil.rmtree(out_storage, ignore_errors=True)
+
+    if not os.path.exists(input_params['output_dir']+os.path.basename(cf_result[0])):
+        lmsg = '[Error] -- The generated Cloudfree output-file could not be written to: ', input_params['output_dir']+os.path.basename(cf_result[0])
+        print_log(settings, lmsg)
+        sys.exit(7) 
+
+    lmsg = '[Info] -- The Cloudfree dataset has been generated and is available at: '
+    print_log(settings, lmsg)
+    for elem in cf_result:
+        if os.path.exists(input_params['output_dir']+os.path.basename(elem)):
+            lmsg =  input_params['output_dir']+os.path.basename(elem)
+            print_log(settings, lmsg)
+
     if input_params['keep_temporary'] is False:
         lmsg = 'Cleaning up temporary space...'
         print_log(settings, lmsg)
-        if type(cf_result) is list:
-            for elem in cf_result:
-                elem = os.path.basename(elem)
-                shutil.copy2(temp_storage+dsep+elem, input_params['output_dir'])
-    
-        elif type(cf_result) is unicode or type(cf_result) is str:
-            shutil.copy2(temp_storage+dsep+elem, input_params['output_dir'])
-    
-    
-        if os.path.exists(input_params['output_dir']+os.path.basename(cf_result[0])):
-            lmsg = '[Info] -- The Cloudfree dataset has been generated and is available at: '
-            print_log(settings, lmsg)
-            for elem in cf_result:
-                if os.path.exists(input_params['output_dir']+os.path.basename(elem)):
-                    lmsg =  input_params['output_dir']+os.path.basename(elem)
-                    print_log(settings, lmsg)
-    
-              # remove all the temporay storage area
-            shutil.rmtree(temp_storage, ignore_errors=True)        
-        else:
-            lmsg = '[Error] -- The generated Cloudfree output-file could not be written to: ', input_params['output_dir']+os.path.basename(cf_result)
-            print_log(settings, lmsg)
-            sys.exit(7) 
+          # remove all the temporay storage area
+        shutil.rmtree(temp_storage, ignore_errors=True)        
+        wcs_client.clear_memory_files(temp_storage)
 
     else:
         lmsg = temp_storage[:-1]
         print_log(settings, lmsg)
         out_location = input_params['output_dir']+os.path.basename(temp_storage[:-1])
-        lmsg = '[Info] -- The Cloudfree dataset and the input files are available at: ', out_location
+        lmsg = '[Info] -- The input files are available at: ', out_location
         print_log(settings, lmsg)
         
         shutil.move(temp_storage, input_params['output_dir'])
@@ -294,7 +337,7 @@ def do_cleanup_tmp(temp_storage, cf_result, input_params, settings):
 #/************************************************************************/
 #/*                           do_print_flist()                           */
 #/************************************************************************/
-def do_print_flist(name, a_list):
+def do_print_flist(name, a_list, settings):
     """
         prints a listing of the supplied filenames (eg. BaseImage, GapFillingProducts, 
         and their respective Cloud-Mask filenames which are available/used)
@@ -306,6 +349,23 @@ def do_print_flist(name, a_list):
         f_cnt += 1
 
 
+#/************************************************************************/
+#/*                         set_default_params()                         */
+#/************************************************************************/
+def set_default_params(input_params, settings):
+    """
+        set the default values (from the configuration) of the optional parameters
+        which have not been supplied
+    """
+    if input_params['bands'] is None:    input_params['bands'] = settings['general.def_bands']
+    if input_params['period'] is None:    input_params['period'] = int(settings['general.def_period'])
+    if input_params['scenario'] is None:    input_params['scenario'] = str.upper(settings['general.def_scenario'])
+    if input_params['output_crs'] is None:    input_params['output_crs'] = settings['general.def_output_crs']
+    if input_params['output_datatype'] is None:    input_params['output_datatype'] = str.lower(settings['general.def_output_datatype'])
+    if input_params['output_format'] is None:    input_params['output_format'] = str.upper(settings['general.def_output_format'])
+    if input_params['extract'] is None:    input_params['extract'] = str.upper(settings['general.def_extract'])
+
+
 #/************************************************************************/
 #/*                              get_cmdline()                           */
 #/************************************************************************/
@@ -316,11 +376,10 @@ def get_cmdline():
                     'in_extract':, 'in_period':, 'in_output_crs':, 'in_bands':, 'in_output_datatype':, 'in_output_dir':,
                     'output_format': ]
     """
-    global change_output
     try:
         opts, args = getopt.getopt(sys.argv[1:], "hika:d:t:s:e:p:c:b:y:o:f:", ["help", "info", "aoi",
                     "time", "dataset", "scenario", "extract", "period", "crs", "bands", "datatype",
-                    "output_dir", "output_format", "keep_temporary", "help_formats"])
+                    "output_dir", "output_format", "keep_temporary", "help_formats", "record=", "replay=", "jobs=", "daemon"])
     except getopt.GetoptError, err:
             # print help information and exit - will print something like "option -x not recognized"
         print '[Error] -- ', now(), str(err)
@@ -411,30 +470,35 @@ def get_cmdline():
 
         elif opt in ("-y","--datatype"):
             input_params['output_datatype'] = str.lower(arg)
-            change_output = True
 
         elif opt in ("-f", "--output_format"):
-            input_params['output_format'] = str.lower(arg)
-            change_output = True
             input_params['output_format'] = str.upper(arg)
-            change_output = True
             
         elif opt in ("-k","--keep_temporary"):
             input_params['keep_temporary'] = True
 
+        elif opt in ("--record", "--replay"):
+            replay_timing = settings.get('wcs_requests.replay_timing', 'no').lower() in ('yes', 'true', '1')
+            wcs_client.set_traffic_mode(opt[2:], arg, replay_timing)
+
+        elif opt == "--jobs":
+            input_params['jobs'] = arg
+
+        elif opt == "--daemon":
+            input_params['daemon'] = True
+
         else:
             print '[Error] -- ', now(), ' unknown option(s): ', opts
 
 
 
+        # batch mode - the requests are read from the jobs-file (see: cloudless_jobs)
+        # daemon mode - the requests are submitted via the job API (see: cloudless_daemon)
+    if input_params.has_key('jobs') or input_params.has_key('daemon'):
+        return input_params
+
         # set the default values if optional parameters have not been supplied at the cmd-line
-    if input_params['bands'] is None:    input_params['bands'] = settings['general.def_bands']
-    if input_params['period'] is None:    input_params['period'] = int(settings['general.def_period'])
-    if input_params['scenario'] is None:    input_params['scenario'] = str.upper(settings['general.def_scenario'])
-    if input_params['output_crs'] is None:    input_params['output_crs'] = settings['general.def_output_crs']
-    if input_params['output_datatype'] is None:    input_params['output_datatype'] = str.lower(settings['general.def_output_datatype'])
-    if input_params['output_format'] is None:    input_params['output_format'] = str.upper(settings['general.def_output_format'])
-    if input_params['extract'] is None:    input_params['extract'] = str.upper(settings['general.def_extract'])
+    set_default_params(input_params, settings)
 
         # check that all required parameters are supplied
     if input_params['dataset'] is None: 
@@ -461,74 +525,17 @@ def get_cmdline():
     return input_params
 
 #/************************************************************************/
-#/*                           cnv_output()                               */
-#/************************************************************************/
-def cnv_output(cf_result, input_params, settings):
-    """
-        convert the resulting CF_image and CF_Mask accoring to the user requested
-        output_crs, output_format, output_datatype 
-        
-    """
-    # @@
-    supported_ext =  {'VRT': '.vrt', 'GTIFF': '.tif', 'NITF': '.nitf', 'HFA': '.img', 'ELAS': '.ELAS', 'AAIGRID': '.grd', 'DTED': '.DTED', 'PNG': '.png', 'JPEG': '.jpg', 'MEM': '.mem', 'GIF': '.gif', 'XPM': '.xpm', 'BMP': '.bmp', 'PCIDSK': '.PCIDSK', 'PCRASTER': '.PCRaster', 'ILWIS': '.ilw', 'SGI': '.sgi', 'SRTMHGT': '.SRTMHGT', 'LEVELLER': '.Leveller', 'TERRAGEN': '.Terragen', 'GMT': '.gmt', 'NETCDF': '.nc', 'HDF4IMAGE': '.hdf', 'ISIS2': '.ISIS2', 'ERS': '.ers', 'FIT': '.fit', 'JPEG2000': '.jp2', 'RMF': '.rmf', 'WMS ':'.WMS', 'RST': '.rst', 'INGR': '.INGR', 'GSAG': '.grd', 'GSBG': '.grd', 'GS7BG': '.grd', 'R': '.r', 'PNM':  '.pnm', 'ENVI': '.img', 'EHDR': '.hdr', 'PAUX': '.aux', 'MFF':  '.mff', 'MFF2': '.mff2', 'BT':   '.bt', 'LAN': '.lan', 'IDA': '.ida', 'LCP': '.lcp', 'GTX': '.GTX', 'NTV2': '.NTv2', 'CTABLE2': '.CTable2', 'KRO': '.KRO', 'ARG': '.ARG', 'USGSDEM': '.USGDEM', 'ADRG': '.img', 'BLX': '.blx', 'RASTERLITE': '.Rasterlite', 'EPSILON': '.Epsilon', 'POSTGISRASTER': '.PostGISRaster', 'SAGA': '.sdat', 'KMLSUPEROVERLAY': '.kmlovl', 'XYZ': '.xyz', 'HF2': '.HF2', 'PDF': '.pdf', 'WEBP': '.webp', 'ZMAP': '.ZMap'}
-
-
-    if supported_ext.has_key(input_params['output_format']):  
-        out_ext = supported_ext.get(input_params['output_format'])
-
-    lmsg = 'Converting -- CF_image and CF_mask to:   ' + input_params['output_format'] + '  [ *' + out_ext + ']'
-    print_log(settings, lmsg)
-    
-    if input_params['output_format'] == 'GTIFF':
-        tr_params1 = ""
-    else: tr_params1 = " -of " + str(input_params['output_format'])
-    
-         
-    if input_params['output_datatype'] == 'input': 
-        tr_params2 = ""
-    else: tr_params2 = " -ot " + str(input_params['output_datatype'])
-    
-    tr_params = tr_params1 + tr_params2
-
-    #print  tr_params + " " + input_params['output_dir'] + cf_result[0] + " " + input_params['output_dir'] + cf_result[0][:-4]+out_ext
-
-
-
-    res = os.system("gdal_translate -q" + tr_params + " " + input_params['output_dir'] + cf_result[0] + " " + input_params['output_dir'] + cf_result[0][:-4]+out_ext )
-    if res is 0: 
-        os.remove(input_params['output_dir'] + cf_result[0])
-    else:
-        err_msg = '[Error] - CF_image could not be converted'
-        handle_error(err_msg, res, settings)
-    res = os.system("gdal_translate -q" + tr_params + " " + input_params['output_dir'] + cf_result[1] + " " + input_params['output_dir'] + cf_result[1][:-4]+out_ext )
-    if res is 0: 
-        os.remove(input_params['output_dir'] + cf_result[1])
-    else:
-        err_msg = '[Error] - CF_mask could not be converted'
-        handle_error(err_msg, res, settings)
-
-
-#/************************************************************************/
-#/*                               main()                                 */
+#/*                           process_request()                          */
 #/************************************************************************/
 
-def main():
+def process_request(input_params, settings):
     """
-        Main function: 
-            calls the subfunction according to user input
+        processes a single request (dataset, AOI, TOI, ...):  listing, download and
+        processing - the results are created in a staging directory within the
+        output_dir and renamed into it when complete
+        Returns:  the list of the generated files (names)
     """
-        # read in the default settings from the configuration file
-    global settings
-    settings = get_config(default_config_file)
-    
-        # set the logging output i.e. to a File or the screen
-    set_logging(settings)
-
-
-        # get all parameters provided via cmd-line
-    global input_params
-    input_params = get_cmdline()
-    
+    startTime1 = time.time()
 
         # now that we know what dataset we need and where to find them, select the
         # correct reader for the requested dataset
@@ -543,69 +550,136 @@ def main():
 
         # call the reader module for the resepective dataset and process the data
     import dataset_reader
+        # datasets without a dedicated reader, published as GeoTiffs on a plain http server
+    if not hasattr(dataset_reader, reader) and is_http_cog(settings['dataset.'+input_params['dataset']]):
+        reader = 'CF_http_cog_Reader'
     attribute = getattr(dataset_reader, reader)
     f_read = attribute()
 
     #print 'READER: ', f_read       #@@
     
-        # gets a listing of available DatasetSeries and their corresponding time-range
-    base_flist, base_mask_flist, gfp_flist, gfpmask_flist = f_read.get_filelist(input_params, settings)
-
-# @@@@
-        ## processing-limits (max. filenumber to be used) here # @@@
-    if gfp_flist.__len__() > int(settings['general.def_maxfiles']):
-        err_msg = '[Error] -- ', now(), ' the number of GFP products availabel (=', str(gfp_flist.__len__()).strip(),') for the selected time period is larger then the configured "def_maxfiles" of: ', settings['general.def_maxfiles'], '\n', 'Please select a shorter time-period.'
-        err_code = 4
-        handle_error(err_msg, err_code, settings)
-        
-
-        # print the available input datasets:  eg. during testing 
-    do_print_flist('BASE', base_flist)
-    do_print_flist('BASE_Mask', base_mask_flist)
-    do_print_flist('GFP', gfp_flist)
-    do_print_flist('GFP_Mask', gfpmask_flist)
-
-
-    lmsg = 'Dataset_listing - RUNTIME in sec: ',  time.time() - startTime1
-    print_log(settings, lmsg)
         # create a temporarylocation under the provided settings['general.def_temp_dir'] to be used
-        # for the temporary storage during processing
+        # for the temporary storage during processing - the readers may already start downloading
+        # the base files (to the temp_storage) during the listing
     temp_storage = tempfile.mkdtemp(prefix='cloudfree_',dir=settings['general.def_temp_dir'])
     if temp_storage[-1] != dsep:
         temp_storage = temp_storage+dsep
+    f_read.prefetch_dir = temp_storage
 
+        # the results are created within the output_dir (same filesystem), under a staging name
+    if not os.path.isdir(input_params['output_dir']):
+        os.makedirs(input_params['output_dir'])
+    out_storage = tempfile.mkdtemp(prefix='.cloudfree_', suffix='.staging', dir=input_params['output_dir'])+dsep
 
-    if len(base_flist) >= 1:
-        f_read.base_getcover(base_flist, input_params, settings, temp_storage, mask=False)
+    try:
+            # gets a listing of available DatasetSeries and their corresponding time-range
+        try:
+            base_flist, base_mask_flist, gfp_flist, gfpmask_flist = f_read.get_filelist(input_params, settings)
+        except SystemExit:
+            shutil.rmtree(temp_storage, ignore_errors=True)
+            wcs_client.clear_memory_files(temp_storage)
+            raise
+
+    # @@@@
+            ## processing-limits (max. filenumber to be used) here # @@@
+        if gfp_flist.__len__() > int(settings['general.def_maxfiles']):
+            err_msg = '[Error] -- ', now(), ' the number of GFP products availabel (=', str(gfp_flist.__len__()).strip(),') for the selected time period is larger then the configured "def_maxfiles" of: ', settings['general.def_maxfiles'], '\n', 'Please select a shorter time-period.'
+            err_code = 4
+            f_read.discard_prefetch()
+            shutil.rmtree(temp_storage, ignore_errors=True)
+            wcs_client.clear_memory_files(temp_storage)
+            handle_error(err_msg, err_code, settings)
+        
 
-    if len(base_mask_flist) >= 1:
-        f_read.base_getcover(base_mask_flist, input_params, settings, temp_storage, mask=True)
+            # print the available input datasets:  eg. during testing 
+        do_print_flist('BASE', base_flist, settings)
+        do_print_flist('BASE_Mask', base_mask_flist, settings)
+        do_print_flist('GFP', gfp_flist, settings)
+        do_print_flist('GFP_Mask', gfpmask_flist, settings)
 
-    lmsg = 'BASE dataset_download - RUNTIME in sec: ',  time.time() - startTime1 #, '\n'
-    print_log(settings, lmsg)
 
+        lmsg = 'Dataset_listing - RUNTIME in sec: ',  time.time() - startTime1
+        print_log(settings, lmsg)
+        if len(base_flist) >= 1:
+            if f_read.prefetched is not None:
+                    # already downloading since the listing - wait for it
+                f_read.prefetched.result()
+            else:
+                f_read.base_getcover(base_flist, input_params, settings, temp_storage, mask=False)
 
-        # call the Processor module for the resepective dataset and process the data
-    import dataset_processor
-    cfprocessor = 'CF_' + input_params['dataset'] + '_Processor'
-    attribute = getattr(dataset_processor, cfprocessor)
-    f_proc = attribute()
+        if len(base_mask_flist) >= 1:
+            f_read.base_getcover(base_mask_flist, input_params, settings, temp_storage, mask=True)
 
-   #print 'PROCESSOR: ', f_proc        #@@
+        lmsg = 'BASE dataset_download - RUNTIME in sec: ',  time.time() - startTime1 #, '\n'
+        print_log(settings, lmsg)
+
+
+            # call the Processor module for the resepective dataset and process the data
+        import dataset_processor
+        cfprocessor = 'CF_' + input_params['dataset'] + '_Processor'
+        if not hasattr(dataset_processor, cfprocessor) and reader == 'CF_http_cog_Reader':
+            cfprocessor = 'CFProcessor'
+        attribute = getattr(dataset_processor, cfprocessor)
+        f_proc = attribute()
+
+       #print 'PROCESSOR: ', f_proc        #@@
                 
-    cf_result = f_proc.process_clouds_1(base_flist, base_mask_flist, gfp_flist, gfpmask_flist, input_params, settings, temp_storage, f_read)
+        cf_result = f_proc.process_clouds_1(base_flist, base_mask_flist, gfp_flist, gfpmask_flist, input_params, settings, temp_storage, f_read, out_storage)
 
 
-        # copy results to output location and clean-up the temporary storage area
-    do_cleanup_tmp(temp_storage, cf_result, input_params, settings)
+            # publish the results in the output location and clean-up the temporary storage area
+        do_cleanup_tmp(temp_storage, out_storage, cf_result, input_params, settings)
+    finally:
+            # the windows (in-memory VRTs) created by the reader, incomplete results
+        f_read.close()
+        shutil.rmtree(out_storage, ignore_errors=True)
 
-        # if   output_format  and/or  output_datatype  has been set by the user -> translate resulting image(s)
-        # using gdal_translate 
-    if change_output is True:
-        cnv_output(cf_result, input_params, settings)
+    return cf_result
 
 
 
+#/************************************************************************/
+#/*                               main()                                 */
+#/************************************************************************/
+
+def main():
+    """
+        Main function: 
+            calls the subfunction according to user input
+    """
+        # read in the default settings from the configuration file
+    global settings
+    settings = get_config(default_config_file)
+    
+        # set the logging output i.e. to a File or the screen
+    set_logging(settings)
+
+        # provide the settings (e.g. the per-server limits) to the wcsClient
+    wcs_client.configure(settings)
+
+
+        # get all parameters provided via cmd-line
+    global input_params
+    input_params = get_cmdline()
+
+        # daemon mode:  process the requests submitted via the job API
+    if input_params.has_key('daemon'):
+        import cloudless_daemon
+        cloudless_daemon.serve(settings)
+        return
+
+        # batch mode:  run all requests of the jobs-file
+    if input_params.has_key('jobs'):
+        import cloudless_jobs
+        failed = cloudless_jobs.run_jobs(input_params['jobs'], settings)
+        settings['logging.log_fsock'].close()
+        if failed > 0:
+            sys.exit(1)
+        return
+
+    process_request(input_params, settings)
+
+
 # ----------
 # for performance testing
     msg = 'Full Processing Runtime in sec: ',  time.time() - startTime1, '\n' 
@@ -616,8 +690,6 @@ def main():
 
 
 
-
-
 #/************************************************************************/
 #/*                            main()                                    */
 #/************************************************************************/
@@ -50,13 +50,16 @@ from osgeo.gdalconst import *     # this allows leaving of gdal eg. at GA_ReadOn
 from osgeo.gdalnumeric import *
 import numpy as np
 
-from util import handle_error, print_log
+from util import handle_error, print_log, supported_ext, run_async
 
 gdal.UseExceptions()
 
 global dsep
 dsep = os.sep
 
+    # the (tiled) GeoTiff a COG product is written to first, next to the product (see: create_output)
+cog_source_ext = '.cog_src.tif'
+
 
 
 
@@ -105,6 +108,346 @@ def getNumpyDataType(gdtype):
 #/************************************************************************/
 
 
+#/************************************************************************/
+
+def get_mask_profile(settings):
+    """
+        the output settings of the composite mask and its GFP table from the configuration
+    """
+    if settings is None:
+        settings = {}
+
+    return {'compact': str.lower(settings.get('general.def_mask_compact', 'yes')) in ('yes', 'true', '1'),
+            'table_txt': str.lower(settings.get('general.def_mask_table_txt', 'yes')) in ('yes', 'true', '1') }
+
+#/************************************************************************/
+
+def set_gfp_table(out_ds, gfp_table):
+    """
+        embeds the GFP table (ID used in the composite mask -> GFP filename) as
+        metadata items GFP_<ID> of the dataset
+    """
+    gfp_md = {'GFP_COUNT': str(len(gfp_table))}
+    for gfp_id, gfp_name in gfp_table:
+        gfp_md['GFP_'+str(gfp_id)] = os.path.basename(gfp_name)
+    out_ds.SetMetadata(gfp_md)
+
+#/************************************************************************/
+
+def write_gfp_table_txt(filename, gfp_table):
+    """
+        writes the GFP table as txt-file ( <ID>;<GFP filename> per line )
+    """
+    out_txt = open(filename, "w")
+    for gfp_id, gfp_name in gfp_table:
+        out_txt.write(str(gfp_id)+';'+os.path.basename(gfp_name)+'\n')
+    out_txt.close()
+
+#/************************************************************************/
+
+def write_composite_mask(filename, mask_img, gfp_table, geotransform, projection, input_params, settings=None):
+    """
+        writes the composite mask (8-Bit) with the embedded GFP table in a single write
+         - compact GeoTiff: tiled, compressed, tiles without any replaced pixel are
+           not written at all (SPARSE_OK)
+         - otherwise: like the cloud-free product (see: create_output)
+    """
+    ysize, xsize = mask_img.shape
+    profile = get_output_profile(settings)
+    if get_mask_profile(settings)['compact'] and input_params.get('output_format', 'GTIFF') == 'GTIFF':
+        compress = profile['compress']
+        if compress == 'NONE':
+            compress = 'DEFLATE'
+        blocksize = profile['blocksize']
+        options = ['TILED=YES', 'BLOCKXSIZE='+str(blocksize), 'BLOCKYSIZE='+str(blocksize),
+                   'COMPRESS='+compress, 'SPARSE_OK=TRUE', 'NUM_THREADS='+str(profile['threads'])]
+        out_ds = gdal.GetDriverByName('GTiff').Create(filename, xsize, ysize, 1, GDT_Byte, options)
+        out_ds.SetGeoTransform(geotransform)
+        out_ds.SetProjection(projection)
+        set_gfp_table(out_ds, gfp_table)
+        out_band = out_ds.GetRasterBand(1)
+        for yoff in range(0, ysize, blocksize):
+            for xoff in range(0, xsize, blocksize):
+                block = mask_img[yoff:yoff+blocksize, xoff:xoff+blocksize]
+                if block.any():
+                    out_band.WriteArray(block, xoff, yoff)
+        out_ds = None
+        return
+
+    mask_params = dict(input_params, output_datatype='input')
+    out_ds = create_output(filename, xsize, ysize, 1, GDT_Byte, mask_params, settings)
+    out_ds.SetGeoTransform(geotransform)
+    out_ds.SetProjection(projection)
+    set_gfp_table(out_ds, gfp_table)
+    out_ds.GetRasterBand(1).WriteArray(mask_img, 0, 0)
+    finish_output(out_ds, mask_params, settings)
+    out_ds = None
+
+#/************************************************************************/
+#/*                         get_memmap_bands()                           */
+#/************************************************************************/
+def get_memmap_bands(infile, inImg=None):
+    """
+        provide the bands of an uncompressed (striped) GeoTiff or ENVI raster as read-only
+        numpy.memmap views - no data is copied, the OS page cache does the work
+        returns a list of 2D arrays (one per band)  or  None if the layout is not supported
+    """
+    if inImg is None:
+        inImg = gdal.Open(infile, GA_ReadOnly)
+    if inImg is None or not os.path.isfile(infile) or inImg.RasterCount == 0:
+        return None
+
+    xsize = inImg.RasterXSize
+    ysize = inImg.RasterYSize
+    nbands = inImg.RasterCount
+    band = inImg.GetRasterBand(1)
+    try:
+        ndtype = np.dtype(getNumpyDataType(band.DataType))
+    except ValueError:
+        return None
+    if band.GetMetadataItem('NBITS', 'IMAGE_STRUCTURE') is not None:
+        return None
+
+    try:
+        if inImg.GetDriver().ShortName == 'GTiff':
+            layout = get_tiff_layout(infile, inImg, ndtype)
+        elif inImg.GetDriver().ShortName == 'ENVI':
+            layout = get_envi_layout(infile, inImg)
+        else:
+            return None
+        if layout is None:
+            return None
+
+        offsets, interleave, byteorder = layout
+        ndtype = ndtype.newbyteorder(byteorder)
+        if interleave == 'BAND':
+            return [np.memmap(infile, dtype=ndtype, mode='r', offset=offsets[i], shape=(ysize, xsize))
+                    for i in range(nbands)]
+        elif interleave == 'LINE':
+            mm = np.memmap(infile, dtype=ndtype, mode='r', offset=offsets[0], shape=(ysize, nbands, xsize))
+            return [mm[:, i, :] for i in range(nbands)]
+        elif interleave == 'PIXEL':
+            mm = np.memmap(infile, dtype=ndtype, mode='r', offset=offsets[0], shape=(ysize, xsize, nbands))
+            return [mm[:, :, i] for i in range(nbands)]
+    except (ValueError, IOError, OSError):
+            # e.g. a truncated file - use the regular GDAL reading
+        return None
+
+    return None
+
+#/************************************************************************/
+
+def get_tiff_layout(infile, inImg, ndtype):
+    """
+        offsets of the bands, interleave and byteorder of an uncompressed, striped GeoTiff,
+        whose strips are stored contiguously  -  None otherwise
+    """
+    if inImg.GetMetadataItem('COMPRESSION', 'IMAGE_STRUCTURE') not in (None, 'NONE'):
+        return None
+    interleave = inImg.GetMetadataItem('INTERLEAVE', 'IMAGE_STRUCTURE') or 'PIXEL'
+    if inImg.RasterCount == 1:
+        interleave = 'BAND'
+
+    xsize = inImg.RasterXSize
+    ysize = inImg.RasterYSize
+    blockx, blocky = inImg.GetRasterBand(1).GetBlockSize()
+    if blockx != xsize:
+        return None         # tiled
+    if interleave == 'PIXEL':
+        strip_bytes = blocky * xsize * ndtype.itemsize * inImg.RasterCount
+        check_bands = [1]
+    else:
+        strip_bytes = blocky * xsize * ndtype.itemsize
+        check_bands = range(1, inImg.RasterCount+1)
+
+    offsets = []
+    for i in check_bands:
+        band = inImg.GetRasterBand(i)
+        offset = band.GetMetadataItem('BLOCK_OFFSET_0_0', 'TIFF')
+        if offset is None:
+            return None
+        offset = int(offset)
+        for yblock in range(1, (ysize + blocky - 1) / blocky):
+            if band.GetMetadataItem('BLOCK_OFFSET_0_%d' % yblock, 'TIFF') != str(offset + yblock*strip_bytes):
+                return None
+        offsets.append(offset)
+
+    fp = open(infile, 'rb')
+    byteorder = fp.read(2)
+    fp.close()
+    if byteorder == 'II':
+        return offsets, interleave, '<'
+    elif byteorder == 'MM':
+        return offsets, interleave, '>'
+
+    return None
+
+#/************************************************************************/
+
+def get_envi_layout(infile, inImg):
+    """
+        offsets of the bands, interleave and byteorder of an ENVI raster (from its .hdr)
+    """
+    hdrfile = None
+    for elem in (os.path.splitext(infile)[0]+'.hdr', infile+'.hdr'):
+        if os.path.isfile(elem):
+            hdrfile = elem
+    if hdrfile is None:
+        return None
+
+    header = {}
+    for line in open(hdrfile):
+        if '=' in line:
+            key, value = line.split('=', 1)
+            header[key.strip().lower()] = value.strip()
+
+    offset = int(header.get('header offset', '0'))
+    interleave = {'bsq': 'BAND', 'bil': 'LINE', 'bip': 'PIXEL'}.get(header.get('interleave', 'bsq').lower())
+    if interleave is None:
+        return None
+    band_bytes = inImg.RasterXSize * inImg.RasterYSize * gdal.GetDataTypeSize(inImg.GetRasterBand(1).DataType) / 8
+    offsets = [offset + i*band_bytes for i in range(inImg.RasterCount)]
+
+    if header.get('byte order', '0') == '1':
+        return offsets, interleave, '>'
+
+    return offsets, interleave, '<'
+
+#/************************************************************************/
+
+def load_file(infile):
+    """
+        load a single band raster as numpy array - a read-only memmap view for uncompressed
+        GeoTiff/ENVI files, otherwise a copy read by gdal_array.LoadFile
+    """
+    bands = get_memmap_bands(infile)
+    if bands is not None and len(bands) == 1:
+        return bands[0]
+
+    return gdal_array.LoadFile(infile)
+
+
+#/************************************************************************/
+#/*                         create_output()                              */
+#/************************************************************************/
+def get_output_name(filename, input_params):
+    """
+        the filename with the extension of the requested output format
+    """
+    out_ext = supported_ext.get(input_params.get('output_format', 'GTIFF'), '.tif')
+
+    return os.path.splitext(filename)[0] + out_ext
+
+#/************************************************************************/
+
+def get_output_profile(settings):
+    """
+        the output profile for GeoTiff products from the configuration
+    """
+    if settings is None:
+        settings = {}
+
+    return {'profile': str.lower(settings.get('general.def_output_profile', 'cog')),
+            'compress': str.upper(settings.get('general.def_output_compress', 'DEFLATE')),
+            'predictor': str.lower(settings.get('general.def_output_predictor', 'yes')) in ('yes', 'true', '1'),
+            'threads': settings.get('general.def_output_threads', 'ALL_CPUS'),
+            'blocksize': int(settings.get('general.def_output_blocksize', 512)) }
+
+#/************************************************************************/
+
+def get_creation_options(profile, gdtype, driver='GTiff'):
+    """
+        the creation options of the GeoTiff (or COG driver) output for a profile
+    """
+    options = ['COMPRESS='+profile['compress'], 'NUM_THREADS='+str(profile['threads'])]
+    if driver == 'COG':
+        options.append('BLOCKSIZE='+str(profile['blocksize']))
+        if profile['predictor'] and profile['compress'] != 'NONE':
+            options.append('PREDICTOR=YES')
+        return options
+
+    options.extend(['TILED=YES', 'BLOCKXSIZE='+str(profile['blocksize']), 'BLOCKYSIZE='+str(profile['blocksize'])])
+    if profile['predictor'] and profile['compress'] != 'NONE':
+            # floating point predictor for float data, horizontal differencing otherwise
+        if gdtype in (GDT_Float32, GDT_Float64):
+            options.append('PREDICTOR=3')
+        else:
+            options.append('PREDICTOR=2')
+
+    return options
+
+#/************************************************************************/
+
+def create_output(filename, xsize, ysize, nbands, gdtype, input_params, settings=None):
+    """
+        create the output dataset in the requested output format (-f) and datatype (-y):
+         - GeoTiff with the 'cog' profile: a tiled, uncompressed GeoTiff on disk (<filename>.cog_src.tif),
+           converted to the COG (incl. its overviews) by finish_output() - the product is never
+           held in memory a second time
+         - formats which can not be created directly (only copied e.g. PNG, JPEG) get an
+           in-memory dataset, written by finish_output()
+         - GeoTiff with the 'tiled' profile and all other formats are created directly
+        Returns:  output dataset
+    """
+    output_format = input_params.get('output_format', 'GTIFF')
+    driver = gdal.GetDriverByName(output_format)
+    if driver is None:
+        raise ValueError("Unsupported output format '%s'!" % output_format)
+
+    if input_params.get('output_datatype', 'input') not in (None, 'input'):
+        gdtype = gdal.GetDataTypeByName(input_params['output_datatype'])
+        if gdtype == GDT_Unknown:
+            raise ValueError("Unsupported output datatype '%s'!" % input_params['output_datatype'])
+
+    profile = get_output_profile(settings)
+        # multithreaded overview computation (BuildOverviews)
+    gdal.SetConfigOption('GDAL_NUM_THREADS', str(profile['threads']))
+    if output_format == 'GTIFF' and profile['profile'] == 'cog':
+        options = ['TILED=YES', 'BLOCKXSIZE='+str(profile['blocksize']), 'BLOCKYSIZE='+str(profile['blocksize']),
+                   'BIGTIFF=IF_SAFER']
+        return driver.Create(filename+cog_source_ext, xsize, ysize, nbands, gdtype, options)
+
+    if output_format == 'GTIFF':
+        return driver.Create(filename, xsize, ysize, nbands, gdtype, get_creation_options(profile, gdtype))
+
+    if driver.GetMetadataItem(gdal.DCAP_CREATE) == 'YES':
+        return driver.Create(filename, xsize, ysize, nbands, gdtype)
+
+    return gdal.GetDriverByName('MEM').Create(filename, xsize, ysize, nbands, gdtype)
+
+#/************************************************************************/
+
+def finish_output(out_ds, input_params, settings=None):
+    """
+        write the output datasets (see: create_output) to their file in the requested output
+        format - COGs from their tiled GeoTiff on disk (incl. its overviews), which is removed
+        then; in-memory datasets by a copy; flush the others
+    """
+    output_format = input_params.get('output_format', 'GTIFF')
+    gdtype = out_ds.GetRasterBand(1).DataType
+    filename = out_ds.GetDescription()
+    if filename.endswith(cog_source_ext):
+        out_ds.FlushCache()
+        filename = filename[:-len(cog_source_ext)]
+        if gdal.GetDriverByName('COG') is not None:
+            copy_ds = gdal.GetDriverByName('COG').CreateCopy(filename, out_ds, 0,
+                                get_creation_options(get_output_profile(settings), gdtype, 'COG'))
+        else:
+                # the overviews are written before the full resolution tiles - the COG layout
+            copy_ds = gdal.GetDriverByName('GTiff').CreateCopy(filename, out_ds, 0,
+                                get_creation_options(get_output_profile(settings), gdtype) + ['COPY_SRC_OVERVIEWS=YES'])
+        copy_ds = None
+        os.remove(out_ds.GetDescription())
+        return
+
+    if out_ds.GetDriver().ShortName != 'MEM':
+        out_ds.FlushCache()
+        return
+
+    copy_ds = gdal.GetDriverByName(output_format).CreateCopy(filename, out_ds, 0)
+    copy_ds = None
+
+
 #/************************************************************************/
 #/*                         calc_overviews()                             */
 #/************************************************************************/
@@ -142,6 +485,50 @@ def calc_overviews(inbase_band, baseshape):
 
 
 
+#/************************************************************************/
+#/*                         decimate_array()                             */
+#/************************************************************************/
+def decimate_array(in_array, factor, ov_shape):
+    """
+        NEAREST overview level of a 2D array by strided decimation - takes the
+        pixel at the centre of each factor x factor block (clamped at the edges)
+    """
+    rows = np.minimum(np.arange(ov_shape[0]) * factor + factor // 2, in_array.shape[0] - 1)
+    cols = np.minimum(np.arange(ov_shape[1]) * factor + factor // 2, in_array.shape[1] - 1)
+
+    return in_array[rows[:, np.newaxis], cols]
+
+
+#/************************************************************************/
+#/*                         write_overviews()                            */
+#/************************************************************************/
+def write_overviews(out_ds, band_arrays, overview_sizes):
+    """
+        writes the (NEAREST) overview pyramids of the output dataset directly from the
+        in-memory band arrays - the levels are allocated without being computed and
+        decimated in parallel, so the product is never read back.
+        Only GeoTiff outputs (incl. the source of a COG) get overviews - the other drivers
+        would write external .ovr side files, which are not part of the results
+    """
+    if len(overview_sizes) == 0 or out_ds.GetDriver().ShortName != 'GTiff':
+        return
+
+    out_ds.BuildOverviews(resampling="NONE", overviewlist=overview_sizes)
+
+    ov_calls = []
+    for i in range(len(band_arrays)):
+        out_band = out_ds.GetRasterBand(i+1)
+        for k in range(out_band.GetOverviewCount()):
+            ov_band = out_band.GetOverview(k)
+            factor = int(round(float(out_ds.RasterXSize) / ov_band.XSize))
+            ov_calls.append((ov_band, run_async(decimate_array, band_arrays[i], factor,
+                                                (ov_band.YSize, ov_band.XSize))))
+
+    for ov_band, ov_call in ov_calls:
+        ov_band.WriteArray(ov_call.result(), 0, 0)
+        ov_band.FlushCache()
+
+
 #/************************************************************************/
 #/*                            CFProcessor()                                */
 #/************************************************************************/
@@ -190,9 +577,7 @@ class CFProcessor(object):
 
         inLocation = baseImg.GetGeoTransform()
 
-        inImg = gdal_array.LoadFile(infile)
-        inImg.dtype
-        inImg.shape
+        inImg = load_file(infile)
 
             # which pixels are marked as clouds & how many
         inClouds = np.array(np.where(inImg > 0))
@@ -267,9 +652,10 @@ class CFProcessor(object):
 
 
 #--------
-    def process_clouds_1(self, base_flist, base_mask_flist, gfp_flist, gfpmask_flist, input_params, settings, temp_storage, f_read):
+    def process_clouds_1(self, base_flist, base_mask_flist, gfp_flist, gfpmask_flist, input_params, settings, temp_storage, f_read, out_storage=None):
         """
             proxy function - make sure the donwloaded CoverageIDs come in with ".tif" extension
+            the products are created in the out_storage (default: the temp_storage)
         """
         wcs_ext = ('.tif')
 
@@ -285,16 +671,21 @@ class CFProcessor(object):
                           [item for item in gfpmask_flist if item.lower().endswith(wcs_ext) ]
 
 
-        cf_result = self.change_img(base_flist_e, base_mask_flist_e,  gfp_flist, gfpmask_flist, gfp_flist_e, gfpmask_flist_e, input_params, temp_storage, f_read, settings)
+        cf_result = self.change_img(base_flist_e, base_mask_flist_e,  gfp_flist, gfpmask_flist, gfp_flist_e, gfpmask_flist_e, input_params, temp_storage, f_read, settings, out_storage)
         
         return cf_result
 
 
 #---------
-    def access_ds(self, basefile, basemaskfile, temp_storage):
+    def access_ds(self, basefile, basemaskfile, temp_storage, f_read=None):
         """
             provide file access handle to RasterImg and MaskImg
+            (the readers may provide windows of the files - see: Reader.get_access_path)
         """
+        if f_read is not None:
+            basefile = f_read.get_access_path(basefile)
+            basemaskfile = f_read.get_access_path(basemaskfile)
+
             # the actual image datasets
         infile_basef = os.path.join(temp_storage, basefile)
         baseImg = self.fopen(infile_basef)
@@ -315,7 +706,7 @@ class CFProcessor(object):
 
 
 #---------
-    def change_img(self, base_flist_e, base_mask_flist_e,  gfp_flist, gfpmask_flist, gfp_flist_e, gfpmask_flist_e, input_params, temp_storage, f_read, settings):
+    def change_img(self, base_flist_e, base_mask_flist_e,  gfp_flist, gfpmask_flist, gfp_flist_e, gfpmask_flist_e, input_params, temp_storage, f_read, settings, out_storage=None):
         """
             replace clouded pixels with non-clouded pixels
             write out cloud-free product, metadata-maskfile and metadata-textfile (of used products)
@@ -328,7 +719,7 @@ class CFProcessor(object):
         startTime2 = time.time()
 
         for basefile, basemaskfile in zip(base_flist_e, base_mask_flist_e):
-            baseImg, infile_basef, basemaskImg, infile_basemaskf = self.access_ds(basefile, basemaskfile, temp_storage)
+            baseImg, infile_basef, basemaskImg, infile_basemaskf = self.access_ds(basefile, basemaskfile, temp_storage, f_read)
             baseImgDim, baseProj, baseLocation = self.read_img(baseImg, infile_basef)
             basemaskDim, basemaskProj, basemaskLocation, basemaskImg, basemaskClouds, basemaskCoord = self.read_mask(basemaskImg, infile_basemaskf, isBaseImg=True)
 
@@ -337,36 +728,33 @@ class CFProcessor(object):
             baseImgDt = getNumpyDataType(baseImgBand.DataType)
             gDType = getGdalDataType(baseImgDt)
 
-            driver = baseImg.GetDriver()
-
-                # create the cloud-free output dataset
+                # create the cloud-free output dataset - in the requested output format and datatype
             outFile = infile_basef.rsplit(dsep, 1)
-            outFile[1] = out_prefix + outFile[1]
-            if outFile[1].endswith('.tiff'):
-               outFile[1] = outFile[1].replace('.tiff','.tif')
-
-            outFile[0] = temp_storage[:-1]
-
-
+            outFile[1] = get_output_name(out_prefix + outFile[1], input_params)
+            outFile[0] = (out_storage or temp_storage)[:-1]
 
 # @@ testing intermediary -> comment out the following line  --> see also below
-            #outImg = driver.Create((outFile[0]+dsep+outFile[1]), baseImgDim[0][0], baseImgDim[1][0], baseImgDim[2][0], gDType)
-            outImg = driver.Create((outFile[0]+dsep+outFile[1]), baseImgDim[0][0], baseImgDim[1][0], baseImgDim[2][0], gDType, [ 'TILED=YES', 'COMPRESS=DEFLATE' ] )
+            outImg = create_output((outFile[0]+dsep+outFile[1]), baseImgDim[0][0], baseImgDim[1][0], baseImgDim[2][0], gDType, input_params, settings)
             
                 # metadata mask & txt-file for storing the info about used (combined) datasets
-            cur_ext = os.path.splitext(outFile[1])[1]
-            metamaskTIF = outFile[1].replace(cur_ext, out_meta_mask)
-            metamaskTXT = metamaskTIF.replace('.tif','.txt')
+            metamaskTIF = get_output_name(os.path.splitext(outFile[1])[0] + out_meta_mask, input_params)
+            metamaskTXT = os.path.splitext(metamaskTIF)[0] + '.txt'
 
-                # the metamask - will always be a 8-Bit GeoTiff
+                # the metamask - will always be 8-Bit
             metamaskImg = np.zeros((baseImgDim[1][0], baseImgDim[0][0]), uint8)
+                # the GFP table:  ID used in the metamask -> GFP filename
+            gfp_table = []
             eval_mask = np.array(basemaskImg)
             out_data = np.zeros((baseImgDim[2][0], baseImgDim[1][0], baseImgDim[0][0]), dtype=baseImgDt)
 
+            base_bands = get_memmap_bands(infile_basef, baseImg)
             for i in range(1, baseImgDim[2][0]+1,1):
-                baseBand = baseImg.GetRasterBand(i)
-                baseBand1 = baseBand.ReadAsArray(0, 0, baseImgDim[0][0], baseImgDim[1][0])
-                out_data[i-1, :, :] = baseBand1
+                if base_bands is not None:
+                    out_data[i-1, :, :] = base_bands[i-1]
+                else:
+                    baseBand = baseImg.GetRasterBand(i)
+                    baseBand1 = baseBand.ReadAsArray(0, 0, baseImgDim[0][0], baseImgDim[1][0])
+                    out_data[i-1, :, :] = baseBand1
 
             
             #for gfpfile, gfpmaskfile in zip(gfp_flist_e, gfpmask_flist_e):
@@ -381,7 +769,7 @@ class CFProcessor(object):
                 
                 lmsg = 'Using GFPMask-'+str(img_cnt)+': ', gfpmaskfile   #, type(gfpmaskfile)
                 print_log(settings, lmsg)
-                gfpImg, infile_gfpf, gfpmaskImg, infile_gfpmaskf = self.access_ds(gfpfile_e, gfpmaskfile_e, temp_storage)
+                gfpImg, infile_gfpf, gfpmaskImg, infile_gfpmaskf = self.access_ds(gfpfile_e, gfpmaskfile_e, temp_storage, f_read)
                 gfpImgDim, gfpProj, gfpLocation = self.read_img(gfpImg, infile_gfpf)
                 gfpmaskDim, gfpmaskProj, gfpmaskLocation, gfpmaskImg, gfpmaskClouds = self.read_mask(gfpmaskImg, infile_gfpmaskf, isBaseImg=False)
 
@@ -392,38 +780,28 @@ class CFProcessor(object):
                 metamaskImg[res2] = img_cnt
                 eval_mask[res2] = 0
 
-                   #  write the maskfile, modify existing if available
-                if os.path.exists(outFile[0]+dsep+metamaskTIF):
-                    out_metamask_tif = gdal.OpenShared(outFile[0]+dsep+metamaskTIF, GA_Update)
-                else:
-                    out_metamask_tif = driver.Create((outFile[0]+dsep+metamaskTIF), baseImgDim[0][0], baseImgDim[1][0], 1, GDT_Byte)
-
-                maskBand = out_metamask_tif.GetRasterBand(1)
-                maskBand.WriteArray(metamaskImg, 0, 0)
-                maskBand.FlushCache()
-                out_metamask_tif.SetGeoTransform(baseImg.GetGeoTransform())
-                out_metamask_tif.SetProjection(baseImg.GetProjection())
-
 # @@ for testing intermediary -- uncomment the following line  --> see also above and below
                     # to test you may write out intermediary products
                 #outImg = driver.Create((outFile[0]+dsep+outFile[1])+'_'+str(img_cnt), baseImgDim[0][0], baseImgDim[1][0], baseImgDim[2][0], gDType)
 
-                    # create a txt file containing the image-filenames and byte-codes used in the metamask
-                if os.path.exists(outFile[0]+dsep+metamaskTXT):
-                    out_metamask_txt = open(outFile[0]+dsep+metamaskTXT, "a")
-                else:
-                    out_metamask_txt = open(outFile[0]+dsep+metamaskTXT, "w")
-
+                    # the image-filenames and byte-codes used in the metamask
                 applied_mask = infile_gfpmaskf.rsplit(dsep, 1)
-                out_metamask_txt.write(str(img_cnt)+';'+applied_mask[1]+'\n')
-                out_metamask_txt.flush()
+                gfp_table.append((img_cnt, applied_mask[1]))
 
                     # read all bands, check each for cloud-free areas, and write to cloud-free image
+                gfp_bands = get_memmap_bands(infile_gfpf, gfpImg)
                 for i in range(1, baseImgDim[2][0]+1, 1):
-                    gfpBand = gfpImg.GetRasterBand(i)
-                    gfpBand1 = gfpBand.ReadAsArray(0, 0, gfpImgDim[0][0], gfpImgDim[1][0])
+                    if gfp_bands is not None:
+                        gfpBand1 = gfp_bands[i-1]
+                    else:
+                        gfpBand = gfpImg.GetRasterBand(i)
+                        gfpBand1 = gfpBand.ReadAsArray(0, 0, gfpImgDim[0][0], gfpImgDim[1][0])
                     out_data[i-1][res2] = gfpBand1[res2]
 
+                    # the GFP has been consumed - free its temporary storage (unless -k)
+                gfpImg = gfpmaskImg = gfp_bands = gfpBand = gfpBand1 = None
+                if input_params['keep_temporary'] is False:
+                    f_read.release([gfpfile_e, gfpmaskfile_e], temp_storage)
 
                 lmsg = 'Remaining masked pixels: ', np.count_nonzero(eval_mask)
                 print_log(settings, lmsg)
@@ -453,8 +831,14 @@ class CFProcessor(object):
             outImg.SetProjection(baseImg.GetProjection())
                 # calculate the overviews needed
             overview_sizes = calc_overviews(outBand, [baseImgDim[0][0], baseImgDim[1][0]])
-                # initate pyramid creation
-            outImg.BuildOverviews(resampling="NEAREST", overviewlist=overview_sizes)
+                # write the pyramids from the in-memory composite
+            write_overviews(outImg, out_data, overview_sizes)
+            finish_output(outImg, input_params, settings)
+                # the metamask (incl. the GFP table) is written once - when complete
+            write_composite_mask(outFile[0]+dsep+metamaskTIF, metamaskImg, gfp_table, baseImg.GetGeoTransform(),
+                                 baseImg.GetProjection(), input_params, settings)
+            if get_mask_profile(settings)['table_txt']:
+                write_gfp_table_txt(outFile[0]+dsep+metamaskTXT, gfp_table)
 
 # @@ for testing intermediary - uncomment the following line -- see also above
                 #outImg = None
@@ -462,10 +846,10 @@ class CFProcessor(object):
         lmsg = 'CloudFree processing - RUNTIME in sec: ',  time.time() - startTime2
         print_log(settings, lmsg)
 
-        cf_result = [outFile[1], metamaskTIF, metamaskTXT]
+        cf_result = [outFile[1], metamaskTIF]
+        if get_mask_profile(settings)['table_txt']:
+            cf_result.append(metamaskTXT)
 
-        out_metamask_tif = None
-        out_metamask_txt.close()
         outImg = None
         basemaskImg = None
         infile_basemaskf = None
@@ -487,9 +871,10 @@ class CF_cryoland_Processor(CFProcessor):
     def __init__(self):
         CFProcessor.__init__(self)
 
-    def process_clouds_1(self, base_flist, base_mask_flist, gfp_flist, gfpmask_flist, input_params, settings, temp_storage, f_read):
+    def process_clouds_1(self, base_flist, base_mask_flist, gfp_flist, gfpmask_flist, input_params, settings, temp_storage, f_read, out_storage=None):
         """
             perform the required cloud removal processing steps
+            the products are created in the out_storage (default: the temp_storage)
         """
         out_meta_mask = '_composite_mask.txt'
 
@@ -499,20 +884,19 @@ class CF_cryoland_Processor(CFProcessor):
     # all values above are not in use in CryoLand
         nodata_val = 253
 
-            # provide additional tiff-settings for the tif-creation
-        # tiff_options = [ "TILED=YES", "BLOCKXSIZE=256", "BLOCKYSIZE=256" ]
-        tiff_options = []
-        
-        outFile = os.path.join(temp_storage+'CF_'+base_flist[0])
+            # the tiff-settings for the tif-creation are provided by the output profile
+            # (see: get_output_profile)
+
+        outFile = os.path.join((out_storage or temp_storage)+'CF_'+base_flist[0])
         metamaskTXT = outFile.replace('.tif', out_meta_mask)
+            # the product is written in the requested output format and datatype
+        outFile = get_output_name(outFile, input_params)
        
-        if os.path.exists(metamaskTXT):
-            out_metamask_txt = open(metamaskTXT, "a")
-        else:
-            out_metamask_txt = open(metamaskTXT, "w")
-            
+            # the GFP table:  ID -> GFP filename, embedded in the product
+        gfp_table = []
+
         
-        inbase_img = self.fopen(temp_storage+base_flist[0])
+        inbase_img = self.fopen(os.path.join(temp_storage, f_read.get_access_path(base_flist[0])))
         if inbase_img is None:
             err_msg = 'Could not open file: ', temp_storage+base_flist[0]
             handle_error(err_msg, 4, settings)
@@ -522,11 +906,8 @@ class CF_cryoland_Processor(CFProcessor):
         nDtype = getNumpyDataType(inbase_band.DataType)
         gDtype = getGdalDataType(nDtype)
 
-## TODO -- make this more egeneral ie. read DriverType from file
-        indriver = gdal.GetDriverByName('GTiFF')
-
             # load file directly into numpy array - faster, but needs more memory
-        base_img = gdal_array.LoadFile(temp_storage+base_flist[0])
+        base_img = load_file(os.path.join(temp_storage, f_read.get_access_path(base_flist[0])))
 
         outImg = np.zeros((base_img.shape[0], base_img.shape[1]), dtype=nDtype)
         outImg = np.array(base_img)
@@ -545,15 +926,19 @@ class CF_cryoland_Processor(CFProcessor):
             gfp_file1 = [gfp_file]
 
             f_read.base_getcover(gfp_file1, input_params, settings, temp_storage, mask=False)
-            gfile =  gdal_array.LoadFile(temp_storage+gfp_file)
+            gfile = load_file(os.path.join(temp_storage, f_read.get_access_path(gfp_file)))
                 # evaluate the cloud masking
             res2 = np.ma.MaskedArray( ((outImg == cloud_val) | (outImg == zero_val) | (outImg >= nodata_val)) & ((gfile != zero_val ) & (gfile != cloud_val) & (gfile < nodata_val)) )
             outImg[res2] = gfile[res2]
             out_clouds = size(np.array(np.where(outImg == cloud_val)))
 
-                 # write out the files used for CF-product generation           
-            out_metamask_txt.write(str(cnt)+';'+str(gfp_file)+'\n')
-            out_metamask_txt.flush()
+                # the GFP has been consumed - free its temporary storage (unless -k)
+            gfile = None
+            if input_params['keep_temporary'] is False:
+                f_read.release([gfp_file], temp_storage)
+
+                 # the files used for CF-product generation
+            gfp_table.append((cnt, str(gfp_file)))
             
             cnt += 1
             lmsg = 'N_cloudpixel replace: ', num_clouds - out_clouds
@@ -570,11 +955,13 @@ class CF_cryoland_Processor(CFProcessor):
                 break
 
            # now create the cloudfree output products file
-        output = indriver.Create(outFile, base_img.shape[1], base_img.shape[0], inbase_NumBands, gDtype, options=tiff_options)
+        output = create_output(outFile, base_img.shape[1], base_img.shape[0], inbase_NumBands, gDtype, input_params, settings)
             # set the GeoCorrdinates parameters etc.
         output.SetGeoTransform(inbase_img.GetGeoTransform())
             # set the Prohjection parameters etc.
         output.SetProjection(inbase_img.GetProjection())
+            # embed the table of the used GFP files
+        set_gfp_table(output, gfp_table)
         outBand = output.GetRasterBand(1)
             # set the NoData value in the GTiff
         if inbase_band.GetNoDataValue() is None:
@@ -588,8 +975,9 @@ class CF_cryoland_Processor(CFProcessor):
         output.FlushCache()
             # calculate the overviewlist first
         overview_sizes = calc_overviews(inbase_band, base_img.shape)
-            # create the overviews
-        output.BuildOverviews(resampling = "NEAREST", overviewlist = overview_sizes)
+            # create the overviews from the in-memory composite
+        write_overviews(output, [outImg], overview_sizes)
+        finish_output(output, input_params, settings)
         #print 'Overviewlist: ', overview_sizes
 
                     # free the open files
@@ -598,10 +986,12 @@ class CF_cryoland_Processor(CFProcessor):
         base_img = None
         gfp_file = None
         outImg = None
-        out_metamask_txt.close()
 
-        
-        return [os.path.basename(outFile),os.path.basename(metamaskTXT)]
+        if get_mask_profile(settings)['table_txt']:
+            write_gfp_table_txt(metamaskTXT, gfp_table)
+            return [os.path.basename(outFile),os.path.basename(metamaskTXT)]
+
+        return [os.path.basename(outFile)]
 
 
 #/************************************************************************/
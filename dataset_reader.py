@@ -58,12 +58,29 @@ import os.path
 import time
 import fnmatch
 import datetime
-
-from util import parse_xml, print_log
+import math
+import bisect
+import re
+import hashlib
+import itertools
+import shutil
+import tempfile
+import urllib
+import urlparse
+from xml.sax.saxutils import escape
+
+from util import parse_xml, print_log, run_async
 
 import wcs_client
 wcs = wcs_client.wcsClient()
 
+import scene_catalog
+    # the catalog of the local archives, opened by open_catalog()
+catalog = None
+
+    # unique ids of the in-memory windows (shared by all readers of the process)
+window_ids = itertools.count()
+
 
 
 #/************************************************************************/
@@ -75,7 +92,11 @@ def findfile(indir, inmask):
     """
         literal_directory, basename_pattern (simple shell-style wildcards), includes dot-files
         no regex, but constructs like e.g. L5_[!a-f]*.tif , are possible
+        uses the scene catalog if one has been opened, otherwise walks the directory tree
     """
+    if catalog is not None:
+        return catalog.findfile(indir, inmask)
+
     filelist = []
     for root, dd, files in os.walk(indir):
         for ff in files:
@@ -85,6 +106,170 @@ def findfile(indir, inmask):
     return filelist
 
 
+#/************************************************************************/
+#/*                            scan_files()                              */
+#/************************************************************************/
+
+def scan_files(indir):
+    """
+        the names of the files in a directory (not descending into sub-directories),
+        uses scandir if available - which avoids a stat() call per entry
+    """
+    if hasattr(os, 'scandir'):
+        scandir = os.scandir
+    else:
+        try:
+            from scandir import scandir
+        except ImportError:
+            scandir = None
+
+    try:
+        if scandir is not None:
+            return [entry.name for entry in scandir(indir) if entry.is_file()]
+        return [fname for fname in os.listdir(indir) if os.path.isfile(os.path.join(indir, fname))]
+    except OSError:
+        return []
+
+
+#/************************************************************************/
+#/*                           get_month_dirs()                           */
+#/************************************************************************/
+
+def get_month_dirs(toi_values):
+    """
+        the  YYYY/MM/  directories covering a time window ['YYYY-MM-DD', 'YYYY-MM-DD']
+    """
+    year = int(toi_values[0][0:4])
+    month = int(toi_values[0][5:7])
+    end = (int(toi_values[1][0:4]), int(toi_values[1][5:7]))
+
+    month_dirs = []
+    while (year, month) <= end:
+        month_dirs.append('%.4d/%.2d/' % (year, month))
+        month = month + 1
+        if month > 12:
+            year = year + 1
+            month = 1
+
+    return month_dirs
+
+
+#/************************************************************************/
+#/*                           get_toi_range()                            */
+#/************************************************************************/
+
+def get_toi_range(input_params):
+    """
+        the time window (['YYYY-MM-DD', 'YYYY-MM-DD']) to search for images, depending
+        on the toi, the period and the scenario (T|M|B)
+    """
+    toi_values = []
+    if input_params['scenario'] == 'T':
+        target_date = get_daterange(input_params['toi'], -input_params['period'])
+        in_date = get_daterange(input_params['toi'], 0)
+        toi_values.append(target_date)
+        toi_values.append(in_date)
+
+    if input_params['scenario'] == 'B':
+        target_date = get_daterange(input_params['toi'], input_params['period'])
+        in_date = get_daterange(input_params['toi'], 0)
+        toi_values.append(in_date)
+        toi_values.append(target_date)
+
+    if input_params['scenario'] == 'M':
+        tt = int((input_params['period']/2))
+        tt1 = int((input_params['period']/2.)+0.5)       # correct for the rounding error
+        target_date = get_daterange(input_params['toi'], -tt)
+        toi_values.append(target_date)
+        target_date = get_daterange(input_params['toi'], tt1)
+        toi_values.append(target_date)
+
+    return toi_values
+
+
+#/************************************************************************/
+#/*                            TimeIndex()                               */
+#/************************************************************************/
+
+class TimeIndex(object):
+    """
+        sorted in-memory index of scenes (filenames or CoverageIDs) by acquisition date,
+        the date is parsed only once per scene; scenes without a date sort first
+    """
+    def __init__(self, scenes):
+        entries = sorted([(scene_catalog.parse_acq_date(os.path.basename(elem)) or '', elem) for elem in scenes])
+        self.dates = [elem[0] for elem in entries]
+        self.scenes = [elem[1] for elem in entries]
+
+#---------
+    def between(self, from_date, to_date):
+        """
+            the scenes acquired from_date ... to_date  ('YYYYMMDD' or 'YYYY-MM-DD', inclusive)
+        """
+        lo = bisect.bisect_left(self.dates, from_date.replace('-', '')[0:8])
+        hi = bisect.bisect_right(self.dates, to_date.replace('-', '')[0:8])
+
+        return self.scenes[lo:hi]
+
+#---------
+    def ordered(self, toi, scenario, toi_values=None):
+        """
+            the scenes not acquired at toi (but within toi_values, if given), in the order
+            they are used as GFPs:  T = newest first,  B = oldest first,
+            M = alternating newer and older (the closest in time first, newer before older)
+        """
+        toi = toi.replace('-', '')[0:8]
+        lo = bisect.bisect_left(self.dates, toi)
+        hi = bisect.bisect_right(self.dates, toi)
+        first = 0
+        last = len(self.dates)
+        if toi_values is not None:
+            first = bisect.bisect_left(self.dates, toi_values[0].replace('-', '')[0:8])
+            last = bisect.bisect_right(self.dates, toi_values[1].replace('-', '')[0:8])
+        older = self.scenes[first:max(first, lo)]
+        newer = self.scenes[min(hi, last):last]
+
+        if scenario == 'T':
+            return list(reversed(older + newer))
+
+        elif scenario == 'B':
+            return older + newer
+
+        elif scenario == 'M':
+            older.reverse()
+            out_list = []
+            for cnt in range(max(len(newer), len(older))):
+                if cnt < len(newer):
+                    out_list.append(newer[cnt])
+                if cnt < len(older):
+                    out_list.append(older[cnt])
+            return out_list
+
+        return None
+
+
+#/************************************************************************/
+#/*                            open_catalog()                            */
+#/************************************************************************/
+
+def open_catalog(settings):
+    """
+        open the scene catalog of the local archives (general.def_catalog) once,
+        if none is configured the local archives are scanned with os.walk
+    """
+    global catalog
+
+    if catalog is None and settings.get('general.def_catalog', '') != '':
+        try:
+            catalog = scene_catalog.SceneCatalog(settings['general.def_catalog'],
+                                                 float(settings.get('general.def_catalog_max_age', 10)))
+        except Exception as e:
+            err_msg = '[Warning] -- Could not open the scene catalog: ', settings['general.def_catalog'], e
+            print_log(settings, err_msg)
+
+    return catalog
+
+
 #/************************************************************************/
 #/*                               get_taget_list()                       */
 #/************************************************************************/
@@ -120,13 +305,20 @@ class Reader(object):
          - provide the listing of Base-files, Base-masks, GFP-files and GFP-masks to be used
     """
     def __init__(self):
-        pass
+            # the windows (in-memory VRTs) created for local files:  {filename: window}
+        self.windows = {}
+            # if set (to the temp_storage), get_filelist starts downloading the base files as
+            # soon as they are known - prefetched.result() waits for the download to finish
+        self.prefetch_dir = None
+        self.prefetched = None
 
 #---------
     def get_filelist(self, input_params, settings):
         """
             uses WCS requests to generate filelist of files available  at service/server
         """
+            # the images and the masks are listed concurrently
+        mask_call = run_async(self.base_desceocover, input_params, settings, mask=True)
         cov_list = self.base_desceocover(input_params, settings, mask=False)
             # check if there is realy a list of datasets returned or an error msg
         if type(cov_list) is str:   # and cov_list.find('numberMatched="0"') is not -1:
@@ -135,57 +327,61 @@ class Reader(object):
             print_log(settings, cov_list)
             sys.exit()
 
-        
-        mask_list = self.base_desceocover(input_params, settings, mask=True)
-        if type(mask_list) is str:  # and cov_list.find('numberMatched="0"') is not -1:
-            err_msg = '[Error] -- No Datasets found. Service returned the follwing information.'
-            print_log(settings, err_msg)
-            print_log(settings, cov_list)
-            sys.exit()
-
-        
- 
             # split up the received listing - Base, Base_mask, GFPs, GFPMask 
             # (--> cryoland products do not have masks)
-        cnt = 0
-        base_flist = []
-        gfp_flist = []
-
-        for elem in cov_list:
-            idx = elem.find(input_params['toi'])
-            if idx > -1:
-                b_cov = cov_list.pop(cnt)
-                base_flist.append(b_cov)
-            cnt += 1
-        gfp_flist = list(cov_list)
-
-        base_mask_flist = []
-        gfpmask_flist = []
-        cnt = 0
-        for elem in mask_list:
-            idx = elem.find(input_params['toi'])
-            if idx > -1:
-                b_mask = mask_list.pop(cnt)
-                base_mask_flist.append(b_mask)
-            cnt += 1
-
-        gfpmask_flist = list(mask_list)
-
-        gfp_flist, gfpmask_flist = self.apply_scenario(gfp_flist, gfpmask_flist, input_params['scenario'], base_flist, base_mask_flist )
-
-
-        if len(base_flist) != len(base_mask_flist):
-            err_msg = 'Number of datafiles and number of cloud-masks do not correspond'
-            print_log(settings, err_msg)
-            sys.exit(4)
-        if len(gfp_flist) != len(gfpmask_flist):
-            err_msg = 'Number of datafiles and number of cloud-masks do not correspond'
-            print_log(settings, err_msg)
-            sys.exit(4)
+        cov_index = TimeIndex(cov_list)
+        base_flist = cov_index.between(input_params['toi'], input_params['toi'])
+
+            # the download of the base files overlaps with the mask listing
+        if self.prefetch_dir is not None and len(base_flist) > 0:
+            self.prefetched = run_async(self.base_getcover, base_flist, input_params, settings,
+                                        self.prefetch_dir, mask=False)
+
+        try:
+            mask_list = mask_call.result()
+            if type(mask_list) is str:  # and cov_list.find('numberMatched="0"') is not -1:
+                err_msg = '[Error] -- No Datasets found. Service returned the follwing information.'
+                print_log(settings, err_msg)
+                print_log(settings, mask_list)
+                sys.exit()
+
+            mask_index = TimeIndex(mask_list)
+            base_mask_flist = mask_index.between(input_params['toi'], input_params['toi'])
+
+            gfp_flist, gfpmask_flist = self.apply_scenario(cov_index, mask_index, input_params['scenario'], input_params['toi'], settings)
+
+
+            if len(base_flist) != len(base_mask_flist):
+                err_msg = 'Number of datafiles and number of cloud-masks do not correspond'
+                print_log(settings, err_msg)
+                sys.exit(4)
+            if len(gfp_flist) != len(gfpmask_flist):
+                err_msg = 'Number of datafiles and number of cloud-masks do not correspond'
+                print_log(settings, err_msg)
+                sys.exit(4)
+        except BaseException:
+                # the caller removes the temp_storage - the prefetch must not write into it anymore
+            self.discard_prefetch()
+            raise
 
 
         return  base_flist, base_mask_flist, gfp_flist, gfpmask_flist
 
+#---------
+    def discard_prefetch(self):
+        """
+            wait for a running prefetch (started by get_filelist) to finish and drop its
+            result - on errors, before the temp_storage it downloads to is removed
+        """
+        prefetched = self.prefetched
+        self.prefetched = None
+        if prefetched is None:
+            return
+        try:
+            prefetched.result()
+        except BaseException:
+            pass
+
 #---------
 
     def get_maskname(self, filename):
@@ -218,33 +414,27 @@ class Reader(object):
 
 
         aoi_values = input_params['aoi']
-        toi_values = []
-        if input_params['scenario'] == 'T':
-            target_date = get_daterange(input_params['toi'], -input_params['period'])
-            in_date = get_daterange(input_params['toi'], 0)
-            toi_values.append(target_date)
-            toi_values.append(in_date)
-
-        if input_params['scenario'] == 'B':
-            target_date = get_daterange(input_params['toi'], input_params['period'])
-            in_date = get_daterange(input_params['toi'], 0)
-            toi_values.append(in_date)
-            toi_values.append(target_date)
-
-        if input_params['scenario'] == 'M':
-            tt = int((input_params['period']/2))
-            tt1 = int((input_params['period']/2.)+0.5)       # correct for the rounding error
-            target_date = get_daterange(input_params['toi'], -tt)
-            toi_values.append(target_date)
-            target_date = get_daterange(input_params['toi'], tt1)
-            toi_values.append(target_date)
-
+        toi_values = get_toi_range(input_params)
 
+            # the dataset may be served by several mirrors (see: wcs_client.set_mirrors) - 
+            # the requests are addressed to the first one, the wcsClient spreads them across all
+        service = wcs_client.split_mirrors(service)[0]
         service1 = service.rsplit('EOID')[0]
         dss = service.rsplit('EOID')[1][1:]
         
         return service1, toi_values, aoi_values, dss
 
+#---------
+    def find_scenes(self, access_path, fname_syntax, input_params, toi_values=None):
+        """
+            find the images of a local archive matching the filename syntax, which - if a scene
+            catalog is available - also intersect the AOI and were acquired within toi_values
+        """
+        if catalog is None:
+            return sorted(findfile(access_path, fname_syntax))
+
+        return catalog.query(access_path, fname_syntax, input_params['aoi'], toi_values)
+
 #---------
     def base_desceocover(self, input_params, settings, mask):
         """
@@ -268,62 +458,17 @@ class Reader(object):
 
        
 #---------
-    def apply_scenario(self, gfp_flist, gfpmask_flist, scenario, base_flist, base_mask_flist):
+    def apply_scenario(self, gfp_index, gfpmask_index, scenario, toi, settings):
         """
-            apply the selected scenario i.e. sort the gfp lists accordingly
+            apply the selected scenario i.e. order the gfp lists (TimeIndex) accordingly
         """
-        if scenario == 'T':
-            gfp_flist.reverse()
-            gfpmask_flist.reverse()
-            return gfp_flist, gfpmask_flist
-
-        elif scenario == 'B':
-            gfp_flist.sort()
-            gfpmask_flist.sort()
-            return gfp_flist, gfpmask_flist
-
-        elif scenario == 'M':
-            gfp_tmp = list(gfp_flist)
-            gfp_masktmp = list(gfpmask_flist)
-            gfp_tmp.extend(base_flist)
-            gfp_masktmp.extend(base_mask_flist)
-            gfp_tmp.sort()
-            gfp_masktmp.sort()
-
-
-            toi_pos1 = gfp_tmp.index(base_flist[0])
-            toi_pos2 = gfp_masktmp.index(base_mask_flist[0])
-            newer_flist1 = gfp_tmp[toi_pos1+1:]
-            older_flist1 = gfp_tmp[:toi_pos1]
-            older_flist1.reverse()
-            newer_flist2 = gfp_masktmp[toi_pos2+1:]
-            older_flist2 = gfp_masktmp[:toi_pos2]
-            older_flist2.reverse()
-
-                # we always use the newer files first
-            gfp = map(None, newer_flist1, older_flist1)
-            gfpm = map(None, newer_flist2, older_flist2)
-
-            out_gfp = []
-            for k, v in gfp:
-                if k is not None:
-                    out_gfp.append(k)
-                if v is not None:
-                    out_gfp.append(v)
-
-            out_gfpm = []
-            for k, v in gfpm:
-                if k is not None:
-                    out_gfpm.append(k)
-                if v is not None:
-                    out_gfpm.append(v)
-
-            return out_gfp, out_gfpm
-
-        else:
-            print_log(settings, '[Error] -- Choosen Scenario is not supported. Please use either T, B or M -- ')
+        if scenario not in ('T', 'B', 'M'):
+            err_msg = '[Error] -- Choosen Scenario is not supported. Please use either T, B or M -- '
+            print_log(settings, err_msg)
             sys.exit(3)
 
+        return gfp_index.ordered(toi, scenario), gfpmask_index.ordered(toi, scenario)
+
 #---------
     def base_getcover(self, file_list, input_params, settings, temp_storage, mask):
         """
@@ -368,6 +513,176 @@ class Reader(object):
             if res_getcov is not 200:
                 print_log(settings, res_getcov)
 
+            # coverages kept in memory by the wcsClient are opened from there (see: get_access_path)
+        self.windows.update(wcs_client.get_memory_files(temp_storage))
+
+
+#---------
+    def get_access_path(self, filename):
+        """
+            the path the processor has to open for a file of the file-lists - the window
+            of a local file or the in-memory copy of a downloaded coverage, if one has been
+            created by base_getcover, the file itself otherwise
+        """
+        if self.windows.has_key(filename):
+            return self.windows[filename]
+
+        return filename
+
+#---------
+    def release(self, file_list, temp_storage):
+        """
+            free the files of the file-lists once the processor has consumed them - downloaded
+            files (in the temp_storage or in memory) are deleted, windows of local files are
+            dropped; the local files themselves and the cached COG windows are kept
+        """
+        from osgeo import gdal
+
+        temp_storage = os.path.join(os.path.abspath(temp_storage), '')
+        for filename in file_list:
+            access_path = self.windows.pop(filename, filename)
+            if access_path.startswith(wcs_client.memory_prefix):
+                wcs_client.release_memory_file(os.path.join(temp_storage, filename))
+            elif access_path.startswith('/vsimem/'):
+                gdal.Unlink(access_path)
+
+            infile = os.path.abspath(os.path.join(temp_storage, access_path))
+            if infile.startswith(temp_storage) and os.path.isfile(infile):
+                os.remove(infile)
+
+#---------
+    def close(self):
+        """
+            drop all windows (in-memory VRTs) the reader has created - at the end of a request,
+            also those of files which have not been release()d (e.g. kept with -k)
+        """
+        from osgeo import gdal
+
+        for window in self.windows.values():
+            if window.startswith('/vsimem/') and not window.startswith(wcs_client.memory_prefix):
+                gdal.Unlink(window)
+        self.windows = {}
+
+#---------
+    def local_getcover(self, file_list, input_params, settings, mask):
+        """
+            base_getcover for the local ('_f', '_m') datasets - instead of copying, a lightweight
+            window (in-memory VRT) over the original file is created, holding only the AOI
+            (if extract = SUB) and the requested bands (not for masks)
+        """
+        from osgeo import gdal
+
+        for filename in file_list:
+            if self.windows.has_key(filename):
+                continue
+
+            src_ds = gdal.OpenShared(filename)
+            if src_ds is None:
+                err_msg = '[Error] -- Could not open: ', filename
+                print_log(settings, err_msg)
+                continue
+
+            src_win = [0, 0, src_ds.RasterXSize, src_ds.RasterYSize]
+            if input_params['extract'] == 'SUB':
+                aoi_win = self.get_pixel_window(src_ds, input_params['aoi'])
+                if aoi_win is not None:
+                    src_win = aoi_win
+                else:
+                    err_msg = '[Warning] -- AOI does not intersect (using the full file): ', filename
+                    print_log(settings, err_msg)
+
+            if mask is True or input_params['bands'] == '999':
+                band_list = range(1, src_ds.RasterCount+1)
+            else:
+                band_list = [int(bb) for bb in input_params['bands']]
+
+                # nothing to subset - use the original file
+            if src_win == [0, 0, src_ds.RasterXSize, src_ds.RasterYSize] and band_list == range(1, src_ds.RasterCount+1):
+                continue
+
+            window = '/vsimem/cloudfree_windows/%d/%s' % (window_ids.next(), os.path.basename(filename))
+            gdal.FileFromMemBuffer(window, self.get_window_vrt(src_ds, filename, src_win, band_list))
+            self.windows[filename] = window
+            src_ds = None
+
+#---------
+    def get_pixel_window(self, src_ds, aoi_values, steps=10):
+        """
+            the pixel window [xoff, yoff, xsize, ysize] of a raster covering the AOI
+            (minx, maxx, miny, maxy in EPSG:4326),  None if they don't intersect
+        """
+        from osgeo import gdal, osr
+
+        aoi = [float(elem) for elem in aoi_values]
+        points = []
+        for ii in range(steps+1):
+            lon = aoi[0] + (aoi[1]-aoi[0])*ii/float(steps)
+            lat = aoi[2] + (aoi[3]-aoi[2])*ii/float(steps)
+            points.extend([(lon, aoi[2]), (lon, aoi[3]), (aoi[0], lat), (aoi[1], lat)])
+
+            # transform the (densified) AOI borders into the raster CRS
+        if src_ds.GetProjection() != '':
+            src_srs = osr.SpatialReference()
+            src_srs.ImportFromEPSG(4326)
+            dst_srs = osr.SpatialReference()
+            dst_srs.ImportFromWkt(src_ds.GetProjection())
+            if hasattr(src_srs, 'SetAxisMappingStrategy'):
+                src_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+                dst_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            transform = osr.CoordinateTransformation(src_srs, dst_srs)
+            points = [transform.TransformPoint(xx, yy)[0:2] for xx, yy in points]
+
+        inv_gt = gdal.InvGeoTransform(src_ds.GetGeoTransform())
+            # GDAL < 2 returns (success, geotransform)
+        if len(inv_gt) == 2:
+            inv_gt = inv_gt[1]
+        pixels = [inv_gt[0] + xx*inv_gt[1] + yy*inv_gt[2] for xx, yy in points]
+        lines = [inv_gt[3] + xx*inv_gt[4] + yy*inv_gt[5] for xx, yy in points]
+
+        xoff = max(0, int(math.floor(min(pixels))))
+        yoff = max(0, int(math.floor(min(lines))))
+        xend = min(src_ds.RasterXSize, int(math.ceil(max(pixels))))
+        yend = min(src_ds.RasterYSize, int(math.ceil(max(lines))))
+        if xend <= xoff or yend <= yoff:
+            return None
+
+        return [xoff, yoff, xend-xoff, yend-yoff]
+
+#---------
+    def get_window_vrt(self, src_ds, filename, src_win, band_list):
+        """
+            the VRT (xml) of a window [xoff, yoff, xsize, ysize] and a band-subset of a raster
+        """
+        from osgeo import gdal
+
+        if filename.startswith('/vsi'):
+            source = filename
+        else:
+            source = os.path.abspath(filename)
+
+        gt = list(src_ds.GetGeoTransform())
+        gt[0] = gt[0] + src_win[0]*gt[1] + src_win[1]*gt[2]
+        gt[3] = gt[3] + src_win[0]*gt[4] + src_win[1]*gt[5]
+
+        vrt = ['<VRTDataset rasterXSize="%d" rasterYSize="%d">' % (src_win[2], src_win[3])]
+        vrt.append('  <SRS>%s</SRS>' % escape(src_ds.GetProjection()))
+        vrt.append('  <GeoTransform>%s</GeoTransform>' % ', '.join([repr(elem) for elem in gt]))
+        for dst_band, src_band in enumerate(band_list):
+            band = src_ds.GetRasterBand(src_band)
+            vrt.append('  <VRTRasterBand dataType="%s" band="%d">' % (gdal.GetDataTypeName(band.DataType), dst_band+1))
+            if band.GetNoDataValue() is not None:
+                vrt.append('    <NoDataValue>%s</NoDataValue>' % repr(band.GetNoDataValue()))
+            vrt.append('    <SimpleSource>')
+            vrt.append('      <SourceFilename relativeToVRT="0">%s</SourceFilename>' % escape(source))
+            vrt.append('      <SourceBand>%d</SourceBand>' % src_band)
+            vrt.append('      <SrcRect xOff="%d" yOff="%d" xSize="%d" ySize="%d"/>' % tuple(src_win))
+            vrt.append('      <DstRect xOff="0" yOff="0" xSize="%d" ySize="%d"/>' % (src_win[2], src_win[3]))
+            vrt.append('    </SimpleSource>')
+            vrt.append('  </VRTRasterBand>')
+        vrt.append('</VRTDataset>')
+
+        return '\n'.join(vrt)
+
 
 #/************************************************************************/
 #/*                      CF_landsat5_2a_Reader                          */
@@ -419,29 +734,17 @@ class CF_cryoland_Reader(Reader):
             uses WCS requests to generate filelist of files available  at service/server
         """
         cov_list = self.base_desceocover(input_params, settings, mask=False)
-
-        base_flist = []
-        base_mask_flist = []
-        gfp_flist = []
-        gfpmask_flist = []
+        if type(cov_list) is str:
+            err_msg = '[Error] -- No Datasets found. Service returned the follwing information.'
+            print_log(settings, err_msg)
+            print_log(settings, cov_list)
+            sys.exit()
 
             # split up the received listing - Base, Base_mask, GFPs, GFPMask  (--> cryoland products do not have masks)
-        cnt = 0
-        for elem in cov_list:
-            try:
-                idx = elem.find(input_params['toi'])
-                if idx > -1:
-                    b_cov = cov_list.pop(cnt)
-                    base_flist.append(b_cov)
-                else:
-                    b_cov = ''
-                cnt += 1
-
-            except ValueError:
-                print_log(settings, str(ValueError))
-
-
-        gfp_flist = list(cov_list)
+        cov_index = TimeIndex(cov_list)
+        base_flist = cov_index.between(input_params['toi'], input_params['toi'])
+        base_mask_flist = []
+        gfp_flist, gfpmask_flist = self.apply_scenario(cov_index, TimeIndex([]), input_params['scenario'], input_params['toi'], settings)
 
         return  base_flist, base_mask_flist, gfp_flist, gfpmask_flist
 
@@ -468,12 +771,12 @@ class CF_landsat5_f_Reader(Reader):
         if type(filename) == list:
             mask_filename = []
             for elem in filename:
-                # for landsat5 -  mask would be
-                base, extension = os.path.splitext(elem)
-                m_filename = "%s.nuages%s" % (base, extension)
-                mask_filename.append(m_filename)
+                mask_filename.append(self.get_maskname(elem))
 
         elif type(filename) == str:
+                # for landsat5 -  mask would be  <name>.nuages<ext>,  unless the scene catalog knows it
+            if catalog is not None and catalog.get_maskname(filename) is not None:
+                return catalog.get_maskname(filename)
             base, extension = os.path.splitext(filename)
             mask_filename = "%s.nuages%s" % (base, extension)
 
@@ -484,66 +787,41 @@ class CF_landsat5_f_Reader(Reader):
         """
             gets the listing of filenames of available: Base files, GFP files and Mask files
         """
+        open_catalog(settings)
         target_date = input_params['toi']
         access_path1 = settings['dataset.'+input_params['dataset']]
         pos1 = str.index(access_path1, '://')
         access_path = access_path1[pos1+3:]
 
-
-## TODO:  this should be more general - eg. using:  get_daterange() ??
-        start_year = int(input_params['toi'][0:4])
-        start_month = int(input_params['toi'][4:6])
-
-        if input_params['scenario'] == 'T':
-            if start_month == 1:
-                loop = [ start_year - 1, '11', start_year -1 , '12', start_year, start_month ]
-            elif start_month == 2:
-                loop = [ start_year - 1, '12', start_year, start_month -1 , start_year, start_month ]
-            else:
-                loop = [start_year, start_month - 2, start_year, start_month -1 , start_year, start_month ]
-
-        elif input_params['scenario'] == 'B':
-            if start_month == 12:
-                loop = [start_year, start_month, start_year + 1, '01', start_year + 1, '02' ]
-            elif start_month == 11:
-                loop = [start_year, start_month, start_year, start_month + 1 , start_year +1 , '01' ]
-            else:
-                loop = [start_year, start_month, start_year, start_month + 1, start_year, start_month + 2 ]
-
-        elif input_params['scenario'] == 'M':
-            if start_month == 12:
-                loop = [start_year, start_month - 1, start_year, start_month, start_year +1 , '01' ]
-            elif start_month == 1:
-                loop = [start_year -1, '12', start_year, start_month, start_year, start_month + 1  ]
-            else:
-                loop = [start_year, start_month - 1, start_year, start_month, start_year, start_month + 1 ]
-
-
-        if len(str(loop[1])) == 1:
-            loop[1] = '0'+str(loop[1])
-        if len(str(loop[3])) == 1:
-            loop[3] = '0'+str(loop[3])
-        if len(str(loop[5])) == 1:
-            loop[5] = '0'+str(loop[5])
-
-        base_flist = []
-        base_mask_flist = []
-        gfp_flist = []
-        gfpmask_flist = []
+            # the archive is organised in  YYYY/MM/  directories - only those covering the
+            # requested time window (toi, period, scenario) are visited
+        toi_values = get_toi_range(input_params)
         base_fname_syntax = 'L*_' + target_date + '*_L5_*_surf_pente_30m.tif'
         gfp_fname_syntax = 'L*_*_L5_*_surf_pente_30m.tif'
 
-
-        for jj in range(0, len(loop)-1, 2):
-            target = str(loop[jj])+'/'+str(loop[jj+1])+'/'
-            base_flist = base_flist+sorted(findfile(access_path+target, base_fname_syntax))
-            gfp_flist = gfp_flist+sorted(findfile(access_path+target, gfp_fname_syntax))
+        base_flist = []
+        gfp_flist = []
+        for target in get_month_dirs(toi_values):
+            if catalog is not None:
+                base_flist.extend(self.find_scenes(access_path+target, base_fname_syntax, input_params))
+                gfp_flist.extend(self.find_scenes(access_path+target, gfp_fname_syntax, input_params, toi_values))
+                continue
+
+            for fname in scan_files(access_path+target):
+                if fnmatch.fnmatchcase(fname, base_fname_syntax):
+                    base_flist.append(access_path+target+fname)
+                elif fnmatch.fnmatchcase(fname, gfp_fname_syntax) and \
+                        toi_values[0].replace('-', '') <= scene_catalog.parse_acq_date(fname) <= toi_values[1].replace('-', ''):
+                    gfp_flist.append(access_path+target+fname)
 
             # now remove any base_filenames from the gfp_flist, to avoid duplicates
-        gfp_flist = [item for item in gfp_flist if not item in base_flist]
+        base_flist = sorted(set(base_flist))
+        base_set = set(base_flist)
+        gfp_flist = [item for item in set(gfp_flist) if item not in base_set]
+        gfp_flist = TimeIndex(gfp_flist).ordered(target_date, input_params['scenario'])
             # create the file-list for the mask-files
         gfpmask_flist = self.get_maskname(gfp_flist)
-        base_mask_flist =  self.get_maskname(base_flist)
+        base_mask_flist = self.get_maskname(base_flist)
 
             # return all created file-lists
         return base_flist, base_mask_flist, gfp_flist, gfpmask_flist
@@ -551,11 +829,10 @@ class CF_landsat5_f_Reader(Reader):
 #----
     def base_getcover(self, file_list, input_params, settings, temp_storage, mask):
         """
-            Processing takes place on the original data (skipping copying, but 
-            maybe risking data cuorruption ?), no data transformation (subsetting, CRS, 
-            band subsetting) is currently implemented
+            Processing takes place on the original data (no copying) - AOI and band
+            subsetting is done by windows (in-memory VRTs), no CRS transformation
         """
-        pass
+        self.local_getcover(file_list, input_params, settings, mask)
 
 #----
     
@@ -585,17 +862,13 @@ class CF_spot4take5_f_Reader(Reader):
         if type(filename) == list:
             mask_filename = []
             for elem in filename:
-                dirname = os.path.dirname(elem)
-                basename = os.path.basename(elem)
-               #basename1 =  basename.replace('_ORTHO_','_')
-               # basename1 =  basename1.replace('_PENTE_','_')
-                m_filename1 = basename[0:25]+'*_NUA.TIF'
-                m_filename = sorted(findfile(dirname+'/MASK/', m_filename1))
-                mask_filename.append(str(m_filename[0]))
+                mask_filename.append(self.get_maskname(elem))
 
         elif type(filename) == str:
-            dirname = os.path.dirname(elem)
-            basename = os.path.basename(elem)
+            if catalog is not None and catalog.get_maskname(filename) is not None:
+                return catalog.get_maskname(filename)
+            dirname = os.path.dirname(filename)
+            basename = os.path.basename(filename)
             #basename1 =  basename.replace('_ORTHO_','_')
             #basename1 =  basename1.replace('_PENTE_','_')
             m_filename1 = basename[0:25]+'*_NUA.TIF'
@@ -609,6 +882,7 @@ class CF_spot4take5_f_Reader(Reader):
         """
             gets the listing of filenames of available: Base files, GFP files and Mask files
         """
+        open_catalog(settings)
         target_date = input_params['toi']
         access_path1 = settings['dataset.'+input_params['dataset']]
         pos1 = str.index(access_path1, '://')
@@ -622,10 +896,12 @@ class CF_spot4take5_f_Reader(Reader):
         base_fname_syntax = 'SPOT4_*' + target_date + '*_PENTE_*.TIF'
         gfp_fname_syntax = 'SPOT4_*_PENTE_*.TIF'
 
-        base_flist = base_flist+sorted(findfile(access_path, base_fname_syntax))
+        toi_values = get_toi_range(input_params)
+        base_flist = base_flist+self.find_scenes(access_path, base_fname_syntax, input_params)
         base_mask_flist = self.get_maskname(base_flist)
-        gfp_flist = gfp_flist+sorted(findfile(access_path, gfp_fname_syntax))
-        gfp_flist = [item for item in gfp_flist if not item in base_flist]
+        gfp_flist = gfp_flist+self.find_scenes(access_path, gfp_fname_syntax, input_params, toi_values)
+            # the GFPs acquired within the time window, without the base files, in scenario order
+        gfp_flist = TimeIndex(gfp_flist).ordered(target_date, input_params['scenario'], toi_values)
         gfpmask_flist = self.get_maskname(gfp_flist)
 
 
@@ -634,11 +910,10 @@ class CF_spot4take5_f_Reader(Reader):
 #----
     def base_getcover(self, file_list, input_params, settings, temp_storage, mask):
         """
-            Processing takes place on the original data (skipping copying, but 
-            maybe risking data cuorruption ?), no data transformation (subsetting, CRS, 
-            band subsetting) is currently implemented
+            Processing takes place on the original data (no copying) - AOI and band
+            subsetting is done by windows (in-memory VRTs), no CRS transformation
         """
-        pass
+        self.local_getcover(file_list, input_params, settings, mask)
 
 #/************************************************************************/
 #/*                      CF_spot4take5_f_Reader                          */
@@ -695,12 +970,12 @@ class CF_landsat5_m_Reader(Reader):
         if type(filename) == list:
             mask_filename = []
             for elem in filename:
-                # for landsat5 -  mask would be
-                base, extension = os.path.splitext(elem)
-                m_filename = "%s.nuages%s" % (base, extension)
-                mask_filename.append(m_filename)
+                mask_filename.append(self.get_maskname(elem))
 
         elif type(filename) == str:
+                # for landsat5 -  mask would be  <name>.nuages<ext>,  unless the scene catalog knows it
+            if catalog is not None and catalog.get_maskname(filename) is not None:
+                return catalog.get_maskname(filename)
             base, extension = os.path.splitext(filename)
             mask_filename = "%s.nuages%s" % (base, extension)
 
@@ -711,6 +986,7 @@ class CF_landsat5_m_Reader(Reader):
         """
             gets the listing of filenames of available: Base files, GFP files and Mask files
         """
+        open_catalog(settings)
         target_date = input_params['toi']
         access_path1 = settings['dataset.'+input_params['dataset']]
         pos1    = str.index(access_path1, '://')
@@ -718,11 +994,12 @@ class CF_landsat5_m_Reader(Reader):
 
         base_fname_syntax = 'L*_' + target_date + '_L5_*_surf_pente_30m.tif'
         gfp_fname_syntax = 'L*_*_L5_*_surf_pente_30m.tif'
-        base_flist = sorted(findfile(acces_path, base_fname_syntax))
-        gfp_flist = sorted(findfile(acces_path, gfp_fname_syntax))[0:input_params['period']]
+        toi_values = get_toi_range(input_params)
+        base_flist = self.find_scenes(acces_path, base_fname_syntax, input_params)
+        gfp_flist = self.find_scenes(acces_path, gfp_fname_syntax, input_params, toi_values)
 
-            # now remove any base_filenames from the gfp_flist, to avoid duplicates
-        gfp_flist = [item for item in gfp_flist if not item in base_flist]
+            # the GFPs acquired within the time window, without the base files, in scenario order
+        gfp_flist = TimeIndex(gfp_flist).ordered(target_date, input_params['scenario'], toi_values)
             # create the file-list for the mask-files
         gfpmask_flist = self.get_maskname(gfp_flist)
         base_mask_flist = self.get_maskname(base_flist)
@@ -732,11 +1009,224 @@ class CF_landsat5_m_Reader(Reader):
 #----
     def base_getcover(self, file_list, input_params, settings, temp_storage, mask):
         """
-            Processing takes place on the original data (skipping copying, but 
-            maybe risking data cuorruption ?), no data transformation (subsetting, CRS, 
-            band subsetting) is currently implemented
+            Processing takes place on the original data (no copying) - AOI and band
+            subsetting is done by windows (in-memory VRTs), no CRS transformation
         """
-        pass
+        self.local_getcover(file_list, input_params, settings, mask)
+
+
+#/************************************************************************/
+#/*                      CF_http_cog_Reader                              */
+#/************************************************************************/
+
+class CF_http_cog_Reader(Reader):
+    """
+        reader module for (Cloud-Optimized) GeoTiffs published on a plain HTTP(S) server,
+        configured as  <dataset> = http(s)://some.where.org/path/<filename_pattern>.tif
+         - the directory listing (HTML index) of the server provides the available files
+         - the rasters are accessed by HTTP range-requests (GDAL /vsicurl/), only the
+           AOI window and the requested bands are read
+         - the fetched windows are cached locally (general.def_http_cache), windows not
+           used for general.def_http_cache_max_age are removed from the cache
+        The cloud masks are found by the naming conventions of the local archives
+        (<base>.nuages.tif  or  MASK/<first 25 chars>*_NUA.TIF).
+    """
+    def __init__(self):
+        Reader.__init__(self)
+            # the directory listings already read:  {directory_url: [filenames]}
+        self.listings = {}
+        self.settings = None
+        self.cache_pruned = False
+
+#----
+    def get_listing(self, dir_url, settings):
+        """
+            the filenames linked from the directory listing (HTML index) at dir_url
+        """
+        if not self.listings.has_key(dir_url):
+            document = wcs.GetDocument(dir_url, settings)
+            names = []
+            if document is not None:
+                for href in re.findall(r'href\s*=\s*["\']([^"\'?#]+)["\']', document, re.IGNORECASE):
+                    url = urlparse.urljoin(dir_url, href)
+                        # only the files directly within dir_url
+                    if url.startswith(dir_url) and not url.endswith('/') and '/' not in url[len(dir_url):]:
+                        names.append(urllib.unquote(url[len(dir_url):]))
+            self.listings[dir_url] = sorted(set(names))
+
+        return self.listings[dir_url]
+
+#----
+    def get_maskname(self, filename):
+        """
+            set the mask filename filter and get the mask filename(-list)
+            return mask-filename or list of mask-filenames (if list is provided)
+        """
+            # check if list or single name has been provided
+        if type(filename) == list:
+            mask_filename = []
+            for elem in filename:
+                mask_filename.append(self.get_maskname(elem))
+
+        elif type(filename) == str:
+            dir_url, basename = filename.rsplit('/', 1)
+            base, extension = os.path.splitext(basename)
+            mask_filename = "%s/%s.nuages%s" % (dir_url, base, extension)
+            if not "%s.nuages%s" % (base, extension) in self.listings.get(dir_url+'/', []):
+                m_filename = fnmatch.filter(self.get_listing(dir_url+'/MASK/', self.settings), basename[0:25]+'*_NUA.TIF')
+                if len(m_filename) > 0:
+                    mask_filename = dir_url+'/MASK/'+sorted(m_filename)[0]
+
+        return mask_filename
+
+#----
+    def get_filelist(self, input_params, settings):
+        """
+            gets the listing of filenames of available: Base files, GFP files and Mask files
+        """
+        self.settings = settings
+        target_date = input_params['toi']
+        dir_url, fname_syntax = settings['dataset.'+input_params['dataset']].rsplit('/', 1)
+        dir_url = dir_url+'/'
+
+        toi_values = get_toi_range(input_params)
+        names = fnmatch.filter(self.get_listing(dir_url, settings), fname_syntax)
+        names = [item for item in names if not scene_catalog.is_mask(item)]
+        time_index = TimeIndex([dir_url+item for item in names])
+
+        base_flist = time_index.between(target_date, target_date)
+        gfp_flist = time_index.ordered(target_date, input_params['scenario'], toi_values)
+
+            # the footprints are read from the file headers (one range-request each)
+        self.set_gdal_options(settings)
+        base_flist = [item for item in base_flist if self.intersects(item, input_params['aoi'])]
+        gfp_flist = [item for item in gfp_flist if self.intersects(item, input_params['aoi'])]
+
+        base_mask_flist = self.get_maskname(base_flist)
+        gfpmask_flist = self.get_maskname(gfp_flist)
+
+        return base_flist, base_mask_flist, gfp_flist, gfpmask_flist
+
+#----
+    def set_gdal_options(self, settings):
+        """
+            configure GDAL for the range-request access (/vsicurl/)
+        """
+        from osgeo import gdal
+
+            # don't read the directory listing on every open, only the files themselves
+        gdal.SetConfigOption('GDAL_DISABLE_READDIR_ON_OPEN', 'EMPTY_DIR')
+        gdal.SetConfigOption('CPL_VSIL_CURL_ALLOWED_EXTENSIONS', '.tif,.tiff,.TIF,.TIFF')
+            # keep the fetched blocks in memory - e.g. the headers read for the footprints
+        gdal.SetConfigOption('VSI_CACHE', 'TRUE')
+        gdal.SetConfigOption('CPL_VSIL_CURL_CACHE_SIZE', str(64*1024*1024))
+        gdal.SetConfigOption('GDAL_HTTP_MAX_RETRY', settings.get('wcs_requests.max_retries', '3'))
+        gdal.SetConfigOption('GDAL_HTTP_RETRY_DELAY', settings.get('wcs_requests.backoff_base', '1'))
+
+#----
+    def prune_cache(self, cache_dir, max_age):
+        """
+            remove the cached windows (and left over partial files) which have not been used
+            for more than max_age seconds from the cache_dir - a cache hit updates the mtime
+        """
+        if max_age <= 0 or not os.path.isdir(cache_dir):
+            return
+
+        now = time.time()
+        for key in os.listdir(cache_dir):
+            key_dir = os.path.join(cache_dir, key)
+            try:
+                if not os.path.isdir(key_dir):
+                    continue
+                last_used = max([os.path.getmtime(key_dir)] +
+                                [os.path.getmtime(os.path.join(key_dir, fname)) for fname in os.listdir(key_dir)])
+                if now - last_used > max_age:
+                    shutil.rmtree(key_dir, ignore_errors=True)
+            except OSError:
+                pass
+
+#----
+    def intersects(self, url, aoi_values):
+        """
+            tests if the footprint of a remote raster intersects the AOI (unknown footprint = True)
+        """
+        footprint = scene_catalog.get_footprint('/vsicurl/'+url)
+        if footprint is None:
+            return True
+        aoi = [float(elem) for elem in aoi_values]
+
+        return footprint[1] >= aoi[0] and footprint[0] <= aoi[1] and footprint[3] >= aoi[2] and footprint[2] <= aoi[3]
+
+#----
+    def base_getcover(self, file_list, input_params, settings, temp_storage, mask):
+        """
+            read the AOI window and the requested bands of the remote rasters by range-requests
+            and store them in the local cache (general.def_http_cache, or the temp_storage)
+        """
+        from osgeo import gdal
+
+        self.set_gdal_options(settings)
+        cache_dir = settings.get('general.def_http_cache', '') or temp_storage
+        if not self.cache_pruned and settings.get('general.def_http_cache', ''):
+            self.prune_cache(cache_dir, float(settings.get('general.def_http_cache_max_age', 604800) or 0))
+            self.cache_pruned = True
+
+        for url in file_list:
+            if self.windows.has_key(url):
+                continue
+
+            src_ds = gdal.OpenShared('/vsicurl/'+url)
+            if src_ds is None:
+                err_msg = '[Error] -- Could not open: ', url
+                print_log(settings, err_msg)
+                continue
+
+            src_win = [0, 0, src_ds.RasterXSize, src_ds.RasterYSize]
+            if input_params['extract'] == 'SUB':
+                aoi_win = self.get_pixel_window(src_ds, input_params['aoi'])
+                if aoi_win is not None:
+                    src_win = aoi_win
+            if mask is True or input_params['bands'] == '999':
+                band_list = range(1, src_ds.RasterCount+1)
+            else:
+                band_list = [int(bb) for bb in input_params['bands']]
+
+                # the cached window - keyed by the file, its window and bands
+            key = hashlib.sha1(url+repr(src_win)+repr(band_list)).hexdigest()
+            cache_file = os.path.join(cache_dir, key, url.rsplit('/', 1)[1])
+            if os.path.exists(cache_file):
+                    # the age of a cached window counts from its last use (see: prune_cache)
+                try:
+                    os.utime(cache_file, None)
+                except OSError:
+                    pass
+            else:
+                if not os.path.isdir(os.path.dirname(cache_file)):
+                    try:
+                        os.makedirs(os.path.dirname(cache_file))
+                    except OSError:
+                        if not os.path.isdir(os.path.dirname(cache_file)):
+                            raise
+                    # written under a unique name - concurrent requests (--jobs, --daemon) may
+                    # fetch the same window, only complete files are renamed into the cache
+                fd, part_file = tempfile.mkstemp(prefix='.'+os.path.basename(cache_file), suffix='.part',
+                                                 dir=os.path.dirname(cache_file))
+                os.close(fd)
+                try:
+                    vrt_ds = gdal.Open(self.get_window_vrt(src_ds, '/vsicurl/'+url, src_win, band_list))
+                    out_ds = gdal.GetDriverByName('GTiff').CreateCopy(part_file, vrt_ds, 0,
+                                                                      ['TILED=YES', 'COMPRESS=DEFLATE'])
+                    if out_ds is None:
+                        raise IOError('Could not write: '+part_file)
+                    out_ds = None
+                    vrt_ds = None
+                    os.rename(part_file, cache_file)
+                finally:
+                    if os.path.exists(part_file):
+                        os.remove(part_file)
+
+            self.windows[url] = cache_file
+            src_ds = None
 
 
 #/************************************************************************/
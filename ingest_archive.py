@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+#
+#------------------------------------------------------------------------------
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+#
+#
+#       Ingest tool for the local archives ('_f', '_m' datasets):
+#       rewrites the images and their cloud masks (.nuages / _NUA files) as
+#       tiled, compressed Cloud-Optimized GeoTiffs (COG) with internal
+#       overviews, so the windowed reads of the processor only touch the
+#       blocks they need. The conversion runs in parallel (one process per
+#       scene) and the ingested archive is registered in the scene catalog.
+#
+#       Usage:   ingest_archive.py  (-h|--help) for the available options
+#
+#
+# Project: DeltaDREAM
+# Name:    ingest_archive.py
+# Authors: Christian Schiller <christian dot schiller at eox dot at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2014 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+#
+#
+
+import sys
+import os
+import time
+import getopt
+import shutil
+import multiprocessing
+
+from get_config import get_config
+import scene_catalog
+
+
+    # the default config file - provides the location of the scene catalog
+default_config_file = os.path.abspath('.')+os.sep+"conf"+os.sep+"cloudless_config.cfg"
+
+    # the files which are converted, all others are copied unchanged
+raster_ext = ('.tif', '.tiff')
+
+
+#/************************************************************************/
+#/*                               usage()                                */
+#/************************************************************************/
+
+def usage():
+    """
+        Print out the Usage information
+    """
+    print ""
+    print "Usage: ingest_archive.py  [-i|--input] <archive_dir>  ([-o|--output] <target_dir>) ([-j|--jobs] <num>) "
+    print "                  ([-c|--compress] <DEFLATE|LZW|ZSTD|NONE>) ([-b|--blocksize] <pixels>) ([-f|--config] <cfg-file>) "
+    print "                  (--force) "
+    print " "
+    print "  Rewrites a local archive (images and their cloud masks) into tiled, compressed Cloud-Optimized"
+    print "  GeoTiffs with internal overviews and registers them in the scene catalog."
+    print "  REQUIRED parameters: "
+    print "   -i|--input <archive_dir>  --  the local archive to ingest"
+    print "  OPTIONAL parameters: "
+    print "   -h|--help                 --  This help information"
+    print "   -o|--output <target_dir>  --  where to write the ingested archive (same directory structure)"
+    print "                                 [default = rewrite the archive in place]"
+    print "   -j|--jobs <num>           --  number of scenes converted in parallel [default = number of CPUs]"
+    print "   -c|--compress <method>    --  compression of the COGs [default=DEFLATE]"
+    print "   -b|--blocksize <pixels>   --  tile size of the COGs [default=512]"
+    print "   -f|--config <cfg-file>    --  config-file providing the scene catalog (general.def_catalog)"
+    print "                                 [default=conf/cloudless_config.cfg]"
+    print "   --force                   --  convert also files which are already tiled COGs or up to date"
+    print " "
+    print "Example: ./ingest_archive.py -i /data/landsat5_f/ -o /data/landsat5_cog/ -j 8 "
+    print " "
+    sys.exit()
+
+
+#/************************************************************************/
+#/*                            is_cog()                                  */
+#/************************************************************************/
+
+def is_cog(ds):
+    """
+        tests if a dataset is already tiled and has (internal) overviews
+    """
+    band = ds.GetRasterBand(1)
+
+    return band.GetBlockSize()[0] < ds.RasterXSize and band.GetOverviewCount() > 0
+
+
+#/************************************************************************/
+#/*                           convert_scene()                            */
+#/************************************************************************/
+
+def convert_scene(task):
+    """
+        convert a single file into a COG (written to a temporary name, renamed when complete)
+        - runs in a worker process
+        Returns:  (src_file, status, seconds)   status = converted|copied|skipped|error message
+    """
+    src_file, dst_file, options = task
+    startTime = time.time()
+
+    if not options['force'] and src_file != dst_file and os.path.exists(dst_file) and \
+            os.path.getmtime(dst_file) >= os.path.getmtime(src_file):
+        return src_file, 'skipped', time.time() - startTime
+
+    if not os.path.isdir(os.path.dirname(dst_file)):
+        try:
+            os.makedirs(os.path.dirname(dst_file))
+        except OSError:
+            pass        # created by another worker
+
+    tmp_file = dst_file+'.ingest_tmp'
+    try:
+        if os.path.splitext(src_file)[1].lower() not in raster_ext:
+            if src_file != dst_file:
+                shutil.copy2(src_file, dst_file)
+                return src_file, 'copied', time.time() - startTime
+            return src_file, 'skipped', time.time() - startTime
+
+        from osgeo import gdal
+        gdal.UseExceptions()
+            # the threads of this worker - its share of the CPUs (see: ingest_archive)
+        gdal.SetConfigOption('GDAL_NUM_THREADS', str(options['threads']))
+        src_ds = gdal.Open(src_file)
+        if not options['force'] and is_cog(src_ds):
+            src_ds = None
+            if src_file != dst_file:
+                shutil.copy2(src_file, dst_file)
+                return src_file, 'copied', time.time() - startTime
+            return src_file, 'skipped', time.time() - startTime
+
+            # the cloud masks are thematic - their overviews must not be averaged
+        if scene_catalog.is_mask(os.path.basename(src_file)):
+            resampling = 'NEAREST'
+        else:
+            resampling = 'AVERAGE'
+
+        if gdal.GetDriverByName('COG') is not None:
+            creation_options = ['COMPRESS='+options['compress'], 'BLOCKSIZE='+str(options['blocksize']),
+                                'OVERVIEW_RESAMPLING='+resampling, 'NUM_THREADS='+str(options['threads'])]
+            if options['compress'] in ('DEFLATE', 'LZW', 'ZSTD'):
+                creation_options.append('PREDICTOR=YES')
+            dst_ds = gdal.GetDriverByName('COG').CreateCopy(tmp_file, src_ds, 0, creation_options)
+        else:
+                # GDAL < 3.1:  build the overviews on an in-memory copy, then write the tiles and
+                # the overviews in COG order (COPY_SRC_OVERVIEWS)
+            mem_ds = gdal.GetDriverByName('MEM').CreateCopy('', src_ds, 0)
+            overview_sizes = []
+            factor = 2
+            while max(src_ds.RasterXSize, src_ds.RasterYSize) / factor >= options['blocksize']:
+                overview_sizes.append(factor)
+                factor = factor * 2
+            if len(overview_sizes) > 0:
+                mem_ds.BuildOverviews(resampling, overview_sizes)
+            creation_options = ['TILED=YES', 'COPY_SRC_OVERVIEWS=YES', 'COMPRESS='+options['compress'],
+                                'BLOCKXSIZE='+str(options['blocksize']), 'BLOCKYSIZE='+str(options['blocksize'])]
+            dst_ds = gdal.GetDriverByName('GTiff').CreateCopy(tmp_file, mem_ds, 0, creation_options)
+            mem_ds = None
+
+        dst_ds = None
+        src_ds = None
+        os.rename(tmp_file, dst_file)
+
+    except Exception as e:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return src_file, '[Error] -- ' + str(e), time.time() - startTime
+
+    return src_file, 'converted', time.time() - startTime
+
+
+#/************************************************************************/
+#/*                          ingest_archive()                            */
+#/************************************************************************/
+
+def ingest_archive(archive_dir, target_dir, options, num_jobs):
+    """
+        convert all files of the archive in parallel
+        Returns:  number of failed files
+    """
+        # each of the num_jobs worker processes gets its share of the CPUs for the
+        # multithreaded compression - not ALL_CPUS each, i.e. cpu_count^2 threads
+    options = dict(options)
+    options['threads'] = max(1, multiprocessing.cpu_count() // max(num_jobs, 1))
+
+    tasks = []
+    for root, dd, files in os.walk(archive_dir):
+        for ff in files:
+            if ff.endswith('.ingest_tmp'):
+                continue
+            src_file = os.path.join(root, ff)
+            dst_file = os.path.join(target_dir, os.path.relpath(src_file, archive_dir))
+            tasks.append((src_file, dst_file, options))
+
+    print 'Ingesting ', len(tasks), ' files from: ', archive_dir, ' to: ', target_dir, ' using ', num_jobs, ' processes (', options['threads'], ' threads each)'
+
+    failed = 0
+    pool = multiprocessing.Pool(num_jobs)
+    try:
+        for cnt, (src_file, status, seconds) in enumerate(pool.imap_unordered(convert_scene, tasks)):
+            print '[%d/%d] %s: %s (%.1f sec)' % (cnt+1, len(tasks), status, src_file, seconds)
+            if status.startswith('[Error]'):
+                failed += 1
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    pool.join()
+
+    return failed
+
+
+#/************************************************************************/
+#/*                            main()                                    */
+#/************************************************************************/
+
+def main():
+    """
+        Main function: convert the archive and register it in the scene catalog
+    """
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hi:o:j:c:b:f:", ["help", "input=", "output=", "jobs=",
+                    "compress=", "blocksize=", "config=", "force"])
+    except getopt.GetoptError, err:
+        print '[Error] -- ', str(err)
+        usage()
+
+    archive_dir = None
+    target_dir = None
+    config_file = default_config_file
+    num_jobs = multiprocessing.cpu_count()
+    options = {'compress': 'DEFLATE', 'blocksize': 512, 'force': False}
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+        elif opt in ("-i", "--input"):
+            archive_dir = os.path.abspath(arg)
+        elif opt in ("-o", "--output"):
+            target_dir = os.path.abspath(arg)
+        elif opt in ("-j", "--jobs"):
+            num_jobs = int(arg)
+        elif opt in ("-c", "--compress"):
+            options['compress'] = str.upper(arg)
+        elif opt in ("-b", "--blocksize"):
+            options['blocksize'] = int(arg)
+        elif opt in ("-f", "--config"):
+            config_file = arg
+        elif opt == "--force":
+            options['force'] = True
+
+    if archive_dir is None or not os.path.isdir(archive_dir):
+        print '[Error] -- the archive directory is missing or does not exist: ', archive_dir
+        usage()
+    if target_dir is None:
+        target_dir = archive_dir
+
+    startTime = time.time()
+    failed = ingest_archive(archive_dir, target_dir, options, num_jobs)
+    print 'Ingest - RUNTIME in sec: ', time.time() - startTime, '  failed: ', failed
+
+        # register the ingested files (incl. their footprints) in the scene catalog
+    settings = get_config(config_file)
+    if settings.get('general.def_catalog', '') != '':
+        catalog = scene_catalog.SceneCatalog(settings['general.def_catalog'])
+        catalog.refresh(target_dir, force=True)
+        catalog.update_footprints(target_dir)
+        catalog.close()
+        print 'Registered in the scene catalog: ', settings['general.def_catalog']
+
+    if failed > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
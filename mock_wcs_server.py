@@ -0,0 +1,560 @@
+#!/usr/bin/env python
+#
+#------------------------------------------------------------------------------
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+#
+#
+#       Local stand-in for an EO-WCS (EOxServer) instance, for testing and
+#       benchmarking the wcsClient and the dataset readers without access to the
+#       production servers.
+#       It implements the subset of requests used by the wcsClient:
+#         - GetCapabilities (DatasetSeriesSummary)
+#         - DescribeEOCoverageSet (time and AOI subsetting)
+#         - GetCoverage (AOI subsetting, rangesubsetting, GeoTIFF output)
+#       and serves synthetic multi-band coverages and cloud masks.
+#       Latency, bandwidth limits and failures can be injected.
+#
+#       Usage:   mock_wcs_server.py  (-h|--help) for the available options
+#
+#
+# Project: DeltaDREAM
+# Name:    mock_wcs_server.py
+# Authors: Christian Schiller <christian dot schiller at eox dot at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2014 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+#
+#
+
+import sys
+import os
+import time
+import datetime
+import getopt
+import random
+import re
+import struct
+import array
+import threading
+import urllib
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+from wcs_client import TokenBucket
+
+
+
+    # default DatasetSeries served: name -> number of bands (0 = cloud mask)
+    # the names correspond to the [dataset] entries of the cloudless_config.cfg
+default_series = {'Landsat5_2A': 6,
+                  'Landsat5_Mask_Clouds': 0,
+                  'Spot4Take5_N2A_PENTE': 4,
+                  'Spot4Take5_N2A_NUA': 0 }
+
+    # default extent of the series:  minx, maxx, miny, maxy  (WGS84)
+default_bbox = [3.0, 4.5, 43.0, 44.5]
+
+    # max. size (pixel) of one side of a delivered coverage
+max_size = 4000
+
+
+#/************************************************************************/
+#/*                               usage()                                */
+#/************************************************************************/
+
+def usage():
+    """
+        Print out the Usage information
+    """
+    print ""
+    print "Usage: mock_wcs_server.py  ([-p|--port] <port>) ([-l|--latency] <sec>) ([-j|--jitter] <sec>) "
+    print "                  ([-w|--bandwidth] <bytes/sec>) ([-f|--fail_rate] <0..1>) ([-g|--hang_rate] <0..1>) "
+    print "                  ([-s|--start] <date>) ([-e|--end] <date>) ([-r|--revisit] <days>) ([-x|--resolution] <deg>)"
+    print " "
+    print "  Local stand-in for an EO-WCS server, serving synthetic coverages and cloud masks "
+    print "  of the DatasetSeries: ", ', '.join(sorted(default_series.keys()))
+    print "  The server is available at:  http://localhost:<port>/ows? "
+    print "  OPTIONAL parameters: "
+    print "   -h|--help                 --  This help information"
+    print "   -p|--port <port>          --  port to listen at [default=8080]"
+    print "   -l|--latency <sec>        --  latency added to every request [default=0]"
+    print "   -j|--jitter <sec>         --  max. random latency added on top of the latency [default=0]"
+    print "   -w|--bandwidth <bytes/s>  --  max. bandwidth shared by all responses [default=0=unlimited]"
+    print "   -f|--fail_rate <0..1>     --  fraction of requests answered with 'HTTP 503' [default=0]"
+    print "   -g|--hang_rate <0..1>     --  fraction of requests which hang for 'hang_time' sec [default=0]"
+    print "   -t|--hang_time <sec>      --  time a hanging request waits before responding [default=60]"
+    print "   -s|--start <YYYYMMDD>     --  first acquisition date of the series [default=20110101]"
+    print "   -e|--end <YYYYMMDD>       --  last acquisition date of the series [default=20111231]"
+    print "   -r|--revisit <days>       --  days between two acquisitions [default=4]"
+    print "   -x|--resolution <deg>     --  pixel size of the coverages [default=0.00027 = ~30m]"
+    print " "
+    print "Example: ./mock_wcs_server.py -p 8080 -l 0.2 -j 0.5 -f 0.05 "
+    print " "
+    sys.exit()
+
+
+#/************************************************************************/
+#/*                            write_tiff()                              */
+#/************************************************************************/
+
+def write_tiff(width, height, nbands, bits, pixel_data, bbox):
+    """
+        Creates a minimal (uncompressed, single strip, pixel-interleaved) GeoTIFF
+        in EPSG:4326 from the supplied raw pixel_data (string).
+        bits: 8 or 16 (unsigned integer samples)
+        Returns: the GeoTIFF as string
+    """
+    res_x = (bbox[1] - bbox[0]) / float(width)
+    res_y = (bbox[3] - bbox[2]) / float(height)
+
+        # entries: (tag, type, count, value(s)) - types: 3=SHORT, 4=LONG, 12=DOUBLE
+    entries = [(256, 4, 1, [width]),
+               (257, 4, 1, [height]),
+               (258, 3, nbands, [bits] * nbands),
+               (259, 3, 1, [1]),
+               (262, 3, 1, [1]),
+               (273, 4, 1, [0]),
+               (277, 3, 1, [nbands]),
+               (278, 4, 1, [height]),
+               (279, 4, 1, [len(pixel_data)]),
+               (284, 3, 1, [1]),
+               (339, 3, nbands, [1] * nbands),
+               (33550, 12, 3, [res_x, res_y, 0.0]),
+               (33922, 12, 6, [0.0, 0.0, 0.0, bbox[0], bbox[3], 0.0]),
+                   # GeoKeyDirectory: GTModelType=Geographic, GTRasterType=PixelIsArea, GeographicType=4326
+               (34735, 3, 16, [1, 1, 0, 3,  1024, 0, 1, 2,  1025, 0, 1, 1,  2048, 0, 1, 4326])]
+
+    fmt = {3: 'H', 4: 'I', 12: 'd'}
+    size = {3: 2, 4: 4, 12: 8}
+
+    ifd_offset = 8
+    ifd_size = 2 + len(entries) * 12 + 4
+    extra_offset = ifd_offset + ifd_size
+    extra = ''
+    data_offset = None
+
+        # values not fitting into the 4 bytes of an entry are stored behind the IFD
+    for (tag, ftype, count, values) in entries:
+        if count * size[ftype] > 4:
+            extra += struct.pack('<%d%s' % (count, fmt[ftype]), *values)
+            if len(extra) % 2:
+                extra += '\0'
+    data_offset = extra_offset + len(extra)
+
+    ifd = struct.pack('<H', len(entries))
+    extra_pos = extra_offset
+    for (tag, ftype, count, values) in entries:
+        if tag == 273:
+            values = [data_offset]
+        packed = struct.pack('<%d%s' % (count, fmt[ftype]), *values)
+        if len(packed) > 4:
+            ifd += struct.pack('<HHII', tag, ftype, count, extra_pos)
+            extra_pos += len(packed) + (len(packed) % 2)
+        else:
+            ifd += struct.pack('<HHI', tag, ftype, count) + packed.ljust(4, '\0')
+    ifd += struct.pack('<I', 0)
+
+    return 'II' + struct.pack('<HI', 42, ifd_offset) + ifd + extra + pixel_data
+
+
+#/************************************************************************/
+#/*                          MockCoverages()                             */
+#/************************************************************************/
+
+class MockCoverages(object):
+    """
+        The synthetic DatasetSeries and their coverages.
+        CoverageIDs are formed as <DatasetSeriesId>_<YYYYMMDD>, so images and
+        cloud masks of the same acquisition can be matched by date.
+    """
+    def __init__(self, start='20110101', end='20111231', revisit=4, resolution=0.00027,
+                 series=None, bbox=None):
+        self.series = series or default_series
+        self.bbox = bbox or default_bbox
+        self.resolution = float(resolution)
+        self.dates = []
+        cur = datetime.datetime.strptime(start, '%Y%m%d')
+        last = datetime.datetime.strptime(end, '%Y%m%d')
+        while cur <= last:
+            self.dates.append(cur)
+            cur += datetime.timedelta(days=int(revisit))
+
+    def coverage_ids(self, eoid, begin=None, end=None, aoi=None):
+        """
+            the coverageIDs of a series, within the time range and touching the aoi
+        """
+        if not self.series.has_key(eoid):
+            return None
+        if aoi is not None and (aoi[0] > self.bbox[1] or aoi[1] < self.bbox[0] or
+                                aoi[2] > self.bbox[3] or aoi[3] < self.bbox[2]):
+            return []
+
+        cids = []
+        for date in self.dates:
+            if begin is not None and date < begin:
+                continue
+            if end is not None and date > end:
+                continue
+            cids.append(eoid + '_' + date.strftime('%Y%m%d'))
+
+        return cids
+
+    def split_id(self, coverage_id):
+        eoid, date = coverage_id.rsplit('_', 1)
+        if not self.series.has_key(eoid) or not re.match(r'^\d{8}$', date):
+            return None, None
+        return eoid, date
+
+    def render(self, coverage_id, aoi=None, bands=None):
+        """
+            create the synthetic GeoTIFF of the coverage (subset by the aoi [minx, maxx, miny, maxy]
+            and the list of bands)
+            Returns:  the GeoTIFF as string  or  None if the coverage does not exist
+        """
+        eoid, date = self.split_id(coverage_id)
+        if eoid is None:
+            return None
+
+        bbox = list(self.bbox)
+        if aoi is not None:
+            bbox = [max(aoi[0], bbox[0]), min(aoi[1], bbox[1]), max(aoi[2], bbox[2]), min(aoi[3], bbox[3])]
+        width = min(max(int(round((bbox[1] - bbox[0]) / self.resolution)), 1), max_size)
+        height = min(max(int(round((bbox[3] - bbox[2]) / self.resolution)), 1), max_size)
+
+            # reproducible pixel values for each acquisition
+        rnd = random.Random(date)
+        nbands = self.series[eoid]
+
+        if nbands == 0:
+                # cloud mask - a few round clouds (value 1) on clear sky (0)
+            clouds = []
+            for idx in range(rnd.randint(1, 6)):
+                clouds.append((rnd.uniform(0, width), rnd.uniform(0, height), rnd.uniform(0.05, 0.3) * width))
+            rows = []
+            for yy in range(height):
+                row = bytearray(width)
+                for (cx, cy, rad) in clouds:
+                    dy = abs(yy - cy)
+                    if dy < rad:
+                        dx = (rad**2 - dy**2) ** 0.5
+                        x0 = max(int(cx - dx), 0)
+                        x1 = min(int(cx + dx), width)
+                        if x1 > x0:
+                            row[x0:x1] = '\1' * (x1 - x0)
+                rows.append(str(row))
+
+            return write_tiff(width, height, 1, 8, ''.join(rows), bbox)
+
+        if bands is None:
+            bands = range(1, nbands+1)
+        bands = [bb for bb in bands if 1 <= bb <= nbands] or [1]
+
+            # image - a noise pattern per band, shifted from row to row
+        pattern = array.array('H', [rnd.randint(0, 10000) for idx in range((width + height) * len(bands))])
+        if sys.byteorder == 'big':
+            pattern.byteswap()
+        nsamples = width * len(bands)
+        rows = []
+        for yy in range(height):
+            shift = yy * len(bands)
+            rows.append(pattern[shift:shift + nsamples].tostring())
+
+        return write_tiff(width, height, len(bands), 16, ''.join(rows), bbox)
+
+
+#/************************************************************************/
+#/*                        MockWCSRequestHandler()                       */
+#/************************************************************************/
+
+class MockWCSRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+        handles the requests sent to the MockWCSServer
+    """
+    server_version = 'MockEO-WCS/0.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def send_xml(self, code, xml):
+        self.send_body(code, xml, 'text/xml')
+
+    def send_exception(self, code, exc_code, text):
+        xml = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<ows:ExceptionReport xmlns:ows="http://www.opengis.net/ows/2.0" version="2.0.0">'
+               '<ows:Exception exceptionCode="%s"><ows:ExceptionText>%s</ows:ExceptionText>'
+               '</ows:Exception></ows:ExceptionReport>' % (exc_code, text))
+        self.send_xml(code, xml)
+
+    def send_body(self, code, body, content_type):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        pos = 0
+        while pos < len(body):
+            chunk = body[pos:pos+65536]
+            self.server.bandwidth.consume(len(chunk))
+            self.wfile.write(chunk)
+            pos += len(chunk)
+
+    def do_GET(self):
+        srv = self.server
+        srv.count_request()
+
+            # injected latency and failures
+        delay = srv.latency + random.uniform(0, srv.jitter)
+        if random.random() < srv.hang_rate:
+            delay += srv.hang_time
+        if delay > 0:
+            time.sleep(delay)
+        if random.random() < srv.fail_rate:
+            self.send_exception(503, 'ServiceUnavailable', 'Injected failure')
+            return
+
+        parts = urlparse.urlsplit(self.path)
+        params = {}
+        subsets = []
+        for key, value in urlparse.parse_qsl(parts[3], keep_blank_values=True):
+            if key.lower() == 'subset':
+                subsets.append(urllib.unquote(value))
+            else:
+                params[key.lower()] = value
+
+        req = params.get('request', '').lower()
+        try:
+            if req == 'getcapabilities':
+                self.send_xml(200, self.get_capabilities())
+            elif req == 'describeeocoverageset':
+                self.describe_eo_coverage_set(params, subsets)
+            elif req == 'getcoverage':
+                self.get_coverage(params, subsets)
+            else:
+                self.send_exception(400, 'OperationNotSupported', 'Request not supported: '+req)
+        except ValueError as err:
+            self.send_exception(400, 'InvalidParameterValue', str(err))
+
+    def get_capabilities(self):
+        cov = self.server.coverages
+        xml = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<wcs:Capabilities xmlns:wcs="http://www.opengis.net/wcs/2.0" '
+               'xmlns:wcseo="http://www.opengis.net/wcseo/1.0" xmlns:ows="http://www.opengis.net/ows/2.0" '
+               'xmlns:gml="http://www.opengis.net/gml/3.2" version="2.0.1">'
+               '<ows:ServiceIdentification><ows:Title>Mock EO-WCS</ows:Title></ows:ServiceIdentification>'
+               '<wcs:Contents><wcs:Extension>']
+        for eoid in sorted(cov.series.keys()):
+            xml.append('<wcseo:DatasetSeriesSummary>'
+                       '<ows:WGS84BoundingBox><ows:LowerCorner>%s %s</ows:LowerCorner>'
+                       '<ows:UpperCorner>%s %s</ows:UpperCorner></ows:WGS84BoundingBox>'
+                       '<wcseo:DatasetSeriesId>%s</wcseo:DatasetSeriesId>'
+                       '<gml:TimePeriod gml:id="%s_timeperiod"><gml:beginPosition>%s</gml:beginPosition>'
+                       '<gml:endPosition>%s</gml:endPosition></gml:TimePeriod></wcseo:DatasetSeriesSummary>'
+                       % (cov.bbox[0], cov.bbox[2], cov.bbox[1], cov.bbox[3], eoid, eoid,
+                          cov.dates[0].strftime('%Y-%m-%dT00:00:00Z'), cov.dates[-1].strftime('%Y-%m-%dT00:00:00Z')))
+        xml.append('</wcs:Extension></wcs:Contents></wcs:Capabilities>')
+
+        return ''.join(xml)
+
+    def describe_eo_coverage_set(self, params, subsets):
+        aoi, times = parse_subsets(subsets)
+        begin = end = None
+        if times is not None:
+            begin = parse_time(times[0])
+            end = parse_time(times[1])
+
+        cids = self.server.coverages.coverage_ids(params.get('eoid'), begin, end, aoi)
+        if cids is None:
+            self.send_exception(404, 'NoSuchDatasetSeriesOrCoverage', 'Unknown eoID: '+str(params.get('eoid')))
+            return
+
+        xml = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<wcseo:EOCoverageSetDescription xmlns:wcs="http://www.opengis.net/wcs/2.0" '
+               'xmlns:wcseo="http://www.opengis.net/wcseo/1.0" numberMatched="%d" numberReturned="%d">'
+               '<wcs:CoverageDescriptions>' % (len(cids), len(cids))]
+        for cid in cids:
+            xml.append('<wcs:CoverageDescription><wcs:CoverageId>%s</wcs:CoverageId></wcs:CoverageDescription>' % cid)
+        xml.append('</wcs:CoverageDescriptions></wcseo:EOCoverageSetDescription>')
+
+        self.send_xml(200, ''.join(xml))
+
+    def get_coverage(self, params, subsets):
+        aoi, times = parse_subsets(subsets)
+        bands = None
+        if params.get('rangesubset'):
+            bands = [int(bb) for bb in params['rangesubset'].split(',')]
+
+        tiff = self.server.coverages.render(params.get('coverageid', ''), aoi, bands)
+        if tiff is None:
+            self.send_exception(404, 'NoSuchCoverage', 'Unknown coverageID: '+str(params.get('coverageid')))
+            return
+
+        self.send_body(200, tiff, 'image/tiff')
+
+
+#/************************************************************************/
+#/*                         parse_subsets()                              */
+#/************************************************************************/
+
+def parse_subsets(subsets):
+    """
+        parse the (url-decoded) subset parameters of a request, e.g.
+            Long,http://www.opengis.net/def/crs/EPSG/0/4326(3.5,3.6)
+            phenomenonTime("2011-05-01T00:00Z","2011-05-13T23:59Z")
+        Returns:  aoi [minx, maxx, miny, maxy] (or None)  and  [begin, end] time (or None)
+    """
+    aoi = None
+    times = None
+    lon = lat = None
+    for subset in subsets:
+        match = re.match(r'^\s*(\w+)(?:,[^(]*)?\((.*)\)\s*$', subset)
+        if match is None:
+            raise ValueError('Invalid subset: '+subset)
+        axis = match.group(1).lower()
+        values = [elem.strip().strip('"') for elem in match.group(2).split(',')]
+        if axis in ('long', 'lon', 'x'):
+            lon = [float(values[0]), float(values[-1])]
+        elif axis in ('lat', 'y'):
+            lat = [float(values[0]), float(values[-1])]
+        elif axis == 'phenomenontime':
+            times = [values[0], values[-1]]
+
+    if lon is not None and lat is not None:
+        aoi = [min(lon), max(lon), min(lat), max(lat)]
+
+    return aoi, times
+
+
+def parse_time(value):
+    """
+        parse an ISO-8601 date/time of the form used by the wcsClient
+    """
+    value = value.rstrip('Z')
+    for fmt in ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H", "%Y-%m-%d"):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+
+    raise ValueError('Invalid time: '+value)
+
+
+#/************************************************************************/
+#/*                           MockWCSServer()                            */
+#/************************************************************************/
+
+class MockWCSServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+        Threaded mock EO-WCS server; can be started in-process (e.g. by benchmarks)
+        with:   server = MockWCSServer(port=0); server.start(); ...; server.stop()
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=8080, latency=0, jitter=0, bandwidth=0, fail_rate=0, hang_rate=0,
+                 hang_time=60, coverages=None, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', int(port)), MockWCSRequestHandler)
+        self.latency = float(latency)
+        self.jitter = float(jitter)
+        self.bandwidth = TokenBucket(bandwidth)
+        self.fail_rate = float(fail_rate)
+        self.hang_rate = float(hang_rate)
+        self.hang_time = float(hang_time)
+        self.coverages = coverages or MockCoverages()
+        self.verbose = verbose
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/ows?' % self.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+#/************************************************************************/
+#/*                               main()                                 */
+#/************************************************************************/
+
+def main():
+    """
+        Main function: start the mock server according to the cmd-line options
+    """
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hp:l:j:w:f:g:t:s:e:r:x:", ["help", "port=", "latency=",
+                    "jitter=", "bandwidth=", "fail_rate=", "hang_rate=", "hang_time=", "start=", "end=",
+                    "revisit=", "resolution="])
+    except getopt.GetoptError, err:
+        print '[Error] -- ', str(err)
+        usage()
+
+    server_params = {'port': 8080, 'verbose': True}
+    cov_params = {}
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+        elif opt in ("-p", "--port"):
+            server_params['port'] = int(arg)
+        elif opt in ("-l", "--latency"):
+            server_params['latency'] = float(arg)
+        elif opt in ("-j", "--jitter"):
+            server_params['jitter'] = float(arg)
+        elif opt in ("-w", "--bandwidth"):
+            server_params['bandwidth'] = float(arg)
+        elif opt in ("-f", "--fail_rate"):
+            server_params['fail_rate'] = float(arg)
+        elif opt in ("-g", "--hang_rate"):
+            server_params['hang_rate'] = float(arg)
+        elif opt in ("-t", "--hang_time"):
+            server_params['hang_time'] = float(arg)
+        elif opt in ("-s", "--start"):
+            cov_params['start'] = arg
+        elif opt in ("-e", "--end"):
+            cov_params['end'] = arg
+        elif opt in ("-r", "--revisit"):
+            cov_params['revisit'] = int(arg)
+        elif opt in ("-x", "--resolution"):
+            cov_params['resolution'] = float(arg)
+
+    server = MockWCSServer(coverages=MockCoverages(**cov_params), **server_params)
+    print 'Mock EO-WCS server available at: ', server.url
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
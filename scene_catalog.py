@@ -0,0 +1,449 @@
+#!/usr/bin/env python
+#
+#------------------------------------------------------------------------------
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+#
+#
+#       Persistent catalog (SQLite) of the scenes stored in local archives,
+#       used by the local ('_f', '_m') dataset readers instead of walking
+#       the directory trees on every file search.
+#       For every file it holds: path, acquisition date and sensor (parsed
+#       from the filename), and for images the path of the cloud mask.
+#       The catalog is refreshed incrementally - only directories whose
+#       modification time has changed are re-read.
+#       The footprints (lon/lat bounding boxes) of the images are kept in an
+#       R-tree index, so scenes can be selected by AOI and time window.
+#
+#
+# Project: DeltaDREAM
+# Name:    scene_catalog.py
+# Authors: Christian Schiller <christian dot schiller at eox dot at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2014 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+#
+#
+
+import os
+import os.path
+import re
+import datetime
+import time
+import threading
+import sqlite3
+
+
+    # a date (YYYYMMDD) within a filename or coverage ID, optionally followed by the time
+    # (hhmm or hhmmss), but not being part of a longer number
+_date_pattern = re.compile(r'(?<!\d)((?:19|20)\d{6})(?=\d{4}(?!\d)|\d{6}(?!\d)|(?!\d))')
+
+_schema = """
+    CREATE TABLE IF NOT EXISTS dirs (
+        path TEXT PRIMARY KEY,
+        parent TEXT,
+        mtime REAL );
+    CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+
+    CREATE TABLE IF NOT EXISTS files (
+        path TEXT PRIMARY KEY,
+        dirname TEXT,
+        basename TEXT,
+        acq_date TEXT,
+        sensor TEXT,
+        is_mask INTEGER,
+        mask_path TEXT );
+    CREATE INDEX IF NOT EXISTS files_dir ON files (dirname, basename);
+    CREATE INDEX IF NOT EXISTS files_date ON files (acq_date);
+
+        -- id = rowid of the image in files, mtime = of the image the footprint was read from
+    CREATE TABLE IF NOT EXISTS footprint_src (
+        id INTEGER PRIMARY KEY,
+        mtime REAL );
+"""
+
+    # the footprints (EPSG:4326) - an R-tree if SQLite supports it, a plain table otherwise
+_rtree_schema = 'CREATE VIRTUAL TABLE IF NOT EXISTS footprints USING rtree (id, minx, maxx, miny, maxy)'
+_table_schema = 'CREATE TABLE IF NOT EXISTS footprints (id INTEGER PRIMARY KEY, minx REAL, maxx REAL, miny REAL, maxy REAL)'
+
+
+#/************************************************************************/
+#/*                          parse_acq_date()                            */
+#/************************************************************************/
+
+def parse_acq_date(basename):
+    """
+        get the acquisition date from a filename or coverage ID (first valid YYYYMMDD found)
+        Returns:  'YYYYMMDD'  or  None
+    """
+    for match in _date_pattern.finditer(basename):
+        try:
+            datetime.datetime.strptime(match.group(1), '%Y%m%d')
+            return match.group(1)
+        except ValueError:
+            pass
+
+    return None
+
+
+#/************************************************************************/
+#/*                            parse_sensor()                            */
+#/************************************************************************/
+
+def parse_sensor(basename):
+    """
+        get the sensor from a filename e.g. SPOT4_HRVIR1_XS_20130216_... -> SPOT4,
+        L*_20110513_L5_..._surf_pente_30m.tif -> L5
+    """
+    if basename.upper().startswith('SPOT'):
+        return basename.split('_')[0].upper()
+    match = re.search(r'_(L\d)_', basename)
+    if match is not None:
+        return match.group(1)
+
+    return basename.split('_')[0]
+
+
+#/************************************************************************/
+#/*                              is_mask()                               */
+#/************************************************************************/
+
+def is_mask(basename):
+    """
+        tests if a filename is a cloud mask:  Landsat:  <base>.nuages.<ext>,
+        SPOT4Take5:  *_NUA.TIF
+    """
+    return '.nuages' in basename or basename.upper().endswith('_NUA.TIF')
+
+
+#/************************************************************************/
+#/*                           glob_pattern()                             */
+#/************************************************************************/
+
+def glob_pattern(inmask):
+    """
+        convert a shell-style wildcard pattern (fnmatch) into the SQLite GLOB syntax
+    """
+    return inmask.replace('[!', '[^')
+
+
+#/************************************************************************/
+#/*                           get_footprint()                            */
+#/************************************************************************/
+
+def get_footprint(filename, steps=10):
+    """
+        read the footprint of a raster from its geotransform/projection, the borders
+        are densified (steps) before the transformation to EPSG:4326
+        Returns:  (minx, maxx, miny, maxy)  or  None (no GDAL or no georeferencing)
+    """
+    try:
+        from osgeo import gdal, osr
+    except ImportError:
+        return None
+
+    ds = gdal.Open(filename)
+    if ds is None or ds.GetProjection() == '':
+        return None
+
+    gt = ds.GetGeoTransform()
+    src_srs = osr.SpatialReference()
+    src_srs.ImportFromWkt(ds.GetProjection())
+    dst_srs = osr.SpatialReference()
+    dst_srs.ImportFromEPSG(4326)
+        # GDAL >= 3 would otherwise use lat/lon axis order for EPSG:4326
+    if hasattr(dst_srs, 'SetAxisMappingStrategy'):
+        src_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        dst_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    transform = osr.CoordinateTransformation(src_srs, dst_srs)
+
+    xsize = ds.RasterXSize
+    ysize = ds.RasterYSize
+    lons = []
+    lats = []
+    for ii in range(steps+1):
+        for pix, line in ((xsize*ii/float(steps), 0), (xsize*ii/float(steps), ysize),
+                          (0, ysize*ii/float(steps)), (xsize, ysize*ii/float(steps))):
+            lon, lat, zz = transform.TransformPoint(gt[0] + pix*gt[1] + line*gt[2],
+                                                    gt[3] + pix*gt[4] + line*gt[5])
+            lons.append(lon)
+            lats.append(lat)
+
+    ds = None
+
+    return min(lons), max(lons), min(lats), max(lats)
+
+
+#/************************************************************************/
+#/*                            SceneCatalog()                            */
+#/************************************************************************/
+
+class SceneCatalog(object):
+    """
+        Persistent catalog of the files in local archives.
+         - refresh(root):  update the catalog for the directory tree below root
+           (re-checked at most every max_age seconds)
+         - findfile(indir, inmask):  like dataset_reader.findfile, but using the catalog
+         - get_maskname(filename):  the cloud mask of an image
+         - query(indir, inmask, aoi, toi):  the images intersecting the AOI within the time window
+    """
+    def __init__(self, db_file, max_age=10):
+        if db_file != ':memory:' and not os.path.isdir(os.path.dirname(os.path.abspath(db_file))):
+            os.makedirs(os.path.dirname(os.path.abspath(db_file)))
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.executescript(_schema)
+        try:
+            self.conn.execute(_rtree_schema)
+        except sqlite3.OperationalError:
+            self.conn.execute(_table_schema)
+        self.lock = threading.RLock()
+            # the directory trees refreshed (by this process) within the last max_age sec:  {(root, recursive): time}
+        self.fresh = {}
+        self.max_age = max_age
+
+#---------
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+#---------
+    def refresh(self, root, recursive=True, force=False):
+        """
+            Bring the catalog up to date for all directories below root (or for root
+            only if recursive=False). Directories with unchanged modification time are
+            not re-read. A tree refreshed less than max_age sec ago is not checked again
+            unless force=True - so a long running process (daemon) sees new scenes.
+            Returns:  number of re-read directories
+        """
+        root = os.path.abspath(root)
+        now = time.time()
+        if not force and max(self.fresh.get((root, recursive), 0), self.fresh.get((root, True), 0)) > now - self.max_age:
+            return 0
+
+        changed = []
+        with self.lock:
+            stack = [root]
+            while len(stack) > 0:
+                cur_dir = stack.pop()
+                try:
+                    mtime = os.stat(cur_dir).st_mtime
+                except OSError:
+                    self._remove_dir(cur_dir)
+                    continue
+
+                row = self.conn.execute('SELECT mtime FROM dirs WHERE path = ?', (cur_dir,)).fetchone()
+                if row is None or row[0] != mtime:
+                    self._scan_dir(cur_dir, mtime)
+                    changed.append(cur_dir)
+
+                if recursive:
+                    for (sub_dir,) in self.conn.execute('SELECT path FROM dirs WHERE parent = ?', (cur_dir,)):
+                        stack.append(sub_dir)
+
+                # the masks are located in the same or in a sub-directory of the images
+            if len(changed) > 0:
+                self._resolve_masks(set(changed) | set([os.path.dirname(elem) for elem in changed]))
+            self.conn.commit()
+
+        self.fresh[(root, recursive)] = now
+
+        return len(changed)
+
+#---------
+    def _scan_dir(self, cur_dir, mtime):
+        """
+            re-read the entries of a single directory
+        """
+        try:
+            entries = os.listdir(cur_dir)
+        except OSError:
+            entries = []
+
+        files = []
+        sub_dirs = []
+        for entry in entries:
+            path = os.path.join(cur_dir, entry)
+            if os.path.isdir(path):
+                sub_dirs.append(path)
+            else:
+                files.append((path, cur_dir, entry, parse_acq_date(entry), parse_sensor(entry),
+                              int(is_mask(entry))))
+
+            # remove vanished files and sub-directories
+        known = set([row[0] for row in self.conn.execute('SELECT path FROM files WHERE dirname = ?', (cur_dir,))])
+        for path in known - set([elem[0] for elem in files]):
+            self._delete_files('path = ?', (path,))
+        known = set([row[0] for row in self.conn.execute('SELECT path FROM dirs WHERE parent = ?', (cur_dir,))])
+        for path in known - set(sub_dirs):
+            self._remove_dir(path)
+
+        self.conn.executemany('INSERT OR IGNORE INTO files (path, dirname, basename, acq_date, sensor, is_mask) '
+                              'VALUES (?, ?, ?, ?, ?, ?)', files)
+            # new sub-directories get scanned (no mtime yet)
+        self.conn.executemany('INSERT OR IGNORE INTO dirs (path, parent, mtime) VALUES (?, ?, NULL)',
+                              [(path, cur_dir) for path in sub_dirs])
+        self.conn.execute('INSERT OR REPLACE INTO dirs (path, parent, mtime) VALUES (?, ?, ?)',
+                          (cur_dir, os.path.dirname(cur_dir), mtime))
+
+#---------
+    def _remove_dir(self, cur_dir):
+        """
+            remove a directory tree from the catalog
+        """
+        prefix = cur_dir.rstrip(os.sep) + os.sep
+        self._delete_files('dirname = ? OR substr(dirname, 1, ?) = ?', (cur_dir, len(prefix), prefix))
+        self.conn.execute('DELETE FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?',
+                          (cur_dir, len(prefix), prefix))
+
+#---------
+    def _delete_files(self, where, args):
+        """
+            remove files (and their footprints) from the catalog
+        """
+        ids = [row[:1] for row in self.conn.execute('SELECT rowid FROM files WHERE ' + where, args)]
+        self.conn.executemany('DELETE FROM footprints WHERE id = ?', ids)
+        self.conn.executemany('DELETE FROM footprint_src WHERE id = ?', ids)
+        self.conn.execute('DELETE FROM files WHERE ' + where, args)
+
+#---------
+    def _update_footprints(self, rows):
+        """
+            (re-)read the footprints of the images (rowid, path) which are new or have been
+            modified since their footprint was read
+        """
+        for (file_id, path) in rows:
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            row = self.conn.execute('SELECT mtime FROM footprint_src WHERE id = ?', (file_id,)).fetchone()
+            if row is not None and row[0] == mtime:
+                continue
+
+            footprint = get_footprint(path)
+            self.conn.execute('DELETE FROM footprints WHERE id = ?', (file_id,))
+            if footprint is not None:
+                self.conn.execute('INSERT INTO footprints (id, minx, maxx, miny, maxy) VALUES (?, ?, ?, ?, ?)',
+                                  (file_id,) + tuple(footprint))
+            self.conn.execute('INSERT OR REPLACE INTO footprint_src (id, mtime) VALUES (?, ?)', (file_id, mtime))
+
+        self.conn.commit()
+
+#---------
+    def update_footprints(self, indir):
+        """
+            read the footprints of all images below indir, which are new or have been modified
+            (otherwise they are read on demand by query())
+        """
+        indir = os.path.abspath(indir)
+        self.refresh(indir)
+        prefix = indir.rstrip(os.sep) + os.sep
+        with self.lock:
+            self._update_footprints(self.conn.execute('SELECT rowid, path FROM files WHERE is_mask = 0 AND '
+                                                      '(dirname = ? OR substr(dirname, 1, ?) = ?)',
+                                                      (indir, len(prefix), prefix)).fetchall())
+
+#---------
+    def _resolve_masks(self, dirs):
+        """
+            find the cloud masks of the images in the directories:
+              - Landsat:     <base>.nuages<ext>  in the same directory
+              - SPOT4Take5:  MASK/<first 25 chars of basename>*_NUA.TIF
+        """
+        for cur_dir in dirs:
+            images = self.conn.execute('SELECT path, basename FROM files WHERE dirname = ? AND is_mask = 0',
+                                       (cur_dir,)).fetchall()
+            for (path, basename) in images:
+                base, extension = os.path.splitext(path)
+                row = self.conn.execute('SELECT path FROM files WHERE path = ?',
+                                        ("%s.nuages%s" % (base, extension),)).fetchone()
+                if row is None:
+                    row = self.conn.execute('SELECT path FROM files WHERE dirname = ? AND basename GLOB ? '
+                                            'ORDER BY basename LIMIT 1', (os.path.join(cur_dir, 'MASK'),
+                                            glob_pattern(basename[0:25].replace('[', '[[]') + '*_NUA.TIF'))).fetchone()
+                if row is not None:
+                    mask_path = row[0]
+                else:
+                    mask_path = None
+                self.conn.execute('UPDATE files SET mask_path = ? WHERE path = ?', (mask_path, path))
+
+#---------
+    def findfile(self, indir, inmask):
+        """
+            literal_directory, basename_pattern (simple shell-style wildcards), includes dot-files
+            no regex, but constructs like e.g. L5_[!a-f]*.tif , are possible
+            Returns:  list of the matching files in the directory tree below indir
+        """
+        indir = os.path.abspath(indir)
+        self.refresh(indir)
+        prefix = indir.rstrip(os.sep) + os.sep
+        with self.lock:
+            rows = self.conn.execute('SELECT path FROM files WHERE (dirname = ? OR substr(dirname, 1, ?) = ?) '
+                                     'AND basename GLOB ? ORDER BY path',
+                                     (indir, len(prefix), prefix, glob_pattern(inmask))).fetchall()
+
+        return [str(row[0]) for row in rows]
+
+#---------
+    def get_maskname(self, filename):
+        """
+            Returns:  the cloud mask of the image filename  or  None if unknown
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT mask_path FROM files WHERE path = ?',
+                                    (os.path.abspath(filename),)).fetchone()
+        if row is None or row[0] is None:
+            return None
+
+        return str(row[0])
+
+#---------
+    def query(self, indir, inmask, aoi=None, toi=None):
+        """
+            the images below indir, matching the basename pattern, whose footprint intersects
+            the aoi (minx, maxx, miny, maxy in EPSG:4326) and which were acquired within the
+            toi ('YYYY-MM-DD', 'YYYY-MM-DD'). Images without footprint or date are not excluded.
+            Returns:  list of files, sorted by acquisition date
+        """
+        indir = os.path.abspath(indir)
+        self.refresh(indir)
+        prefix = indir.rstrip(os.sep) + os.sep
+        where = '(dirname = ? OR substr(dirname, 1, ?) = ?) AND basename GLOB ?'
+        args = (indir, len(prefix), prefix, glob_pattern(inmask))
+
+        with self.lock:
+            if toi is not None:
+                where = where + ' AND (acq_date IS NULL OR acq_date BETWEEN ? AND ?)'
+                args = args + (toi[0].replace('-', '')[0:8], toi[1].replace('-', '')[0:8])
+
+            if aoi is not None:
+                self._update_footprints(self.conn.execute('SELECT rowid, path FROM files WHERE ' + where,
+                                                          args).fetchall())
+                aoi = [float(elem) for elem in aoi]
+                where = where + (' AND (rowid NOT IN (SELECT id FROM footprints) OR rowid IN '
+                                 '(SELECT id FROM footprints WHERE maxx >= ? AND minx <= ? AND maxy >= ? AND miny <= ?))')
+                args = args + (aoi[0], aoi[1], aoi[2], aoi[3])
+
+            rows = self.conn.execute('SELECT path FROM files WHERE ' + where + ' ORDER BY acq_date, path',
+                                     args).fetchall()
+
+        return [str(row[0]) for row in rows]
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+#
+#------------------------------------------------------------------------------
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+#
+#
+#       Tests of the pruning of the local cache of the windows read from GeoTiff
+#       archives on plain http servers (CF_http_cog_Reader.prune_cache, general.def_http_cache).
+#
+#       Usage:   python -m unittest discover tests      (from the top directory)
+#
+#
+# Project: DeltaDREAM
+# Name:    test_http_cache.py
+# Authors: Christian Schiller <christian dot schiller at eox dot at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2014 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+#
+#
+#
+#
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import dataset_reader
+
+
+#/************************************************************************/
+#/*                           PruneCacheTest()                           */
+#/************************************************************************/
+
+class PruneCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp(prefix='test_http_cache_')
+        self.f_read = dataset_reader.CF_http_cog_Reader()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def add_window(self, key, fname, age):
+        key_dir = os.path.join(self.cache_dir, key)
+        os.makedirs(key_dir)
+        cache_file = os.path.join(key_dir, fname)
+        open(cache_file, 'w').close()
+        mtime = time.time() - age
+        os.utime(cache_file, (mtime, mtime))
+        os.utime(key_dir, (mtime, mtime))
+        return key_dir
+
+    def test_prune(self):
+        old = self.add_window('a', 'L5_old.tif', 7200)
+        used = self.add_window('b', 'L5_used.tif', 60)
+            # a partial file left over by an aborted request
+        part = self.add_window('c', '.L5_part.tifXyZ.part', 7200)
+        self.f_read.prune_cache(self.cache_dir, 3600)
+        self.assertFalse(os.path.exists(old))
+        self.assertFalse(os.path.exists(part))
+        self.assertTrue(os.path.isfile(os.path.join(used, 'L5_used.tif')))
+
+    def test_never(self):
+        old = self.add_window('a', 'L5_old.tif', 7200)
+        self.f_read.prune_cache(self.cache_dir, 0)
+        self.assertTrue(os.path.exists(old))
+
+    def test_missing_cache_dir(self):
+        self.f_read.prune_cache(os.path.join(self.cache_dir, 'missing'), 3600)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+#
+#------------------------------------------------------------------------------
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+#
+#
+#       Tests of the fair-share scheduling of batch and daemon jobs
+#       (cloudless_jobs.JobScheduler): fair queuing across servers and datasets,
+#       cheapest job first, aging, priorities and the per-server limit.
+#       The cost of the jobs is given by the tests (estimate_cost is replaced).
+#
+#       Usage:   python -m unittest discover tests      (from the top directory)
+#
+#
+# Project: DeltaDREAM
+# Name:    test_job_scheduler.py
+# Authors: Christian Schiller <christian dot schiller at eox dot at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2014 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+#
+#
+
+import time
+import Queue
+import threading
+import unittest
+import StringIO
+
+import cloudless_jobs
+
+
+#/************************************************************************/
+#/*                          JobSchedulerTest()                          */
+#/************************************************************************/
+
+class JobSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.estimate_cost = cloudless_jobs.estimate_cost
+        cloudless_jobs.estimate_cost = lambda job, settings: job['cost']
+        self.log = StringIO.StringIO()
+        self.settings = {'logging.log_fsock': self.log,
+                         'dataset.landsat5_2a': 'http://a.org/ows?EOID=Landsat5_2A',
+                         'dataset.landsat5_mask': 'http://a.org/ows?EOID=Landsat5_Mask_Clouds',
+                         'dataset.spot4_pente': 'http://b.org/ows?EOID=Spot4Take5_N2A_PENTE',
+                         'dataset.landsat5_f': 'file:///data/landsat5/'}
+
+    def tearDown(self):
+        cloudless_jobs.estimate_cost = self.estimate_cost
+
+    def scheduler(self, workers=4, **options):
+        settings = dict(self.settings)
+        for key, value in options.items():
+            settings['scheduler.'+key] = value
+        return cloudless_jobs.JobScheduler(settings, workers=workers)
+
+    def job(self, job_id, dataset='landsat5_2a', cost=1.0, **kwargs):
+        return dict(kwargs, job_id=job_id, dataset=dataset, cost=cost)
+
+    def drain(self, scheduler):
+        """
+            the job_ids in the order they are handed out (each job finishes immediately)
+        """
+        scheduler.close()
+        order = []
+        while True:
+            job = scheduler.get()
+            if job is None:
+                return order
+            order.append(job['job_id'])
+            scheduler.done(job)
+
+    def test_job_server(self):
+        self.assertEqual(cloudless_jobs.get_job_server({'dataset': 'landsat5_2a'}, self.settings), 'a.org')
+        self.assertEqual(cloudless_jobs.get_job_server({'dataset': 'landsat5_f'}, self.settings), 'local')
+
+    def test_fair_share(self):
+            # the queues take turns - a long queue does not hold back the others
+        scheduler = self.scheduler()
+        for idx in range(4):
+            scheduler.put(self.job('a%d' % idx))
+        for idx in range(2):
+            scheduler.put(self.job('b%d' % idx, 'spot4_pente'))
+        self.assertEqual(self.drain(scheduler), ['a0', 'b0', 'a1', 'b1', 'a2', 'a3'])
+
+    def test_weighted_by_cost(self):
+            # a queue which received expensive jobs waits until the others caught up
+        scheduler = self.scheduler()
+        scheduler.put(self.job('a0', cost=3.0))
+        scheduler.put(self.job('a1', cost=3.0))
+        for idx in range(3):
+            scheduler.put(self.job('b%d' % idx, 'spot4_pente'))
+        self.assertEqual(self.drain(scheduler), ['a0', 'b0', 'b1', 'b2', 'a1'])
+
+    def test_queue_per_dataset(self):
+        scheduler = self.scheduler()
+        scheduler.put(self.job('img0'))
+        scheduler.put(self.job('img1'))
+        scheduler.put(self.job('mask0', 'landsat5_mask'))
+        self.assertEqual(self.drain(scheduler), ['img0', 'mask0', 'img1'])
+
+    def test_cheapest_first(self):
+        scheduler = self.scheduler()
+        for job_id, cost in (('big', 50.0), ('small', 1.0), ('medium', 10.0)):
+            scheduler.put(self.job(job_id, cost=cost))
+        self.assertEqual(self.drain(scheduler), ['small', 'medium', 'big'])
+
+    def test_aging(self):
+            # a big job waiting long enough is preferred to a newer small one
+        scheduler = self.scheduler(aging_time=0.01)
+        scheduler.put(self.job('big', cost=10.0))
+        time.sleep(0.3)
+        scheduler.put(self.job('small', cost=1.0))
+        self.assertEqual(self.drain(scheduler), ['big', 'small'])
+
+        scheduler = self.scheduler(aging_time=3600)
+        scheduler.put(self.job('big', cost=10.0))
+        time.sleep(0.3)
+        scheduler.put(self.job('small', cost=1.0))
+        self.assertEqual(self.drain(scheduler), ['small', 'big'])
+
+    def test_priority(self):
+        scheduler = self.scheduler()
+        scheduler.put(self.job('a0'))
+        scheduler.put(self.job('b0', 'spot4_pente', cost=100.0, priority=1))
+        scheduler.put(self.job('a1', priority=2))
+        self.assertEqual(self.drain(scheduler), ['a1', 'b0', 'a0'])
+
+    def test_max_per_server(self):
+            # a further job for the same server waits until one of them is done
+        scheduler = self.scheduler(workers=4, max_per_server=1)
+        self.assertIn('below the number of workers', self.log.getvalue())
+        scheduler.put(self.job('a0'))
+        scheduler.put(self.job('a1'))
+        scheduler.put(self.job('b0', 'spot4_pente', cost=10.0))
+        first = scheduler.get()
+        self.assertEqual(first['job_id'], 'a0')
+        self.assertEqual(scheduler.get()['job_id'], 'b0')
+
+        result = []
+        waiting = threading.Thread(target=lambda: result.append(scheduler.get()))
+        waiting.daemon = True
+        waiting.start()
+        waiting.join(0.3)
+        self.assertTrue(waiting.is_alive())
+        scheduler.done(first)
+        waiting.join(5)
+        self.assertEqual(result[0]['job_id'], 'a1')
+
+    def test_max_per_server_default(self):
+            # no limit below the number of workers - and no warning
+        scheduler = self.scheduler(workers=3)
+        self.assertEqual(scheduler.max_per_server, 3)
+        self.assertEqual(self.log.getvalue(), '')
+        for idx in range(3):
+            scheduler.put(self.job('a%d' % idx))
+        self.assertEqual([scheduler.get()['job_id'] for idx in range(3)], ['a0', 'a1', 'a2'])
+
+    def test_max_queue(self):
+        scheduler = cloudless_jobs.JobScheduler(self.settings, max_queue=2, workers=1)
+        scheduler.put(self.job('a0'))
+        scheduler.put(self.job('a1'))
+        self.assertRaises(Queue.Full, scheduler.put, self.job('a2'))
+        self.assertEqual(scheduler.qsize(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
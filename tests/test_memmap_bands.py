@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+#
+#------------------------------------------------------------------------------
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+#
+#
+#       Tests of the numpy.memmap views on uncompressed GeoTiff and ENVI rasters
+#       (dataset_processor.get_memmap_bands, get_tiff_layout) - the views have to
+#       match what GDAL reads, unsupported layouts have to be refused (None).
+#       Skipped if GDAL (with numpy support) is not available - unless the environment
+#       variable CLOUDFREE_REQUIRE_GDAL is set (CI), then the import error is raised.
+#
+#       Usage:   python -m unittest discover tests      (from the top directory)
+#
+#
+# Project: DeltaDREAM
+# Name:    test_memmap_bands.py
+# Authors: Christian Schiller <christian dot schiller at eox dot at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2014 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+#
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import numpy as np
+    from osgeo import gdal
+    import dataset_processor
+except ImportError:
+        # the CI sets CLOUDFREE_REQUIRE_GDAL - there the tests must run, not be skipped
+    if os.environ.get('CLOUDFREE_REQUIRE_GDAL'):
+        raise
+    dataset_processor = None
+
+
+#/************************************************************************/
+#/*                          MemmapBandsTest()                           */
+#/************************************************************************/
+
+@unittest.skipIf(dataset_processor is None, 'GDAL and numpy are required')
+class MemmapBandsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='test_memmap_')
+        self.data = np.arange(3*30*40, dtype=np.int16).reshape(3, 30, 40)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def create_raster(self, name, driver='GTiff', options=None, nbands=3):
+        """
+            write the test data (striped, via CreateCopy - so the strips are stored in order)
+        """
+        mem_ds = gdal.GetDriverByName('MEM').Create('', 40, 30, nbands, gdal.GDT_Int16)
+        for i in range(nbands):
+            mem_ds.GetRasterBand(i+1).WriteArray(self.data[i], 0, 0)
+        filename = os.path.join(self.temp_dir, name)
+        out_ds = gdal.GetDriverByName(driver).CreateCopy(filename, mem_ds, 0, options or [])
+        out_ds = None
+        mem_ds = None
+        return filename
+
+    def check_bands(self, filename, nbands=3):
+        bands = dataset_processor.get_memmap_bands(filename)
+        self.assertIsNotNone(bands)
+        self.assertEqual(len(bands), nbands)
+        in_ds = gdal.Open(filename)
+        for i in range(nbands):
+            self.assertTrue(np.array_equal(bands[i], self.data[i]))
+            self.assertTrue(np.array_equal(bands[i], in_ds.GetRasterBand(i+1).ReadAsArray()))
+        in_ds = None
+
+    def test_band_interleave(self):
+        self.check_bands(self.create_raster('band.tif', options=['INTERLEAVE=BAND', 'BLOCKYSIZE=8']))
+
+    def test_pixel_interleave(self):
+        self.check_bands(self.create_raster('pixel.tif', options=['INTERLEAVE=PIXEL', 'BLOCKYSIZE=8']))
+
+    def test_single_band(self):
+        self.check_bands(self.create_raster('single.tif', options=['BLOCKYSIZE=8'], nbands=1), nbands=1)
+
+    def test_big_endian(self):
+        self.check_bands(self.create_raster('big.tif', options=['INTERLEAVE=BAND', 'ENDIANNESS=BIG']))
+
+    def test_envi(self):
+        for interleave in ('BSQ', 'BIL', 'BIP'):
+            self.check_bands(self.create_raster('envi_%s.img' % interleave, 'ENVI', ['INTERLEAVE='+interleave]))
+
+    def test_tiff_layout(self):
+        filename = self.create_raster('layout.tif', options=['INTERLEAVE=BAND', 'BLOCKYSIZE=10'])
+        in_ds = gdal.Open(filename)
+        offsets, interleave, byteorder = dataset_processor.get_tiff_layout(filename, in_ds, np.dtype(np.int16))
+        self.assertEqual(interleave, 'BAND')
+        self.assertEqual(byteorder, '<')
+        self.assertEqual([offsets[i+1] - offsets[i] for i in range(2)], [30*40*2, 30*40*2])
+
+    def test_tiled(self):
+        filename = self.create_raster('tiled.tif', options=['TILED=YES', 'BLOCKXSIZE=16', 'BLOCKYSIZE=16'])
+        self.assertIsNone(dataset_processor.get_memmap_bands(filename))
+
+    def test_compressed(self):
+        filename = self.create_raster('deflate.tif', options=['COMPRESS=DEFLATE'])
+        self.assertIsNone(dataset_processor.get_memmap_bands(filename))
+
+    def test_not_a_file(self):
+        filename = '/vsimem/test_memmap/band.tif'
+        out_ds = gdal.GetDriverByName('GTiff').Create(filename, 40, 30, 1, gdal.GDT_Int16)
+        out_ds = None
+        self.assertIsNone(dataset_processor.get_memmap_bands(filename))
+        gdal.Unlink(filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
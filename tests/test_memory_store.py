@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+#
+#------------------------------------------------------------------------------
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+#
+#
+#       Tests of the in-memory storage of downloaded coverages (wcs_client memory
+#       budget):  the accounting of the budget, and that responses which do not fit
+#       into it are streamed to disk - against the local mock EO-WCS server.
+#       Skipped if GDAL is not available - unless the environment variable
+#       CLOUDFREE_REQUIRE_GDAL is set (CI), then the import error is raised.
+#
+#       Usage:   python -m unittest discover tests      (from the top directory)
+#
+#
+# Project: DeltaDREAM
+# Name:    test_memory_store.py
+# Authors: Christian Schiller <christian dot schiller at eox dot at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2014 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+#
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+import StringIO
+
+import wcs_client
+import mock_wcs_server
+import dataset_reader
+
+try:
+    from osgeo import gdal
+except ImportError:
+        # the CI sets CLOUDFREE_REQUIRE_GDAL - there the tests must run, not be skipped
+    if os.environ.get('CLOUDFREE_REQUIRE_GDAL'):
+        raise
+    gdal = None
+
+
+#/************************************************************************/
+#/*                          MemoryStoreTest()                           */
+#/************************************************************************/
+
+@unittest.skipIf(gdal is None, 'GDAL is required')
+class MemoryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        wcs_client.settings = {'logging.log_fsock': StringIO.StringIO()}
+        self.temp_dir = os.path.join(tempfile.mkdtemp(prefix='test_memory_'), '')
+        self.server = mock_wcs_server.MockWCSServer(port=0)
+        self.server.start()
+        self.request = self.server.url + 'service=wcs&version=2.0.0&request=GetCoverage&coverageid=Landsat5_2A_20110105' \
+            '&format=image/tiff&subset=x,http://www.opengis.net/def/crs/EPSG/0/4326(11.0,11.01)' \
+            '&subset=y,http://www.opengis.net/def/crs/EPSG/0/4326(45.0,45.01)'
+
+    def tearDown(self):
+        self.server.stop()
+        wcs_client.clear_memory_files(self.temp_dir)
+        wcs_client.set_memory_budget(0)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        wcs_client.settings = None
+
+    def test_accounting(self):
+        wcs_client.set_memory_budget(1000)
+        outfile = self.temp_dir+'a.tif'
+        self.assertIsNotNone(wcs_client.store_in_memory(outfile, 'x' * 400))
+            # storing the outfile again replaces it - and its share of the budget
+        mem_path = wcs_client.store_in_memory(outfile, 'x' * 500)
+        self.assertEqual(wcs_client._memory['used'], 500)
+        self.assertEqual(wcs_client.get_memory_files(self.temp_dir), {'a.tif': mem_path})
+        self.assertIsNone(wcs_client.store_in_memory(self.temp_dir+'b.tif', 'x' * 600))
+        self.assertEqual(wcs_client._memory['used'], 500)
+        wcs_client.release_memory_file(outfile)
+        self.assertEqual(wcs_client._memory['used'], 0)
+        self.assertEqual(wcs_client.get_memory_files(self.temp_dir), {})
+
+    def test_download_in_memory(self):
+        wcs_client.set_memory_budget(10000000)
+        outfile = self.temp_dir+'a.tif'
+        self.assertEqual(wcs_client.wcsClient()._fetch_coverage(self.request, outfile), 200)
+        self.assertFalse(os.path.exists(outfile))
+        self.assertIn('a.tif', wcs_client.get_memory_files(self.temp_dir))
+        used = wcs_client._memory['used']
+        self.assertGreater(used, 0)
+        wcs_client.wcsClient()._fetch_coverage(self.request, outfile)
+        self.assertEqual(wcs_client._memory['used'], used)
+
+    def test_download_over_budget(self):
+            # does not fit - streamed to disk, nothing is reserved
+        wcs_client.set_memory_budget(100)
+        outfile = self.temp_dir+'a.tif'
+        self.assertEqual(wcs_client.wcsClient()._fetch_coverage(self.request, outfile), 200)
+        self.assertTrue(os.path.getsize(outfile) > 100)
+        self.assertEqual(wcs_client._memory['used'], 0)
+        self.assertEqual(wcs_client.get_memory_files(self.temp_dir), {})
+
+    def test_release_relative_temp_dir(self):
+            # a temp_storage created under a relative def_temp_dir (e.g. ./tmp/) - the reader
+            # has to free the in-memory GFP stored for it
+        wcs_client.set_memory_budget(10000000)
+        temp_storage = os.path.join(os.path.relpath(self.temp_dir), '')
+        self.assertFalse(os.path.isabs(temp_storage))
+        self.assertEqual(wcs_client.wcsClient()._fetch_coverage(self.request, temp_storage+'a.tif'), 200)
+        f_read = dataset_reader.Reader()
+        f_read.windows.update(wcs_client.get_memory_files(temp_storage))
+        self.assertTrue(f_read.get_access_path('a.tif').startswith(wcs_client.memory_prefix))
+        self.assertGreater(wcs_client._memory['used'], 0)
+        f_read.release(['a.tif'], temp_storage)
+        self.assertEqual(wcs_client._memory['used'], 0)
+        self.assertEqual(wcs_client.get_memory_files(self.temp_dir), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+#
+#------------------------------------------------------------------------------
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+#
+#
+#       Tests of util.move_file:  a rename within a filesystem; across devices a copy
+#       to a staging name in the target directory, renamed when complete.
+#
+#       Usage:   python -m unittest discover tests      (from the top directory)
+#
+#
+# Project: DeltaDREAM
+# Name:    test_move_file.py
+# Authors: Christian Schiller <christian dot schiller at eox dot at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2014 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+#
+#
+
+import os
+import errno
+import shutil
+import tempfile
+import unittest
+
+import util
+
+
+#/************************************************************************/
+#/*                            MoveFileTest()                            */
+#/************************************************************************/
+
+class MoveFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.src_dir = tempfile.mkdtemp(prefix='test_move_src_')
+        self.dst_dir = tempfile.mkdtemp(prefix='test_move_dst_')
+        self.src_file = os.path.join(self.src_dir, 'CF_result.tif')
+        out_handle = open(self.src_file, 'wb')
+        out_handle.write('x' * 100000)
+        out_handle.close()
+        self.rename = os.rename
+
+    def tearDown(self):
+        os.rename = self.rename
+        shutil.rmtree(self.src_dir, ignore_errors=True)
+        shutil.rmtree(self.dst_dir, ignore_errors=True)
+
+    def cross_device(self):
+        """
+            let os.rename fail (EXDEV) for files from the source directory - as across devices
+        """
+        renames = []
+        def rename(src, dst):
+            renames.append((src, dst))
+            if os.path.dirname(src) == self.src_dir:
+                raise OSError(errno.EXDEV, 'Invalid cross-device link')
+            self.rename(src, dst)
+        os.rename = rename
+        return renames
+
+    def test_same_device(self):
+        dst_file = util.move_file(self.src_file, self.dst_dir)
+        self.assertEqual(dst_file, os.path.join(self.dst_dir, 'CF_result.tif'))
+        self.assertFalse(os.path.exists(self.src_file))
+        self.assertEqual(os.path.getsize(dst_file), 100000)
+
+    def test_cross_device(self):
+        renames = self.cross_device()
+        dst_file = util.move_file(self.src_file, self.dst_dir)
+        self.assertFalse(os.path.exists(self.src_file))
+        self.assertEqual(os.path.getsize(dst_file), 100000)
+            # the copy appears under its name by a rename within the target directory
+        self.assertEqual(renames[-1], (os.path.join(self.dst_dir, '.CF_result.tif.staging'), dst_file))
+        self.assertEqual(os.listdir(self.dst_dir), ['CF_result.tif'])
+
+    def test_cross_device_failure(self):
+            # a failing copy leaves neither a staging file nor a partial target
+        self.cross_device()
+        copy2 = shutil.copy2
+        def failing_copy(src, dst):
+            out_handle = open(dst, 'wb')
+            out_handle.write('x' * 10)
+            out_handle.close()
+            raise IOError(errno.ENOSPC, 'No space left on device')
+        shutil.copy2 = failing_copy
+        try:
+            self.assertRaises(IOError, util.move_file, self.src_file, self.dst_dir)
+        finally:
+            shutil.copy2 = copy2
+        self.assertTrue(os.path.exists(self.src_file))
+        self.assertEqual(os.listdir(self.dst_dir), [])
+
+    def test_other_errors(self):
+        self.assertRaises(OSError, util.move_file, os.path.join(self.src_dir, 'missing.tif'), self.dst_dir)
+
+    @unittest.skipUnless(os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) and
+                         os.stat('/dev/shm').st_dev != os.stat(tempfile.gettempdir()).st_dev,
+                         'needs /dev/shm on another device than the temp directory')
+    def test_real_devices(self):
+        shm_dir = tempfile.mkdtemp(prefix='test_move_shm_', dir='/dev/shm')
+        try:
+            dst_file = util.move_file(self.src_file, shm_dir)
+            self.assertFalse(os.path.exists(self.src_file))
+            self.assertEqual(os.path.getsize(dst_file), 100000)
+            self.assertEqual(os.listdir(shm_dir), ['CF_result.tif'])
+        finally:
+            shutil.rmtree(shm_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
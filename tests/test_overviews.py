@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+#------------------------------------------------------------------------------
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+#
+#
+#       Tests of the overview pyramids written from the in-memory composite
+#       (dataset_processor.write_overviews):  GeoTiff outputs get the decimated levels,
+#       other output drivers get none - i.e. no external .ovr side files.
+#       Skipped if GDAL (with numpy support) is not available - unless the environment
+#       variable CLOUDFREE_REQUIRE_GDAL is set (CI), then the import error is raised.
+#
+#       Usage:   python -m unittest discover tests      (from the top directory)
+#
+#
+# Project: DeltaDREAM
+# Name:    test_overviews.py
+# Authors: Christian Schiller <christian dot schiller at eox dot at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2014 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+#
+#
+#
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import numpy as np
+    from osgeo import gdal
+    import dataset_processor
+except ImportError:
+        # the CI sets CLOUDFREE_REQUIRE_GDAL - there the tests must run, not be skipped
+    if os.environ.get('CLOUDFREE_REQUIRE_GDAL'):
+        raise
+    dataset_processor = None
+
+
+#/************************************************************************/
+#/*                          WriteOverviewsTest()                        */
+#/************************************************************************/
+
+@unittest.skipIf(dataset_processor is None, 'GDAL and numpy are required')
+class WriteOverviewsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='test_overviews_')
+        self.data = np.arange(64*64, dtype=np.uint8).reshape(64, 64)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def write(self, name, driver):
+        filename = os.path.join(self.temp_dir, name)
+        out_ds = gdal.GetDriverByName(driver).Create(filename, 64, 64, 1, gdal.GDT_Byte)
+        out_ds.GetRasterBand(1).WriteArray(self.data, 0, 0)
+        dataset_processor.write_overviews(out_ds, [self.data], [2, 4])
+        return filename, out_ds
+
+    def test_gtiff(self):
+        filename, out_ds = self.write('out.tif', 'GTiff')
+        out_band = out_ds.GetRasterBand(1)
+        self.assertEqual(out_band.GetOverviewCount(), 2)
+        self.assertTrue(np.array_equal(out_band.GetOverview(0).ReadAsArray(), self.data[1::2, 1::2]))
+        out_ds = None
+        self.assertFalse(os.path.exists(filename+'.ovr'))
+
+    def test_other_driver(self):
+        filename, out_ds = self.write('out.img', 'ENVI')
+        self.assertEqual(out_ds.GetRasterBand(1).GetOverviewCount(), 0)
+        out_ds = None
+        self.assertFalse(os.path.exists(filename+'.ovr'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#
+#------------------------------------------------------------------------------
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+#
+#
+#       Tests of the base-file prefetch of Reader.get_filelist:  if the listing fails
+#       after the prefetch has been started, get_filelist must not return (exit) before
+#       the prefetch has finished - the caller removes the temp_storage it writes to.
+#
+#       Usage:   python -m unittest discover tests      (from the top directory)
+#
+#
+# Project: DeltaDREAM
+# Name:    test_prefetch.py
+# Authors: Christian Schiller <christian dot schiller at eox dot at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2014 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+#
+#
+#
+#
+
+import time
+import unittest
+import StringIO
+
+import dataset_reader
+
+
+#/************************************************************************/
+#/*                         PrefetchReader()                             */
+#/************************************************************************/
+
+class PrefetchReader(dataset_reader.Reader):
+    """
+        a Reader listing one base file, with a slow base-file download and an
+        erroneous listing of the masks (ExceptionReport - a str)
+    """
+    def __init__(self):
+        dataset_reader.Reader.__init__(self)
+        self.downloaded = False
+
+    def base_desceocover(self, input_params, settings, mask):
+        if mask:
+            time.sleep(0.1)
+            return '<ows:ExceptionReport/>'
+        return ['Landsat5_2A_20110105']
+
+    def base_getcover(self, file_list, input_params, settings, temp_storage, mask):
+        time.sleep(0.5)
+        self.downloaded = True
+
+
+#/************************************************************************/
+#/*                          PrefetchTest()                              */
+#/************************************************************************/
+
+class PrefetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = {'logging.log_fsock': StringIO.StringIO()}
+        self.input_params = {'toi': '20110105', 'scenario': 'T'}
+
+    def test_mask_listing_error(self):
+        f_read = PrefetchReader()
+        f_read.prefetch_dir = '/nonexistent/'
+        self.assertRaises(SystemExit, f_read.get_filelist, self.input_params, self.settings)
+            # the prefetch has finished before the exit, and its result is dropped
+        self.assertTrue(f_read.downloaded)
+        self.assertIsNone(f_read.prefetched)
+        self.assertIn('No Datasets found', self.settings['logging.log_fsock'].getvalue())
+
+    def test_discard_without_prefetch(self):
+        f_read = PrefetchReader()
+        f_read.discard_prefetch()
+        self.assertIsNone(f_read.prefetched)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+#
+#------------------------------------------------------------------------------
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+#
+#
+#       Tests of the TimeIndex of the dataset readers:  the order of the GFPs per
+#       scenario (T, B, M) has to match the one of the former list based
+#       Reader.apply_scenario (reproduced below as reference).
+#
+#       Usage:   python -m unittest discover tests      (from the top directory)
+#
+#
+# Project: DeltaDREAM
+# Name:    test_time_index.py
+# Authors: Christian Schiller <christian dot schiller at eox dot at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2014 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+#
+#
+
+import random
+import unittest
+import StringIO
+
+import dataset_reader
+import mock_wcs_server
+
+
+def reference_order(gfp_flist, scenario, base_flist):
+    """
+        the GFP order of the former Reader.apply_scenario (list based, names sorted by date)
+    """
+    gfp_flist = list(gfp_flist)
+    if scenario == 'T':
+        gfp_flist.reverse()
+        return gfp_flist
+
+    elif scenario == 'B':
+        gfp_flist.sort()
+        return gfp_flist
+
+    elif scenario == 'M':
+        gfp_tmp = list(gfp_flist)
+        gfp_tmp.extend(base_flist)
+        gfp_tmp.sort()
+        toi_pos1 = gfp_tmp.index(base_flist[0])
+        newer_flist1 = gfp_tmp[toi_pos1+1:]
+        older_flist1 = gfp_tmp[:toi_pos1]
+        older_flist1.reverse()
+
+        out_gfp = []
+        for k, v in map(None, newer_flist1, older_flist1):
+            if k is not None:
+                out_gfp.append(k)
+            if v is not None:
+                out_gfp.append(v)
+        return out_gfp
+
+
+#/************************************************************************/
+#/*                           TimeIndexTest()                            */
+#/************************************************************************/
+
+class TimeIndexTest(unittest.TestCase):
+
+    def setUp(self):
+            # a listing as delivered by DescribeEOCoverageSet (in date order)
+        coverages = mock_wcs_server.MockCoverages(start='20110101', end='20110430', revisit=4)
+        self.cov_list = coverages.coverage_ids('Landsat5_2A')
+
+    def split_listing(self, toi):
+        base_flist = [elem for elem in self.cov_list if elem.find(toi) > -1]
+        gfp_flist = [elem for elem in self.cov_list if elem not in base_flist]
+        return base_flist, gfp_flist
+
+    def test_between(self):
+        index = dataset_reader.TimeIndex(self.cov_list)
+        self.assertEqual(index.between('20110210', '20110210'), ['Landsat5_2A_20110210'])
+        self.assertEqual(index.between('2011-01-01', '2011-01-09'),
+                         ['Landsat5_2A_20110101', 'Landsat5_2A_20110105', 'Landsat5_2A_20110109'])
+        self.assertEqual(index.between('20110102', '20110104'), [])
+
+    def test_scenarios(self):
+        for toi in ('20110101', '20110210', '20110302', '20110427'):
+            base_flist, gfp_flist = self.split_listing(toi)
+            index = dataset_reader.TimeIndex(self.cov_list)
+            for scenario in ('T', 'B', 'M'):
+                self.assertEqual(index.ordered(toi, scenario), reference_order(gfp_flist, scenario, base_flist),
+                                 'scenario %s at %s' % (scenario, toi))
+
+    def test_unsorted_listing(self):
+            # the order does not depend on the order of the listing
+        base_flist, gfp_flist = self.split_listing('20110210')
+        shuffled = list(self.cov_list)
+        random.Random(1).shuffle(shuffled)
+        index = dataset_reader.TimeIndex(shuffled)
+        for scenario in ('T', 'B', 'M'):
+            self.assertEqual(index.ordered('2011-02-10', scenario), reference_order(gfp_flist, scenario, base_flist))
+
+    def test_toi_values(self):
+        index = dataset_reader.TimeIndex(self.cov_list)
+        self.assertEqual(index.ordered('20110210', 'M', ['20110202', '20110222']),
+                         ['Landsat5_2A_20110214', 'Landsat5_2A_20110206', 'Landsat5_2A_20110218',
+                          'Landsat5_2A_20110202', 'Landsat5_2A_20110222'])
+
+    def test_apply_scenario(self):
+        reader = dataset_reader.Reader()
+        gfp_index = dataset_reader.TimeIndex(self.cov_list)
+        mask_index = dataset_reader.TimeIndex([elem.replace('2A', 'Mask_Clouds') for elem in self.cov_list])
+        gfp_flist, gfpmask_flist = reader.apply_scenario(gfp_index, mask_index, 'M', '20110210', {})
+        self.assertEqual([elem.replace('2A', 'Mask_Clouds') for elem in gfp_flist], gfpmask_flist)
+
+        log = StringIO.StringIO()
+        self.assertRaises(SystemExit, reader.apply_scenario, gfp_index, mask_index, 'X', '20110210',
+                          {'logging.log_fsock': log})
+        self.assertIn('Choosen Scenario is not supported', log.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+#
+#------------------------------------------------------------------------------
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+#
+#
+#       Tests of the per-server limits of the wcsClient (TokenBucket, ServerLimiter),
+#       partly against the local mock EO-WCS server (mock_wcs_server.py).
+#
+#       Usage:   python -m unittest discover tests      (from the top directory)
+#
+#
+# Project: DeltaDREAM
+# Name:    test_wcs_limits.py
+# Authors: Christian Schiller <christian dot schiller at eox dot at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2014 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+#
+#
+
+import time
+import threading
+import unittest
+import StringIO
+
+import wcs_client
+import mock_wcs_server
+
+
+#/************************************************************************/
+#/*                           TokenBucketTest()                          */
+#/************************************************************************/
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_unlimited(self):
+        bucket = wcs_client.TokenBucket(0)
+        start = time.time()
+        for idx in range(1000):
+            bucket.consume(1000)
+        self.assertLess(time.time() - start, 0.1)
+
+    def test_rate(self):
+            # one token of burst, then 50 tokens/sec
+        bucket = wcs_client.TokenBucket(50, capacity=1)
+        start = time.time()
+        for idx in range(11):
+            bucket.consume(1)
+        self.assertGreaterEqual(time.time() - start, 0.18)
+
+    def test_burst(self):
+        bucket = wcs_client.TokenBucket(10)
+        start = time.time()
+        bucket.consume(10)
+        self.assertLess(time.time() - start, 0.05)
+
+    def test_debt(self):
+            # an amount beyond the available tokens delays the next caller
+        bucket = wcs_client.TokenBucket(100, capacity=10)
+        bucket.consume(30)
+        start = time.time()
+        bucket.consume(1)
+        self.assertGreaterEqual(time.time() - start, 0.005)
+
+
+#/************************************************************************/
+#/*                           ParseLimitsTest()                          */
+#/************************************************************************/
+
+class ParseLimitsTest(unittest.TestCase):
+
+    def test_parse(self):
+        limits = wcs_client.parse_limits('max_inflight=4, requests_per_sec=10,bytes_per_sec=1000000')
+        self.assertEqual(limits, {'max_inflight': 4, 'requests_per_sec': 10.0, 'bytes_per_sec': 1000000.0})
+
+    def test_defaults(self):
+        self.assertEqual(wcs_client.parse_limits(''), {'max_inflight': 0, 'requests_per_sec': 0, 'bytes_per_sec': 0})
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, wcs_client.parse_limits, 'max_connections=4')
+
+
+#/************************************************************************/
+#/*                           ServerLimitTest()                          */
+#/************************************************************************/
+
+class ServerLimitTest(unittest.TestCase):
+
+    def setUp(self):
+        wcs_client.settings = {'logging.log_fsock': StringIO.StringIO()}
+        self.server = mock_wcs_server.MockWCSServer(port=0, latency=0.2)
+        self.server.start()
+        self.request = self.server.url+'service=wcs&version=2.0.0&request=GetCapabilities'
+
+    def tearDown(self):
+        self.server.stop()
+        wcs_client.set_limits({})
+        wcs_client.settings = None
+
+    def run_concurrently(self, nrequests):
+        client = wcs_client.wcsClient()
+        threads = [threading.Thread(target=client._fetch, args=(self.request,)) for idx in range(nrequests)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.time() - start
+
+    def test_limiter_per_host(self):
+        wcs_client.set_limits({'default': wcs_client.parse_limits('max_inflight=2'),
+                               'some.where.org': wcs_client.parse_limits('max_inflight=1')})
+        limiter = wcs_client.get_limiter('http://some.where.org/ows?service=wcs')
+        self.assertIs(limiter, wcs_client.get_limiter('http://SOME.where.org/ows?request=GetCapabilities'))
+        self.assertIsNot(limiter, wcs_client.get_limiter('http://else.where.org/ows?service=wcs'))
+
+    def test_unlimited(self):
+        wcs_client.set_limits({})
+        self.assertLess(self.run_concurrently(3), 0.5)
+
+    def test_max_inflight(self):
+            # the requests to the server are serialized
+        wcs_client.set_limits({'127.0.0.1': wcs_client.parse_limits('max_inflight=1')})
+        self.assertGreaterEqual(self.run_concurrently(3), 0.6)
+        self.assertEqual(self.server.requests, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+#
+#------------------------------------------------------------------------------
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+#
+#
+#       Tests of the mirror groups of the wcsClient against two local mock EO-WCS
+#       servers (mock_wcs_server.py): only the requests for the mirrored DatasetSeries
+#       are spread across the mirrors, and fail over on server and connection errors.
+#
+#       Usage:   python -m unittest discover tests      (from the top directory)
+#
+#
+# Project: DeltaDREAM
+# Name:    test_wcs_mirrors.py
+# Authors: Christian Schiller <christian dot schiller at eox dot at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2014 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+#
+#
+
+import socket
+import urllib2
+import unittest
+import StringIO
+
+import wcs_client
+import mock_wcs_server
+
+
+def unused_url():
+    """
+        the url of a port nobody listens on
+    """
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return 'http://127.0.0.1:%d/ows?' % port
+
+
+#/************************************************************************/
+#/*                          MirrorGroupTest()                           */
+#/************************************************************************/
+
+class MirrorGroupTest(unittest.TestCase):
+
+    def setUp(self):
+        wcs_client._mirrors.clear()
+        wcs_client._mirror_coverages.clear()
+
+    def tearDown(self):
+        wcs_client._mirrors.clear()
+        wcs_client._mirror_coverages.clear()
+
+    def test_keyed_by_eoid(self):
+        wcs_client.set_mirrors(['http://a.org/ows?', 'http://b.org/ows?'], 'Landsat5_2A')
+        wcs_client.set_mirrors(['http://a.org/ows?', 'http://c.org/ows?'], 'Spot4Take5_N2A_PENTE')
+
+        group, url = wcs_client.get_mirror_group('http://a.org/ows?service=wcs&request=DescribeEOCoverageSet&eoID=Landsat5_2A')
+        self.assertEqual(url, 'http://a.org/ows?')
+        self.assertEqual(group.urls, ['http://a.org/ows?', 'http://b.org/ows?'])
+        group, url = wcs_client.get_mirror_group('http://a.org/ows?service=wcs&request=DescribeEOCoverageSet&eoID=Spot4Take5_N2A_PENTE')
+        self.assertEqual(group.urls, ['http://a.org/ows?', 'http://c.org/ows?'])
+
+    def test_other_requests(self):
+        wcs_client.set_mirrors(['http://a.org/ows?', 'http://b.org/ows?'], 'Landsat5_2A')
+        for request in ('http://a.org/ows?service=wcs&request=GetCapabilities',
+                        'http://a.org/ows?service=wcs&request=DescribeEOCoverageSet&eoID=Landsat5_Mask_Clouds',
+                        'http://c.org/ows?service=wcs&request=DescribeEOCoverageSet&eoID=Landsat5_2A',
+                        'http://a.org/ows?service=wcs&request=GetCoverage&coverageid=Landsat5_2A_20110101'):
+            self.assertEqual(wcs_client.get_mirror_group(request), (None, None))
+
+    def test_listed_coverages(self):
+        wcs_client.set_mirrors(['http://a.org/ows?', 'http://b.org/ows?'], 'Landsat5_2A')
+        wcs_client.register_mirror_coverages('http://b.org/ows?service=wcs&request=DescribeEOCoverageSet&eoID=Landsat5_2A',
+                                             ['Landsat5_2A_20110101'])
+        group, url = wcs_client.get_mirror_group('http://a.org/ows?service=wcs&request=GetCoverage&coverageid=Landsat5_2A_20110101')
+        self.assertEqual(url, 'http://a.org/ows?')
+        self.assertEqual(wcs_client.get_mirror_group('http://a.org/ows?service=wcs&request=GetCoverage&coverageid=Landsat5_2A_20110105'),
+                         (None, None))
+
+    def test_ranking(self):
+        group = wcs_client.MirrorGroup(['http://a.org/ows?', 'http://b.org/ows?'])
+        for idx in range(3):
+            group.started('http://a.org/ows?')
+            group.finished('http://a.org/ows?', failed=True)
+        group.started('http://b.org/ows?')
+        group.finished('http://b.org/ows?', latency=0.1)
+            # a is down after 3 consecutive failures
+        self.assertEqual(group.ranked(), ['http://b.org/ows?', 'http://a.org/ows?'])
+
+    def test_mirror_errors(self):
+        self.assertTrue(wcs_client.is_mirror_error(urllib2.HTTPError('u', 503, 'error', {}, None)))
+        self.assertTrue(wcs_client.is_mirror_error(urllib2.URLError('connection refused')))
+        self.assertFalse(wcs_client.is_mirror_error(urllib2.HTTPError('u', 404, 'error', {}, None)))
+        self.assertFalse(wcs_client.is_mirror_error(IOError('disk full')))
+
+
+#/************************************************************************/
+#/*                           FailoverTest()                             */
+#/************************************************************************/
+
+class FailoverTest(unittest.TestCase):
+
+    def setUp(self):
+        wcs_client.settings = {'logging.log_fsock': StringIO.StringIO()}
+        wcs_client._mirrors.clear()
+        wcs_client._mirror_coverages.clear()
+        self.retry = dict(wcs_client._retry)
+        wcs_client.set_retries(max_retries=0, backoff_base=0.01, backoff_max=0.02, hedge_percentile=0)
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+        wcs_client._mirrors.clear()
+        wcs_client._mirror_coverages.clear()
+        wcs_client._retry.update(self.retry)
+        wcs_client.settings = None
+
+    def start_server(self, **kwargs):
+        server = mock_wcs_server.MockWCSServer(port=0, **kwargs)
+        server.start()
+        self.servers.append(server)
+        return server
+
+    def test_connection_error(self):
+            # the mirror addressed is down - the request is served by the other one
+        server = self.start_server()
+        down_url = unused_url()
+        wcs_client.set_mirrors([down_url, server.url], 'Landsat5_2A')
+        client = wcs_client.wcsClient()
+        cids = client._execute_xml_request(down_url+'service=wcs&version=2.0.0&request=DescribeEOCoverageSet&eoID=Landsat5_2A',
+                                           IDs_only=True)
+        self.assertEqual(cids[0], 'Landsat5_2A_20110101')
+        self.assertGreaterEqual(server.requests, 1)
+            # the listed coverages are requested from the mirrors as well
+        group, url = wcs_client.get_mirror_group(down_url+'service=wcs&request=GetCoverage&coverageid='+cids[0])
+        self.assertEqual(url, down_url)
+
+    def test_not_mirrored(self):
+            # requests for other DatasetSeries (and GetCapabilities) are not rerouted
+        server = self.start_server()
+        down_url = unused_url()
+        wcs_client.set_mirrors([down_url, server.url], 'Landsat5_2A')
+        client = wcs_client.wcsClient()
+        self.assertRaises(urllib2.URLError, client._fetch, down_url+'service=wcs&version=2.0.0&request=GetCapabilities')
+        self.assertRaises(urllib2.URLError, client._fetch,
+                          down_url+'service=wcs&version=2.0.0&request=DescribeEOCoverageSet&eoID=Landsat5_Mask_Clouds')
+        self.assertEqual(server.requests, 0)
+
+    def test_server_error(self):
+        failing = self.start_server(fail_rate=1)
+        server = self.start_server()
+        wcs_client.set_mirrors([failing.url, server.url], 'Landsat5_2A')
+        status, body = wcs_client.wcsClient()._fetch(failing.url+'service=wcs&version=2.0.0&request=DescribeEOCoverageSet&eoID=Landsat5_2A')
+        self.assertEqual(status, 200)
+        self.assertEqual(server.requests, 1)
+
+    def test_client_error(self):
+            # an invalid request fails the same way on every mirror - no fail over
+        server1 = self.start_server()
+        server2 = self.start_server()
+        wcs_client.set_mirrors([server1.url, server2.url], 'Landsat5_2A')
+        with self.assertRaises(urllib2.HTTPError) as ctx:
+            wcs_client.wcsClient()._fetch(server1.url+'service=wcs&version=2.0.0&request=NoSuchRequest&eoID=Landsat5_2A')
+        self.assertEqual(ctx.exception.code, 400)
+        self.assertEqual(server1.requests + server2.requests, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
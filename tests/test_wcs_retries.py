@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+#
+#------------------------------------------------------------------------------
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+#
+#
+#       Tests of the retries of failed wcsClient requests against the local mock
+#       EO-WCS server (mock_wcs_server.py) - temporary server errors are retried,
+#       invalid requests are not.
+#
+#       Usage:   python -m unittest discover tests      (from the top directory)
+#
+#
+# Project: DeltaDREAM
+# Name:    test_wcs_retries.py
+# Authors: Christian Schiller <christian dot schiller at eox dot at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2014 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+#
+#
+
+import time
+import socket
+import urllib2
+import unittest
+import StringIO
+
+import wcs_client
+import mock_wcs_server
+
+
+#/************************************************************************/
+#/*                          IsRetryableTest()                           */
+#/************************************************************************/
+
+class IsRetryableTest(unittest.TestCase):
+
+    def http_error(self, code):
+        return urllib2.HTTPError('http://some.where.org/ows?', code, 'error', {}, None)
+
+    def test_server_errors(self):
+        for code in (408, 429, 500, 502, 503, 504):
+            self.assertTrue(wcs_client.is_retryable(self.http_error(code)))
+
+    def test_client_errors(self):
+        for code in (400, 401, 404):
+            self.assertFalse(wcs_client.is_retryable(self.http_error(code)))
+
+    def test_connection_errors(self):
+        self.assertTrue(wcs_client.is_retryable(urllib2.URLError('connection refused')))
+        self.assertTrue(wcs_client.is_retryable(socket.timeout('timed out')))
+
+    def test_local_errors(self):
+        self.assertFalse(wcs_client.is_retryable(IOError('disk full')))
+        self.assertFalse(wcs_client.is_retryable(ValueError('invalid')))
+
+
+#/************************************************************************/
+#/*                             RetryTest()                              */
+#/************************************************************************/
+
+class RetryTest(unittest.TestCase):
+
+    def setUp(self):
+        wcs_client.settings = {'logging.log_fsock': StringIO.StringIO()}
+        self.retry = dict(wcs_client._retry)
+        wcs_client.set_retries(max_retries=2, backoff_base=0.01, backoff_max=0.02, hedge_percentile=0)
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.stop()
+        wcs_client._retry.update(self.retry)
+        wcs_client.settings = None
+
+    def start_server(self, **kwargs):
+        self.server = mock_wcs_server.MockWCSServer(port=0, **kwargs)
+        self.server.start()
+        return self.server.url
+
+    def test_success(self):
+        url = self.start_server()
+        status, body = wcs_client.wcsClient()._fetch(url+'service=wcs&version=2.0.0&request=GetCapabilities')
+        self.assertEqual(status, 200)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_retry_server_errors(self):
+            # every request fails (503) - the first attempt and max_retries retries
+        url = self.start_server(fail_rate=1)
+        with self.assertRaises(urllib2.HTTPError) as ctx:
+            wcs_client.wcsClient()._fetch(url+'service=wcs&version=2.0.0&request=GetCapabilities')
+        self.assertEqual(ctx.exception.code, 503)
+        self.assertEqual(self.server.requests, 3)
+
+    def test_no_retry_client_errors(self):
+        url = self.start_server()
+        with self.assertRaises(urllib2.HTTPError) as ctx:
+            wcs_client.wcsClient()._fetch(url+'service=wcs&version=2.0.0&request=NoSuchRequest')
+        self.assertEqual(ctx.exception.code, 400)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_timeout(self):
+            # the server hangs - the request times out, and is retried
+        url = self.start_server(hang_rate=1, hang_time=2)
+            # the hanging requests can not be answered anymore
+        self.server.handle_error = lambda request, client_address: None
+        timeout = wcs_client.request_timeout
+        wcs_client.set_retries(max_retries=1, timeout=0.2)
+        try:
+            self.assertRaises((urllib2.URLError, socket.error), wcs_client.wcsClient()._fetch,
+                              url+'service=wcs&version=2.0.0&request=GetCapabilities')
+        finally:
+            wcs_client.set_retries(timeout=timeout)
+        self.assertEqual(self.server.requests, 2)
+
+    def test_latency_is_time_to_first_byte(self):
+            # a slow transfer (bandwidth limit) of a response which started at once - the
+            # latency recorded (for the hedging) must not include the transfer time
+        url = self.start_server(bandwidth=2000)
+        http_request = url+'service=wcs&version=2.0.0&request=GetCapabilities'
+        wcs_client._latencies.pop(wcs_client.latency_key(http_request), None)
+        start = time.time()
+        for i in range(2):
+            wcs_client.wcsClient()._fetch(http_request)
+        duration = time.time() - start
+        samples = wcs_client._latencies[wcs_client.latency_key(http_request)]
+        self.assertEqual(len(samples), 2)
+        self.assertGreater(duration, 0.5)
+        self.assertLess(max(samples), duration / 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
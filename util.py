@@ -40,6 +40,9 @@
 
 import os
 import sys
+import errno
+import shutil
+import threading
 
 from xml.dom import minidom
 
@@ -64,6 +67,82 @@ def handle_error(err_msg, err_code, settings):
 
 
 
+    # the file extensions of the gdal (writable) output formats
+supported_ext =  {'VRT': '.vrt', 'GTIFF': '.tif', 'NITF': '.nitf', 'HFA': '.img', 'ELAS': '.ELAS', 'AAIGRID': '.grd', 'DTED': '.DTED', 'PNG': '.png', 'JPEG': '.jpg', 'MEM': '.mem', 'GIF': '.gif', 'XPM': '.xpm', 'BMP': '.bmp', 'PCIDSK': '.PCIDSK', 'PCRASTER': '.PCRaster', 'ILWIS': '.ilw', 'SGI': '.sgi', 'SRTMHGT': '.SRTMHGT', 'LEVELLER': '.Leveller', 'TERRAGEN': '.Terragen', 'GMT': '.gmt', 'NETCDF': '.nc', 'HDF4IMAGE': '.hdf', 'ISIS2': '.ISIS2', 'ERS': '.ers', 'FIT': '.fit', 'JPEG2000': '.jp2', 'RMF': '.rmf', 'WMS ':'.WMS', 'RST': '.rst', 'INGR': '.INGR', 'GSAG': '.grd', 'GSBG': '.grd', 'GS7BG': '.grd', 'R': '.r', 'PNM':  '.pnm', 'ENVI': '.img', 'EHDR': '.hdr', 'PAUX': '.aux', 'MFF':  '.mff', 'MFF2': '.mff2', 'BT':   '.bt', 'LAN': '.lan', 'IDA': '.ida', 'LCP': '.lcp', 'GTX': '.GTX', 'NTV2': '.NTv2', 'CTABLE2': '.CTable2', 'KRO': '.KRO', 'ARG': '.ARG', 'USGSDEM': '.USGDEM', 'ADRG': '.img', 'BLX': '.blx', 'RASTERLITE': '.Rasterlite', 'EPSILON': '.Epsilon', 'POSTGISRASTER': '.PostGISRaster', 'SAGA': '.sdat', 'KMLSUPEROVERLAY': '.kmlovl', 'XYZ': '.xyz', 'HF2': '.HF2', 'PDF': '.pdf', 'WEBP': '.webp', 'ZMAP': '.ZMap'}
+
+
+#/************************************************************************/
+#/*                             move_file()                              */
+#/************************************************************************/
+
+def move_file(src_file, dst_dir):
+    """
+        moves a (result) file into the dst_dir - a rename if both are on the same
+        filesystem, across devices the file is copied to a staging name next to
+        its target and renamed when complete, so the target appears atomically
+        Returns:  the target path
+    """
+    dst_file = os.path.join(dst_dir, os.path.basename(src_file))
+    try:
+        os.rename(src_file, dst_file)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        staging_file = os.path.join(dst_dir, '.'+os.path.basename(src_file)+'.staging')
+        try:
+            shutil.copy2(src_file, staging_file)
+            os.rename(staging_file, dst_file)
+        except:
+            if os.path.exists(staging_file):
+                os.remove(staging_file)
+            raise
+        os.remove(src_file)
+
+    return dst_file
+
+
+#/************************************************************************/
+#/*                             run_async()                              */
+#/************************************************************************/
+
+class AsyncCall(threading.Thread):
+    """
+        a function call running in a background thread, result() waits for it and
+        returns its result - or re-raises its exception (incl. SystemExit) in the caller
+    """
+    def __init__(self, func, args, kwargs):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.value = None
+        self.exc_info = None
+
+    def run(self):
+        try:
+            self.value = self.func(*self.args, **self.kwargs)
+        except BaseException:
+            self.exc_info = sys.exc_info()
+
+    def result(self):
+        self.join()
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.value
+
+
+def run_async(func, *args, **kwargs):
+    """
+        start func(*args, **kwargs) in a background thread
+        Returns:  AsyncCall  - use its result() to wait for the result
+    """
+    call = AsyncCall(func, args, kwargs)
+    call.start()
+
+    return call
+
+
 #/************************************************************************/
 #/*                        print_log()                                   */
 #/************************************************************************/
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+#
+#------------------------------------------------------------------------------
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+#
+#
+#       Throughput benchmark of the wcsClient and the WCS dataset readers:
+#       measures the end-to-end listing (DescribeEOCoverageSet of images and
+#       masks) and download (GetCoverage) throughput and latencies at different
+#       concurrency levels.
+#       Runs against the bundled mock EO-WCS server (default), or any other
+#       EO-WCS server providing the benchmarked dataset.
+#
+#       Usage:   wcs_benchmark.py  (-h|--help) for the available options
+#
+#
+# Project: DeltaDREAM
+# Name:    wcs_benchmark.py
+# Authors: Christian Schiller <christian dot schiller at eox dot at>
+#
+#-------------------------------------------------------------------------------
+# Copyright (C) 2014 EOX IT Services GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies of this Software or works derived from this Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#-------------------------------------------------------------------------------
+#
+#
+
+import sys
+import os
+import time
+import getopt
+import tempfile
+import shutil
+import threading
+import Queue
+
+import wcs_client
+from get_config import get_config
+from mock_wcs_server import MockWCSServer, MockCoverages
+
+
+    # the DatasetSeries (EOIDs) of the benchmarked datasets - the mask datasets are
+    # found by the readers via their naming conventions
+bench_datasets = {'landsat5_2a': 'Landsat5_2A',
+                  'landsat5_mask_clouds': 'Landsat5_Mask_Clouds',
+                  'spot4take5_n2a_pente': 'Spot4Take5_N2A_PENTE',
+                  'spot4take5_n2a_nua': 'Spot4Take5_N2A_NUA' }
+
+
+#/************************************************************************/
+#/*                               usage()                                */
+#/************************************************************************/
+
+def usage():
+    """
+        Print out the Usage information
+    """
+    print ""
+    print "Usage: wcs_benchmark.py  ([-u|--url] <server_url>) ([-c|--concurrency] <'1,2,4,8'>) "
+    print "                  ([-d|--dataset] <dataset>) ([-a|--aoi] <'minx,maxx,miny,maxy'>) ([-t|--time] <date>) "
+    print "                  ([-p|--period] <days>) ([-n|--listings] <num>) ([-f|--config] <cfg-file>) "
+    print "                  ([-l|--latency] <sec>) ([-j|--jitter] <sec>) ([-w|--bandwidth] <bytes/s>) ([-e|--fail_rate] <0..1>)"
+    print " "
+    print "  Measures the listing and download throughput of the wcsClient/dataset readers at different"
+    print "  concurrency levels. Without '-u' the bundled mock EO-WCS server is started and used."
+    print "  OPTIONAL parameters: "
+    print "   -h|--help                 --  This help information"
+    print "   -u|--url <server_url>     --  EO-WCS server to benchmark e.g. http://some.where.org/ows? [default=mock server]"
+    print "   -c|--concurrency <list>   --  concurrency levels to measure [default=1,2,4,8]"
+    print "   -d|--dataset <dataset>    --  dataset to use [default=landsat5_2a]"
+    print "   -a|--aoi <bbox>           --  AOI of the requests [default=3.5,3.6,43.3,43.4]"
+    print "   -t|--time <YYYYMMDD>      --  date of the base image [default=20110513]"
+    print "   -p|--period <days>        --  period of the listings [default=30]"
+    print "   -n|--listings <num>       --  number of listings per concurrency level [default=20]"
+    print "   -f|--config <cfg-file>    --  apply the [wcs_limits]/[wcs_requests] settings of a config-file"
+    print "   mock server only:"
+    print "   -l|--latency <sec>        --  latency added to every request [default=0.05]"
+    print "   -j|--jitter <sec>         --  max. random latency added on top of the latency [default=0.1]"
+    print "   -w|--bandwidth <bytes/s>  --  max. bandwidth of the server [default=0=unlimited]"
+    print "   -e|--fail_rate <0..1>     --  fraction of failing requests [default=0]"
+    print " "
+    print "Example: ./wcs_benchmark.py -c 1,4,16 -l 0.2 -j 1.0 -e 0.05 "
+    print " "
+    sys.exit()
+
+
+#/************************************************************************/
+#/*                            percentile()                              */
+#/************************************************************************/
+
+def percentile(values, perc):
+    """
+        the perc-percentile of the values (nearest rank)
+    """
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    idx = int(round((len(values) - 1) * perc / 100.))
+
+    return values[idx]
+
+
+#/************************************************************************/
+#/*                             run_parallel()                           */
+#/************************************************************************/
+
+def run_parallel(func, items, concurrency):
+    """
+        run func(item) for all items with 'concurrency' threads
+        Returns:  list of the runtimes of the calls, number of failed calls, total runtime
+    """
+    todo = Queue.Queue()
+    for item in items:
+        todo.put(item)
+
+    runtimes = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            try:
+                item = todo.get_nowait()
+            except Queue.Empty:
+                return
+            start = time.time()
+            try:
+                ok = func(item)
+            except (Exception, SystemExit):
+                ok = False
+            with lock:
+                runtimes.append(time.time() - start)
+                if ok is False:
+                    errors[0] += 1
+
+    start = time.time()
+    threads = [threading.Thread(target=worker) for idx in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return runtimes, errors[0], time.time() - start
+
+
+#/************************************************************************/
+#/*                             benchmark()                              */
+#/************************************************************************/
+
+def benchmark(settings, input_params, concurrency_levels, num_listings):
+    """
+        run the listing and download benchmark for all concurrency levels
+        Returns:  list of result-dictionaries (one per concurrency level)
+    """
+    import dataset_reader
+    f_read = getattr(dataset_reader, 'CF_' + input_params['dataset'] + '_Reader')()
+
+    results = []
+    for concurrency in concurrency_levels:
+            # listings: the images and masks of the requested period
+        def do_listing(idx):
+            return len(f_read.get_filelist(dict(input_params), settings)[2]) >= 0
+
+        l_times, l_errors, l_total = run_parallel(do_listing, range(num_listings), concurrency)
+
+            # downloads: all images and masks of the period
+        base_flist, base_mask_flist, gfp_flist, gfpmask_flist = f_read.get_filelist(dict(input_params), settings)
+        items = [(cid, False) for cid in base_flist + gfp_flist] + [(cid, True) for cid in base_mask_flist + gfpmask_flist]
+        temp_storage = tempfile.mkdtemp(prefix='cloudfree_bench_') + os.sep
+
+        def do_download(item):
+            f_read.base_getcover([item[0]], input_params, settings, temp_storage, mask=item[1])
+            return os.path.exists(temp_storage + item[0] + '.tif')
+
+        d_times, d_errors, d_total = run_parallel(do_download, items, concurrency)
+        nbytes = sum([os.path.getsize(temp_storage+ff) for ff in os.listdir(temp_storage)])
+        shutil.rmtree(temp_storage, ignore_errors=True)
+
+        results.append({'concurrency': concurrency,
+                        'listings_per_sec': num_listings / l_total,
+                        'listing_p50': percentile(l_times, 50),
+                        'listing_p95': percentile(l_times, 95),
+                        'listing_p99': percentile(l_times, 99),
+                        'listing_errors': l_errors,
+                        'coverages': len(items),
+                        'coverages_per_sec': len(items) / d_total,
+                        'mbytes_per_sec': nbytes / d_total / 1024. / 1024.,
+                        'download_p50': percentile(d_times, 50),
+                        'download_p95': percentile(d_times, 95),
+                        'download_p99': percentile(d_times, 99),
+                        'download_errors': d_errors })
+
+    return results
+
+
+#/************************************************************************/
+#/*                           print_results()                            */
+#/************************************************************************/
+
+def print_results(results):
+    """
+        print the benchmark results as table
+    """
+    print ''
+    print '%6s | %10s %8s %8s %8s %5s | %6s %10s %8s %8s %8s %8s %5s' % ('conc.', 'listings/s',
+          'p50[s]', 'p95[s]', 'p99[s]', 'err', 'n_cov', 'coverages/s', 'MB/s', 'p50[s]', 'p95[s]', 'p99[s]', 'err')
+    for res in results:
+        print '%6d | %10.2f %8.3f %8.3f %8.3f %5d | %6d %10.2f %8.2f %8.3f %8.3f %8.3f %5d' % (res['concurrency'],
+              res['listings_per_sec'], res['listing_p50'], res['listing_p95'], res['listing_p99'], res['listing_errors'],
+              res['coverages'], res['coverages_per_sec'], res['mbytes_per_sec'], res['download_p50'],
+              res['download_p95'], res['download_p99'], res['download_errors'])
+    print ''
+
+
+#/************************************************************************/
+#/*                               main()                                 */
+#/************************************************************************/
+
+def main():
+    """
+        Main function: set up the (mock) server and run the benchmark
+    """
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hu:c:d:a:t:p:n:f:l:j:w:e:", ["help", "url=", "concurrency=",
+                    "dataset=", "aoi=", "time=", "period=", "listings=", "config=", "latency=", "jitter=",
+                    "bandwidth=", "fail_rate="])
+    except getopt.GetoptError, err:
+        print '[Error] -- ', str(err)
+        usage()
+
+    server_url = None
+    config_file = None
+    concurrency_levels = [1, 2, 4, 8]
+    num_listings = 20
+    mock_params = {'latency': 0.05, 'jitter': 0.1}
+    input_params = {'dataset': 'landsat5_2a',
+                    'aoi': ['3.5', '3.6', '43.3', '43.4'],
+                    'toi': '20110513',
+                    'scenario': 'T',
+                    'period': 30,
+                    'output_crs': 'epsg:4326',
+                    'bands': '999',
+                    'extract': 'SUB' }
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            usage()
+        elif opt in ("-u", "--url"):
+            server_url = arg
+        elif opt in ("-c", "--concurrency"):
+            concurrency_levels = [int(elem) for elem in arg.split(',')]
+        elif opt in ("-d", "--dataset"):
+            input_params['dataset'] = arg
+        elif opt in ("-a", "--aoi"):
+            input_params['aoi'] = arg.split(',')
+        elif opt in ("-t", "--time"):
+            input_params['toi'] = arg
+        elif opt in ("-p", "--period"):
+            input_params['period'] = int(arg)
+        elif opt in ("-n", "--listings"):
+            num_listings = int(arg)
+        elif opt in ("-f", "--config"):
+            config_file = arg
+        elif opt in ("-l", "--latency"):
+            mock_params['latency'] = float(arg)
+        elif opt in ("-j", "--jitter"):
+            mock_params['jitter'] = float(arg)
+        elif opt in ("-w", "--bandwidth"):
+            mock_params['bandwidth'] = float(arg)
+        elif opt in ("-e", "--fail_rate"):
+            mock_params['fail_rate'] = float(arg)
+
+    server = None
+    if server_url is None:
+            # ensure the coverages exist for the requested period
+        server = MockWCSServer(port=0, coverages=MockCoverages(start=str(int(input_params['toi'][0:4])-1)+'0101',
+                               end=str(int(input_params['toi'][0:4])+1)+'1231'), **mock_params)
+        server.start()
+        server_url = server.url
+        print 'Using the mock EO-WCS server at: ', server_url, ' ', mock_params
+
+    if config_file is not None:
+        settings = get_config(config_file)
+    else:
+        settings = {}
+    settings['logging.log_fsock'] = sys.stdout
+    for key, eoid in bench_datasets.iteritems():
+        settings['dataset.'+key] = server_url + 'EOID=' + eoid
+
+    wcs_client.configure(settings)
+
+    results = benchmark(settings, input_params, concurrency_levels, num_listings)
+    print_results(results)
+
+    if server is not None:
+        print 'Requests served by the mock server: ', server.requests
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
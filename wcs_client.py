@@ -73,7 +73,10 @@
 import sys
 import os
 import time, datetime
-import urllib2, socket
+import urllib2, socket, urlparse, httplib
+import threading, Queue
+import random
+import hashlib, json, shutil, tempfile, StringIO
 from xml.dom import minidom
 
 from util import print_log
@@ -105,6 +108,14 @@ if temp_storage is None:
     temp_storage = cur_dir # +'/tmp'
 
 
+    # chunk size (in bytes) used when reading the responses of the servers
+global chunk_size
+chunk_size = 65536
+
+    # the settings (from the config-file) - needed for logging, set by configure()
+global settings
+settings = None
+
 global file_ext
 file_ext = {'tiff': 'tif' ,
             'jpeg': 'jpg' ,
@@ -114,6 +125,974 @@ file_ext = {'tiff': 'tif' ,
             'x-hdf': 'hdf' }
 
 
+#/************************************************************************/
+#/*                              configure()                             */
+#/************************************************************************/
+
+def configure(in_settings):
+    """
+        Make the settings (from the configuration file) available to the wcsClient
+        and set up the per-server limits configured in the [wcs_limits] section
+        and the retry/hedging behaviour configured in the [wcs_requests] section.
+        Datasets configured with several urls are registered as mirrors.
+        The traffic mode (live/record/replay) and the memory budget of the in-memory
+        storage of the coverages are set as configured in [wcs_requests].
+        To be called once, before any request is sent. The limits are shared
+        by all wcsClient instances.
+    """
+    global settings
+    settings = in_settings
+
+    limits = {}
+    for key, value in in_settings.iteritems():
+        if key.startswith('wcs_limits.'):
+            limits[key[len('wcs_limits.'):]] = parse_limits(value)
+
+    set_limits(limits)
+
+        # datasets listing several urls are served by mirrors
+    for key, value in in_settings.iteritems():
+        if key.startswith('dataset.'):
+            services = split_mirrors(value)
+            if len(services) > 1:
+                set_mirrors([elem.rsplit('EOID')[0] for elem in services], services[0].rsplit('EOID')[1][1:])
+
+    set_retries(max_retries=in_settings.get('wcs_requests.max_retries'),
+                backoff_base=in_settings.get('wcs_requests.backoff_base'),
+                backoff_max=in_settings.get('wcs_requests.backoff_max'),
+                hedge_percentile=in_settings.get('wcs_requests.hedge_percentile'),
+                hedge_min_samples=in_settings.get('wcs_requests.hedge_min_samples'),
+                timeout=in_settings.get('wcs_requests.timeout'))
+
+    set_memory_budget(int(in_settings.get('wcs_requests.memory_store', 0)) * 1024 * 1024)
+
+    set_traffic_mode(in_settings.get('wcs_requests.traffic_mode'),
+                     in_settings.get('wcs_requests.traffic_archive'),
+                     in_settings.get('wcs_requests.replay_timing', 'no').lower() in ('yes', 'true', '1'))
+
+
+#/************************************************************************/
+#/*                            parse_limits()                            */
+#/************************************************************************/
+
+def parse_limits(value):
+    """
+        Parse a per-server limits entry of the form:
+            max_inflight=<n>, requests_per_sec=<n>, bytes_per_sec=<n>
+        Omitted values (or 0) mean unlimited.
+        Returns:  dictionary of the limits
+    """
+    limits = {'max_inflight': 0, 'requests_per_sec': 0, 'bytes_per_sec': 0}
+    for elem in value.split(','):
+        if elem.strip() == '':
+            continue
+        key, val = elem.split('=')
+        key = key.strip().lower()
+        if not limits.has_key(key):
+            raise ValueError("Unknown server limit: ", key)
+        limits[key] = float(val)
+
+    limits['max_inflight'] = int(limits['max_inflight'])
+
+    return limits
+
+
+#/************************************************************************/
+#/*                             TokenBucket()                            */
+#/************************************************************************/
+
+class TokenBucket(object):
+    """
+        Thread-safe token-bucket, refilled with 'rate' tokens per second up to
+        'capacity' (default: one second worth of tokens).
+        consume() blocks until the requested amount is available. Amounts larger
+        than the available tokens put the bucket into debt, which delays the
+        following callers accordingly. A rate of 0 disables the limit.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        if capacity is None:
+            capacity = self.rate
+        self.capacity = float(capacity)
+        self.tokens = self.capacity
+        self.stamp = time.time()
+        self.lock = threading.Lock()
+
+    def consume(self, amount=1):
+        if self.rate <= 0:
+            return
+
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate
+
+        if wait > 0:
+            time.sleep(wait)
+
+
+#/************************************************************************/
+#/*                            ServerLimiter()                           */
+#/************************************************************************/
+
+class ServerLimiter(object):
+    """
+        Limits applied to all requests sent to one server (host):
+          - max_inflight:       max. number of concurrently open requests
+          - requests_per_sec:   max. rate of new requests
+          - bytes_per_sec:      max. download bandwidth
+    """
+    def __init__(self, max_inflight=0, requests_per_sec=0, bytes_per_sec=0):
+        if max_inflight > 0:
+            self.slots = threading.BoundedSemaphore(max_inflight)
+        else:
+            self.slots = None
+        self.requests = TokenBucket(requests_per_sec)
+        self.bytes = TokenBucket(bytes_per_sec)
+
+    def acquire(self):
+        if self.slots is not None:
+            self.slots.acquire()
+        self.requests.consume(1)
+
+    def release(self):
+        if self.slots is not None:
+            self.slots.release()
+
+
+    # the configured limits (per host) and the ServerLimiters in use
+global _limits
+_limits = {}
+global _limiters
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+#/************************************************************************/
+#/*                             set_limits()                             */
+#/************************************************************************/
+
+def set_limits(limits):
+    """
+        Set the per-server limits, supplied as dictionary  {host: limits}.
+        The entry 'default' applies to all hosts without an own entry.
+    """
+    global _limits, _limiters
+    with _limiters_lock:
+        _limits = dict(limits)
+        _limiters = {}
+
+
+#/************************************************************************/
+#/*                             get_limiter()                            */
+#/************************************************************************/
+
+def get_limiter(http_request):
+    """
+        Returns the (shared) ServerLimiter of the host addressed by the http_request
+    """
+    host = urlparse.urlsplit(http_request)[1].lower()
+    with _limiters_lock:
+        if not _limiters.has_key(host):
+            limits = _limits.get(host.split(':')[0], _limits.get('default', {}))
+            _limiters[host] = ServerLimiter(**limits)
+
+        return _limiters[host]
+
+
+#/************************************************************************/
+#/*                            MirrorGroup()                             */
+#/************************************************************************/
+
+class MirrorGroup(object):
+    """
+        A set of WCS endpoints (server urls) serving the same DatasetSeries.
+        Keeps track of the observed latency, error rate and open requests of each 
+        mirror and ranks the mirrors accordingly, so requests get spread across
+        them and fail over to the next one if a mirror is down.
+    """
+        # weight of a new observation in the moving averages
+    _alpha = 0.3
+        # consecutive failures after which a mirror is considered to be down ...
+    _max_failures = 3
+        # ... and the time (sec) it is skipped then
+    _down_time = 60
+
+    def __init__(self, urls):
+        self.urls = list(urls)
+        self.lock = threading.Lock()
+        self.stats = {}
+        for url in self.urls:
+            self.stats[url] = {'latency': None, 'errors': 0.0, 'failures': 0, 'inflight': 0,
+                               'last_failure': 0, 'down_until': 0}
+
+    def _score(self, url, now):
+        stat = self.stats[url]
+            # mirrors without observations are tried first
+        latency = stat['latency'] or 0.0
+            # the error rate fades out with time, so failed mirrors get used again
+        errors = stat['errors'] * 0.5 ** ((now - stat['last_failure']) / self._down_time)
+        score = (latency + 0.01) * (1 + stat['inflight']) * (1 + 10 * errors)
+
+        return (stat['down_until'] > now, score, random.random())
+
+    def ranked(self):
+        """
+            Returns the mirror urls - best first
+        """
+        now = time.time()
+        with self.lock:
+            return sorted(self.urls, key=lambda url: self._score(url, now))
+
+    def started(self, url):
+        with self.lock:
+            self.stats[url]['inflight'] += 1
+
+    def finished(self, url, latency=None, failed=False):
+        """
+            record the outcome of a request sent to the mirror url
+        """
+        with self.lock:
+            stat = self.stats[url]
+            stat['inflight'] -= 1
+            if failed:
+                stat['errors'] = (1 - self._alpha) * stat['errors'] + self._alpha
+                stat['failures'] += 1
+                stat['last_failure'] = time.time()
+                if stat['failures'] >= self._max_failures:
+                    stat['down_until'] = time.time() + self._down_time
+            elif latency is not None:
+                stat['errors'] = (1 - self._alpha) * stat['errors']
+                stat['failures'] = 0
+                stat['down_until'] = 0
+                if stat['latency'] is None:
+                    stat['latency'] = latency
+                else:
+                    stat['latency'] = (1 - self._alpha) * stat['latency'] + self._alpha * latency
+
+
+    # the configured mirror groups - by (server url, EOID)
+global _mirrors
+_mirrors = {}
+    # the coverageIDs listed for a mirrored DatasetSeries - coverageID: EOID
+global _mirror_coverages
+_mirror_coverages = {}
+_mirrors_lock = threading.Lock()
+
+
+#/************************************************************************/
+#/*                             set_mirrors()                            */
+#/************************************************************************/
+
+def set_mirrors(server_urls, eoid):
+    """
+        Register a list of server urls (e.g. http://some.where.org/ows? ) as 
+        mirrors of each other for the DatasetSeries eoid. Requests for this
+        DatasetSeries (or its coverages) addressed to any of them will be spread
+        across all of them - other requests to these servers are not affected.
+    """
+    group = MirrorGroup(server_urls)
+    with _mirrors_lock:
+        for url in server_urls:
+            _mirrors[(url, eoid)] = group
+
+
+#/************************************************************************/
+#/*                          get_request_eoid()                          */
+#/************************************************************************/
+
+def get_request_eoid(http_request):
+    """
+        Returns the EOID of the DatasetSeries a http_request refers to: the eoID of a 
+        DescribeEOCoverageSet, or the DatasetSeries a requested coverageID has been 
+        listed for (see: register_mirror_coverages()); None otherwise
+    """
+    query = urlparse.urlsplit(http_request)[3]
+    params = dict((key.lower(), value) for key, value in urlparse.parse_qsl(query))
+    if params.has_key('eoid'):
+        return params['eoid']
+    if params.has_key('coverageid'):
+        with _mirrors_lock:
+            return _mirror_coverages.get(params['coverageid'])
+
+    return None
+
+
+#/************************************************************************/
+#/*                          get_mirror_group()                          */
+#/************************************************************************/
+
+def get_mirror_group(http_request):
+    """
+        Returns the MirrorGroup and the server url the http_request is addressed to,
+        or (None, None) if no mirrors are configured for it.
+    """
+    eoid = get_request_eoid(http_request)
+    if eoid is None:
+        return None, None
+
+    with _mirrors_lock:
+        for (url, group_eoid), group in _mirrors.iteritems():
+            if group_eoid == eoid and http_request.startswith(url):
+                return group, url
+
+    return None, None
+
+
+#/************************************************************************/
+#/*                      register_mirror_coverages()                     */
+#/************************************************************************/
+
+def register_mirror_coverages(http_request, cids):
+    """
+        Record the coverageIDs listed by a DescribeEOCoverageSet http_request, so
+        the GetCoverage requests for them get sent to the mirrors of the DatasetSeries
+    """
+    group, server_url = get_mirror_group(http_request)
+    if group is None:
+        return
+
+    eoid = get_request_eoid(http_request)
+    with _mirrors_lock:
+        for cid in cids:
+            _mirror_coverages[cid] = eoid
+
+
+#/************************************************************************/
+#/*                           split_mirrors()                            */
+#/************************************************************************/
+
+def split_mirrors(service):
+    """
+        A dataset entry of the config-file may list several (whitespace separated) 
+        mirror urls e.g.:  http://a.org/ows?EOID=xyz  http://b.org/ows?EOID=xyz
+        Returns:  list of the urls
+    """
+    return service.split()
+
+
+#/************************************************************************/
+#/*                        retries and hedging                           */
+#/************************************************************************/
+
+    # retry settings for failed requests (all WCS requests used are idempotent GETs)
+    #   max_retries:   number of retries after the first attempt
+    #   backoff_base:  base delay (sec) of the exponential backoff; the actual delay is
+    #                  drawn at random from [0, min(backoff_max, backoff_base * 2**retry)]
+global _retry
+_retry = {'max_retries': 3, 'backoff_base': 1.0, 'backoff_max': 30.0}
+
+    # hedging of slow requests - if a request has not received its first byte within
+    # the 'percentile' of the latencies observed for the same server and request type
+    # a duplicate request is issued and the first one to finish is used
+    # (percentile = 0 disables hedging)
+global _hedge
+_hedge = {'percentile': 0, 'min_samples': 20}
+
+    # timeout (sec) for the socket operations of a single request
+global request_timeout
+request_timeout = 180
+
+    # HTTP codes indicating a temporary server problem - such requests are retried
+_retry_codes = (408, 429, 500, 502, 503, 504)
+
+    # observed latencies (time to first byte) per server and request type
+global _latencies
+_latencies = {}
+_latencies_lock = threading.Lock()
+_max_latency_samples = 200
+
+
+class HedgeCancelled(Exception):
+    """
+        raised inside a request attempt which lost against its hedged duplicate
+    """
+    pass
+
+
+#/************************************************************************/
+#/*                            set_retries()                             */
+#/************************************************************************/
+
+def set_retries(max_retries=None, backoff_base=None, backoff_max=None, hedge_percentile=None,
+                hedge_min_samples=None, timeout=None):
+    """
+        Set the retry, hedging and timeout behaviour of all wcsClient instances.
+        Parameters not supplied keep their current values.
+    """
+    global request_timeout
+    if max_retries is not None:
+        _retry['max_retries'] = int(max_retries)
+    if backoff_base is not None:
+        _retry['backoff_base'] = float(backoff_base)
+    if backoff_max is not None:
+        _retry['backoff_max'] = float(backoff_max)
+    if hedge_percentile is not None:
+        _hedge['percentile'] = float(hedge_percentile)
+    if hedge_min_samples is not None:
+        _hedge['min_samples'] = int(hedge_min_samples)
+    if timeout is not None:
+        request_timeout = float(timeout)
+
+
+#/************************************************************************/
+#/*                           latency_key()                              */
+#/************************************************************************/
+
+def latency_key(http_request):
+    """
+        Key under which the latencies of a request are collected: server and request type
+    """
+    parts = urlparse.urlsplit(http_request)
+    query = parts[3].lower()
+    rtype = ''
+    for elem in query.split('&'):
+        if elem.startswith('request='):
+            rtype = elem[len('request='):]
+            break
+
+    return parts[1].lower(), rtype
+
+
+#/************************************************************************/
+#/*                          record_latency()                            */
+#/************************************************************************/
+
+def record_latency(http_request, latency):
+    """
+        store the observed time to first byte of a request
+    """
+    key = latency_key(http_request)
+    with _latencies_lock:
+        samples = _latencies.setdefault(key, [])
+        samples.append(latency)
+        if len(samples) > _max_latency_samples:
+            del samples[0]
+
+
+#/************************************************************************/
+#/*                            hedge_delay()                             */
+#/************************************************************************/
+
+def hedge_delay(http_request):
+    """
+        Returns the time (sec) after which a duplicate of the http_request shall be
+        issued, or None if hedging is disabled or not enough latencies are known yet
+    """
+    if _hedge['percentile'] <= 0:
+        return None
+
+    with _latencies_lock:
+        samples = sorted(_latencies.get(latency_key(http_request), []))
+
+    if len(samples) < max(_hedge['min_samples'], 1):
+        return None
+
+    idx = int(round((len(samples) - 1) * min(_hedge['percentile'], 100.) / 100.))
+
+    return samples[idx]
+
+
+#/************************************************************************/
+#/*                            is_retryable()                            */
+#/************************************************************************/
+
+def is_retryable(error):
+    """
+        Decides if a failed request may be retried: temporary server errors,
+        timeouts and connection problems are retried, other errors (e.g. invalid
+        requests, local I/O errors) are not.
+    """
+    if isinstance(error, urllib2.HTTPError):
+        return error.code in _retry_codes
+    if isinstance(error, (urllib2.URLError, socket.error, httplib.HTTPException)):
+        return True
+
+    return False
+
+
+#/************************************************************************/
+#/*                           is_mirror_error()                          */
+#/************************************************************************/
+
+def is_mirror_error(error):
+    """
+        Decides if a failed request indicates a problem of the mirror it was sent to:
+        server errors (5xx) and connection problems do, invalid requests (4xx) and 
+        local errors do not - those would fail the same way on any other mirror.
+    """
+    if isinstance(error, urllib2.HTTPError):
+        return error.code >= 500
+    if isinstance(error, (urllib2.URLError, socket.error, httplib.HTTPException)):
+        return True
+
+    return False
+
+
+#/************************************************************************/
+#/*                             _Attempt()                               */
+#/************************************************************************/
+
+class _Attempt(threading.Thread):
+    """
+        A single (possibly hedged) attempt to execute a request - runs in its own thread
+        and reports to the 'finished' queue when done.
+    """
+    def __init__(self, client, http_request, outfile, finished):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.client = client
+        self.http_request = http_request
+        self.outfile = outfile
+        self.finished = finished
+            # set as soon as the first byte is received (or the attempt has failed)
+        self.responding = threading.Event()
+        self.cancelled = threading.Event()
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = self.client._fetch_once(self.http_request, self.outfile, self.responding, self.cancelled)
+        except Exception as err:
+            self.error = err
+            if self.outfile is not None and os.path.exists(self.outfile):
+                os.remove(self.outfile)
+
+        self.responding.set()
+        self.finished.put(self)
+
+
+#/************************************************************************/
+#/*                     shared caches (batch mode)                       */
+#/************************************************************************/
+
+    # when several requests are run in one process (see: cloudless_jobs) identical requests
+    # are coalesced - only one of them is sent, the others wait for its result:
+    #   listings:   the responses of GetCapabilities/DescribeCoverage/DescribeEOCoverageSet
+    #               are cached for 'ttl' seconds  (ttl 0 = off)
+    #   coverages:  the GetCoverage responses are downloaded once into the coverage cache
+    #               directory and hard-linked (copied across devices) to each requester
+global _shared
+_shared = {'listing_ttl': 0, 'listings': {}, 'coverage_dir': None}
+_shared_lock = threading.Lock()
+_inflight = {}
+
+
+#/************************************************************************/
+#/*                         set_shared_caches()                          */
+#/************************************************************************/
+
+def set_shared_caches(listing_ttl=0, coverage_dir=None):
+    """
+        Set up the shared caches: the lifetime (sec) of cached listings and the
+        directory of the coverage cache (None = coverages are not coalesced)
+    """
+    if coverage_dir is not None and not os.path.isdir(coverage_dir):
+        os.makedirs(coverage_dir)
+    with _shared_lock:
+        _shared['listing_ttl'] = float(listing_ttl or 0)
+        _shared['listings'] = {}
+        _shared['coverage_dir'] = coverage_dir
+
+
+#/************************************************************************/
+#/*                        clear_shared_caches()                         */
+#/************************************************************************/
+
+def clear_shared_caches():
+    """
+        Drop the cached listings and remove the coverage cache directory
+    """
+    with _shared_lock:
+        coverage_dir = _shared['coverage_dir']
+        _shared['listings'] = {}
+        _shared['coverage_dir'] = None
+    if coverage_dir is not None:
+        shutil.rmtree(coverage_dir, ignore_errors=True)
+
+
+#/************************************************************************/
+#/*                        prune_shared_caches()                         */
+#/************************************************************************/
+
+def prune_shared_caches(max_age):
+    """
+        Drop the expired listings and remove coverages which have not been used for more
+        than max_age seconds from the coverage cache (for long-running processes, see:
+        cloudless_jobs, cloudless_daemon)
+    """
+    now = time.time()
+    with _shared_lock:
+        for key, entry in _shared['listings'].items():
+            if now - entry[0] >= _shared['listing_ttl']:
+                del _shared['listings'][key]
+        coverage_dir = _shared['coverage_dir']
+    if coverage_dir is None or not os.path.isdir(coverage_dir):
+        return
+
+    for filename in os.listdir(coverage_dir):
+        cache_file = os.path.join(coverage_dir, filename)
+        try:
+            if '.part' not in filename and now - os.path.getmtime(cache_file) > max_age:
+                os.remove(cache_file)
+        except OSError:
+            pass
+
+
+#/************************************************************************/
+#/*                              coalesce()                              */
+#/************************************************************************/
+
+class _SharedCall(object):
+    """
+        the result of a call shared by all callers of the same key
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.exc_info = None
+
+
+def coalesce(key, func):
+    """
+        Calls func() - unless a call with the same key is already running, then its
+        result (or exception) is shared instead.
+    """
+    with _shared_lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _SharedCall()
+            _inflight[key] = call
+
+    if leader:
+        try:
+            call.value = func()
+        except:
+            call.exc_info = sys.exc_info()
+        finally:
+            with _shared_lock:
+                del _inflight[key]
+            call.done.set()
+    else:
+        call.done.wait()
+
+    if call.exc_info is not None:
+        raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+
+    return call.value
+
+
+#/************************************************************************/
+#/*                            link_file()                               */
+#/************************************************************************/
+
+def link_file(src_file, dst_file):
+    """
+        hard-link src_file as dst_file - copy it if linking is not possible
+    """
+    if os.path.exists(dst_file):
+        os.remove(dst_file)
+    try:
+        os.link(src_file, dst_file)
+    except OSError:
+        shutil.copyfile(src_file, dst_file)
+
+
+#/************************************************************************/
+#/*                         in-memory storage                            */
+#/************************************************************************/
+
+    # the downloaded coverages may be kept as GDAL in-memory files (/vsimem/) instead of
+    # being written to the temp_storage - as long as they fit into the memory budget (bytes),
+    # larger ones spill to disk;  budget 0 = off - the files are kept under the absolute
+    # path of their outfile (temp_storage may be given relative, e.g. def_temp_dir = ./tmp/)
+global _memory
+_memory = {'budget': 0, 'used': 0, 'files': {}}
+_memory_lock = threading.Lock()
+memory_prefix = '/vsimem/cloudfree_store/'
+
+
+#/************************************************************************/
+#/*                          set_memory_budget()                         */
+#/************************************************************************/
+
+def set_memory_budget(nbytes):
+    """
+        Set the memory budget (bytes) of the in-memory storage of the downloaded
+        coverages, 0 switches it off
+    """
+    if nbytes is None or nbytes == '':
+        nbytes = 0
+    _memory['budget'] = int(nbytes)
+
+
+#/************************************************************************/
+#/*                          store_in_memory()                           */
+#/************************************************************************/
+
+def store_in_memory(outfile, body):
+    """
+        Keep the downloaded body of 'outfile' as GDAL in-memory file, if it fits into
+        the remaining memory budget.
+        Returns:  the /vsimem/ path  or  None (off, over budget, GDAL not available)
+    """
+    mem_path = reserve_memory(outfile, len(body))
+    if mem_path is None:
+        return None
+
+    from osgeo import gdal
+    gdal.FileFromMemBuffer(mem_path, body)
+
+    return mem_path
+
+
+#/************************************************************************/
+#/*                           reserve_memory()                           */
+#/************************************************************************/
+
+def reserve_memory(outfile, nbytes):
+    """
+        Reserve nbytes of the memory budget for the in-memory file of 'outfile' - an
+        in-memory file already stored for 'outfile' is replaced, i.e. freed first.
+        Returns:  the /vsimem/ path to be written  or  None (off, over budget, GDAL not available)
+    """
+    if _memory['budget'] <= 0:
+        return None
+    try:
+        from osgeo import gdal
+    except ImportError:
+        return None
+
+    outfile = os.path.abspath(outfile)
+    release_memory_file(outfile)
+    with _memory_lock:
+        if _memory['used'] + nbytes > _memory['budget']:
+            return None
+        _memory['used'] += nbytes
+        mem_path = memory_prefix+hashlib.md5(os.path.dirname(outfile)).hexdigest()+'/'+os.path.basename(outfile)
+        _memory['files'][outfile] = (mem_path, nbytes)
+
+    return mem_path
+
+
+#/************************************************************************/
+#/*                            open_outfile()                            */
+#/************************************************************************/
+
+def open_outfile(outfile, request_handle, in_memory=False):
+    """
+        Open the outfile of a download:  in memory (see: store_in_memory) if requested and
+        the size announced by the server (Content-Length) fits into the remaining budget,
+        on disk otherwise - so an oversized response is never read into memory.
+        Returns:  a file handle  or  a MemoryOutfile
+    """
+    if in_memory:
+        length = request_handle.info().getheader('Content-Length')
+        if length is not None and length.strip().isdigit():
+            mem_path = reserve_memory(outfile, int(length))
+            if mem_path is not None:
+                if os.path.exists(outfile):
+                    os.remove(outfile)
+                return MemoryOutfile(outfile, mem_path)
+        release_memory_file(outfile)
+
+    return open(outfile, 'w+b')
+
+
+#/************************************************************************/
+#/*                            MemoryOutfile()                           */
+#/************************************************************************/
+
+class MemoryOutfile(object):
+    """
+        The outfile of a download kept in memory - the body is stored (as GDAL in-memory
+        file) by commit(), closing it without commit() releases the reserved budget
+    """
+    def __init__(self, outfile, mem_path):
+        self.outfile = outfile
+        self.mem_path = mem_path
+        self.chunks = []
+        self.committed = False
+
+    def write(self, chunk):
+        self.chunks.append(chunk)
+
+    def commit(self):
+        from osgeo import gdal
+        gdal.FileFromMemBuffer(self.mem_path, ''.join(self.chunks))
+        self.chunks = []
+        self.committed = True
+
+    def close(self):
+        if not self.committed:
+            release_memory_file(self.outfile)
+
+
+#/************************************************************************/
+#/*                          get_memory_files()                          */
+#/************************************************************************/
+
+def get_memory_files(dirname):
+    """
+        Returns:  {basename: /vsimem/ path}  of the in-memory files stored for the directory
+    """
+    dirname = os.path.join(os.path.abspath(dirname), '')
+    with _memory_lock:
+        return dict((os.path.basename(outfile), entry[0]) for outfile, entry in _memory['files'].items()
+                    if os.path.join(os.path.dirname(outfile), '') == dirname)
+
+
+#/************************************************************************/
+#/*                         release_memory_file()                        */
+#/************************************************************************/
+
+def release_memory_file(outfile):
+    """
+        Free the in-memory file stored for 'outfile' (and its share of the budget)
+    """
+    with _memory_lock:
+        entry = _memory['files'].pop(os.path.abspath(outfile), None)
+        if entry is None:
+            return
+        _memory['used'] -= entry[1]
+
+    from osgeo import gdal
+    gdal.Unlink(entry[0])
+
+
+#/************************************************************************/
+#/*                         clear_memory_files()                         */
+#/************************************************************************/
+
+def clear_memory_files(dirname):
+    """
+        Free all in-memory files stored for the directory (e.g. the temp_storage of a request)
+    """
+    dirname = os.path.join(os.path.abspath(dirname), '')
+    with _memory_lock:
+        outfiles = [outfile for outfile in _memory['files'].keys()
+                    if os.path.join(os.path.dirname(outfile), '') == dirname]
+    for outfile in outfiles:
+        release_memory_file(outfile)
+
+
+#/************************************************************************/
+#/*                        record / replay traffic                       */
+#/************************************************************************/
+
+    # traffic mode of all wcsClients:  None (=live), 'record' or 'replay'
+    #   record:  all requests are executed and their urls, responses and timings
+    #            are stored in the traffic archive (a directory)
+    #   replay:  the responses are served from the traffic archive (no network access),
+    #            optionally delayed by the originally recorded timing
+global _traffic
+_traffic = {'mode': None, 'archive': None, 'timing': False}
+_traffic_lock = threading.Lock()
+
+
+#/************************************************************************/
+#/*                          set_traffic_mode()                          */
+#/************************************************************************/
+
+def set_traffic_mode(mode, archive=None, timing=False):
+    """
+        Set the traffic mode:  'off' | 'record' | 'replay'  and the location of the
+        traffic archive. 'timing' applies to the replay only - if set, responses are
+        delivered after the originally recorded time.
+    """
+    if mode is None or mode.lower() in ('', 'off', 'none'):
+        _traffic['mode'] = None
+        return
+
+    mode = mode.lower()
+    if mode not in ('record', 'replay'):
+        raise ValueError("Unknown traffic mode: ", mode)
+    if archive is None or archive == '':
+        raise ValueError("A traffic archive location is required for the traffic mode: ", mode)
+    if mode == 'record' and not os.path.isdir(archive):
+        os.makedirs(archive)
+    if mode == 'replay' and not os.path.isdir(archive):
+        raise ValueError("Traffic archive does not exist: ", archive)
+
+    _traffic['mode'] = mode
+    _traffic['archive'] = archive
+    _traffic['timing'] = timing
+
+
+#/************************************************************************/
+#/*                           traffic_entry()                            */
+#/************************************************************************/
+
+def traffic_entry(http_request):
+    """
+        Returns the filenames (meta-data, response) under which the traffic of the 
+        http_request is stored in the traffic archive
+    """
+    key = hashlib.sha1(http_request).hexdigest()
+    base = os.path.join(_traffic['archive'], key)
+
+    return base+'.json', base+'.body'
+
+
+#/************************************************************************/
+#/*                          record_traffic()                            */
+#/************************************************************************/
+
+def record_traffic(http_request, status, body_file, duration):
+    """
+        store the response (available in the file body_file) of the http_request
+        in the traffic archive
+    """
+    meta_file, archive_body = traffic_entry(http_request)
+    meta = {'url': http_request,
+            'status': status,
+            'duration': duration,
+            'size': os.path.getsize(body_file),
+            'recorded': time.strftime("%Y-%m-%dT%H:%M:%S%Z") }
+
+    with _traffic_lock:
+        shutil.copyfile(body_file, archive_body+'.tmp')
+        os.rename(archive_body+'.tmp', archive_body)
+        out_handle = open(meta_file+'.tmp', 'w')
+        json.dump(meta, out_handle, indent=1)
+        out_handle.close()
+        os.rename(meta_file+'.tmp', meta_file)
+
+
+#/************************************************************************/
+#/*                          _discard_attempts()                         */
+#/************************************************************************/
+
+def _discard_attempts(finished, count):
+    """
+        wait for the outstanding (cancelled) attempts and remove their partial output
+    """
+    for idx in range(count):
+        attempt = finished.get()
+        if attempt.outfile is not None and os.path.exists(attempt.outfile):
+            os.remove(attempt.outfile)
+
+
+#/************************************************************************/
+#/*                              log_msg()                               */
+#/************************************************************************/
+
+def log_msg(msg):
+    """
+        log a message via print_log() - or to stderr if no settings are configured
+    """
+    if settings is not None:
+        print_log(settings, msg)
+    else:
+        if msg.__class__ is not str:
+            msg = ' '.join([str(elem) for elem in msg])
+        print >> sys.stderr, msg
+
+
 #/************************************************************************/
 #/*                              wcsClient()                             */
 #/************************************************************************/
@@ -555,6 +1534,30 @@ class wcsClient(object):
         return result
 
 
+    #/************************************************************************/
+    #/*                            GetDocument()                             */
+    #/************************************************************************/
+    def GetDocument(self, url, settings):
+        """
+            Plain HTTP GET of a document which is not a WCS request e.g. the directory
+            listing of a COG archive served by a static HTTP server. The same limits, 
+            retries, mirrors and record/replay apply as for the WCS requests.
+            Returns:  the document  or  None (an error message is logged)
+        """
+        try:
+            status, document = self._fetch(url)
+            return document
+
+        except urllib2.HTTPError, http_ERROR:
+            err_msg = time.strftime("%Y-%m-%dT%H:%M:%S%Z"), "- ERROR:  The server couldn\'t fulfill the request - Code returned:  ", http_ERROR.code, url
+            print_log(settings, err_msg)
+        except (urllib2.URLError, IOError), url_ERROR:
+            err_msg = time.strftime("%Y-%m-%dT%H:%M:%S%Z"), "- ERROR:  Server not accessible -", getattr(url_ERROR, 'reason', url_ERROR), url
+            print_log(settings, err_msg)
+
+        return None
+
+
     #/************************************************************************/
     #/*                             parse_xml()                              */
     #/************************************************************************/
@@ -581,6 +1584,353 @@ class wcsClient(object):
 
 
 
+    #/************************************************************************/
+    #/*                                _fetch()                              */
+    #/************************************************************************/
+    def _fetch(self, http_request, outfile=None, in_memory=False):
+        """
+            Opens the http_request and reads the response - depending on the traffic
+            mode (see: set_traffic_mode()) live, recording the traffic, or replaying
+            it from the traffic archive.
+            If an outfile is supplied the response is written to it - or, with in_memory,
+            kept in memory if it fits into the budget (see: open_outfile()).
+            Returns:  (HttpCode, response)  or, if an outfile is supplied,
+                      (HttpCode, number of bytes written)
+            URLErrors and IOErrors are passed on to the caller.
+        """
+        if _traffic['mode'] == 'replay':
+            return self._fetch_replay(http_request, outfile)
+        if _traffic['mode'] == 'record':
+            return self._fetch_record(http_request, outfile)
+
+        return self._fetch_live(http_request, outfile, in_memory)
+
+
+    #/************************************************************************/
+    #/*                            _fetch_record()                           */
+    #/************************************************************************/
+    def _fetch_record(self, http_request, outfile=None):
+        """
+            Executes the http_request (see: _fetch_live()) and records the response
+            (including error responses of the server) and its timing in the traffic archive
+        """
+        start = time.time()
+        if outfile is not None:
+            body_file = outfile
+        else:
+            fd, body_file = tempfile.mkstemp(prefix='wcs_traffic_', dir=_traffic['archive'])
+            os.close(fd)
+
+        try:
+            try:
+                result = self._fetch_live(http_request, body_file)
+            except urllib2.HTTPError as http_ERROR:
+                    # record the error response, and pass on an unread copy of it
+                body = http_ERROR.read()
+                out_handle = open(body_file, 'wb')
+                out_handle.write(body)
+                out_handle.close()
+                record_traffic(http_request, http_ERROR.code, body_file, time.time() - start)
+                if outfile is not None:
+                    os.remove(outfile)
+                raise urllib2.HTTPError(http_ERROR.filename, http_ERROR.code, http_ERROR.msg,
+                                        http_ERROR.hdrs, StringIO.StringIO(body))
+
+            record_traffic(http_request, result[0], body_file, time.time() - start)
+            if outfile is not None:
+                return result
+
+            in_handle = open(body_file, 'rb')
+            body = in_handle.read()
+            in_handle.close()
+            return result[0], body
+
+        finally:
+            if outfile is None and os.path.exists(body_file):
+                os.remove(body_file)
+
+
+    #/************************************************************************/
+    #/*                            _fetch_replay()                           */
+    #/************************************************************************/
+    def _fetch_replay(self, http_request, outfile=None):
+        """
+            Serves the response of the http_request from the traffic archive 
+            (optionally after the originally recorded time).
+            Returns:  see _fetch()
+        """
+        meta_file, archive_body = traffic_entry(http_request)
+        if not os.path.exists(meta_file):
+            raise urllib2.URLError('Request not available in the traffic archive: '+http_request)
+
+        in_handle = open(meta_file, 'r')
+        meta = json.load(in_handle)
+        in_handle.close()
+
+        if _traffic['timing'] is True:
+            time.sleep(meta['duration'])
+
+        if meta['status'] >= 400:
+            in_handle = open(archive_body, 'rb')
+            body = in_handle.read()
+            in_handle.close()
+            raise urllib2.HTTPError(http_request, meta['status'], 'Replayed error response', {},
+                                    StringIO.StringIO(body))
+
+        if outfile is not None:
+            shutil.copyfile(archive_body, outfile)
+            return meta['status'], meta['size']
+
+        in_handle = open(archive_body, 'rb')
+        body = in_handle.read()
+        in_handle.close()
+
+        return meta['status'], body
+
+
+    #/************************************************************************/
+    #/*                             _fetch_live()                            */
+    #/************************************************************************/
+    def _fetch_live(self, http_request, outfile=None, in_memory=False):
+        """
+            Opens the http_request and reads the response. Temporary failures are
+            retried with a jittered exponential backoff, slow requests are hedged
+            (see: set_retries()), and the limits configured for the target server
+            are honoured (see: configure()).
+            If the requested DatasetSeries has mirrors (see: set_mirrors()) the request is
+            sent to the best ranked mirror, and fails over to the other mirrors in case of
+            server or connection errors.
+            If an outfile is supplied the response is written to it chunk-wise.
+            Returns:  (HttpCode, response)  or, if an outfile is supplied,
+                      (HttpCode, number of bytes written)
+            URLErrors and IOErrors of the last attempt are passed on to the caller.
+        """
+        group, server_url = get_mirror_group(http_request)
+        failed = []
+
+        retry = 0
+        while True:
+            if group is not None:
+                ranked = group.ranked()
+                    # mirrors which already failed for this request come last
+                ranked = [url for url in ranked if url not in failed] + [url for url in ranked if url in failed]
+                requests = [url+http_request[len(server_url):] for url in ranked]
+            else:
+                requests = [http_request]
+
+            try:
+                return self._fetch_hedged(requests, outfile, in_memory)
+            except Exception as err:
+                    # only server errors and connection problems are failed over
+                if group is not None and is_mirror_error(err) and ranked[0] not in failed:
+                    failed.append(ranked[0])
+                        # immediately fail over to the next mirror - if there is one left
+                    if len(failed) < len(ranked):
+                        lmsg = time.strftime("%Y-%m-%dT%H:%M:%S%Z"), '- WARNING:  request failed (', str(err), ') - failing over to:', ranked[1]
+                        log_msg(lmsg)
+                        continue
+                if retry >= _retry['max_retries'] or not is_retryable(err):
+                    raise
+
+            retry += 1
+            delay = random.uniform(0, min(_retry['backoff_max'], _retry['backoff_base'] * 2**retry))
+            lmsg = time.strftime("%Y-%m-%dT%H:%M:%S%Z"), '- WARNING:  request failed (', str(err), ') - retry', retry, 'in', '%.1f' % delay, 'sec'
+            log_msg(lmsg)
+            time.sleep(delay)
+
+
+    #/************************************************************************/
+    #/*                            _fetch_hedged()                           */
+    #/************************************************************************/
+    def _fetch_hedged(self, requests, outfile=None, in_memory=False):
+        """
+            Executes the request (the first of the list of alternative http_requests,
+            i.e. the same request addressed to different mirrors) - if it does not
+            respond within the hedging delay a duplicate request is issued (to the
+            next mirror, if available) and the result of the first one to finish
+            successfully is used (the other one gets cancelled) - hedged attempts are
+            always written to disk.
+            Returns:  see _fetch()
+        """
+        delay = hedge_delay(requests[0])
+        if delay is None:
+            return self._fetch_once(requests[0], outfile, in_memory=in_memory)
+
+        finished = Queue.Queue()
+        attempts = []
+        for idx in range(2):
+            if outfile is not None:
+                part_file = outfile+'.part'+str(idx)
+            else:
+                part_file = None
+            attempt = _Attempt(self, requests[min(idx, len(requests)-1)], part_file, finished)
+            attempts.append(attempt)
+            attempt.start()
+                # only issue the duplicate if the first one is slow
+            if idx == 0 and attempt.responding.wait(delay):
+                break
+
+        error = None
+        for idx in range(len(attempts)):
+            attempt = finished.get()
+            if attempt.error is None:
+                for other in attempts:
+                    if other is not attempt:
+                        other.cancelled.set()
+                if outfile is not None:
+                    if os.path.exists(outfile):
+                        os.remove(outfile)
+                    os.rename(attempt.outfile, outfile)
+                    # remove the results of the remaining attempts once they finish
+                remaining = len(attempts) - idx - 1
+                if remaining > 0:
+                    cleanup = threading.Thread(target=_discard_attempts, args=(finished, remaining))
+                    cleanup.daemon = True
+                    cleanup.start()
+                return attempt.result
+            error = attempt.error
+
+        raise error
+
+
+    #/************************************************************************/
+    #/*                             _fetch_once()                            */
+    #/************************************************************************/
+    def _fetch_once(self, http_request, outfile=None, responding=None, cancelled=None, in_memory=False):
+        """
+            Executes a single attempt of the http_request (see _fetch()).
+            The 'responding' event gets set (and the latency recorded) as soon as the
+            response headers have been received - time to first byte, not the transfer time
+            of the first chunk;  the attempt is aborted (HedgeCancelled) once the 'cancelled' event is set.
+        """
+        limiter = get_limiter(http_request)
+        limiter.acquire()
+        group, server_url = get_mirror_group(http_request)
+        if group is not None:
+            group.started(server_url)
+        latency = None
+        failed = False
+        request_handle = None
+        out_handle = None
+        try:
+            start = time.time()
+            request_handle = urllib2.urlopen(http_request, timeout=request_timeout)
+            latency = time.time() - start
+            record_latency(http_request, latency)
+            if responding is not None:
+                responding.set()
+            status = request_handle.code
+            if outfile is not None:
+                out_handle = open_outfile(outfile, request_handle, in_memory)
+
+            chunks = []
+            nbytes = 0
+            while True:
+                chunk = request_handle.read(chunk_size)
+                if not chunk:
+                    break
+                if cancelled is not None and cancelled.is_set():
+                    raise HedgeCancelled()
+                limiter.bytes.consume(len(chunk))
+                nbytes += len(chunk)
+                if out_handle is not None:
+                    out_handle.write(chunk)
+                else:
+                    chunks.append(chunk)
+
+            if isinstance(out_handle, MemoryOutfile):
+                out_handle.commit()
+                return status, nbytes
+            if out_handle is not None:
+                out_handle.flush()
+                os.fsync(out_handle.fileno())
+                return status, nbytes
+
+        except (urllib2.URLError, socket.error, httplib.HTTPException) as err:
+            failed = is_mirror_error(err)
+            raise
+
+        finally:
+            limiter.release()
+            if group is not None:
+                group.finished(server_url, latency, failed)
+            if request_handle is not None:
+                request_handle.close()
+            if out_handle is not None:
+                out_handle.close()
+
+        return status, ''.join(chunks)
+
+
+    #/************************************************************************/
+    #/*                           _fetch_listing()                           */
+    #/************************************************************************/
+    def _fetch_listing(self, http_request):
+        """
+            _fetch() of a listing (xml) request - served from the listing cache and
+            coalesced with identical requests, if the shared caches are set up
+            Returns:  (HttpCode, response)
+        """
+        if _shared['listing_ttl'] <= 0:
+            return self._fetch(http_request)
+
+        with _shared_lock:
+            entry = _shared['listings'].get(http_request)
+        if entry is not None and time.time() - entry[0] < _shared['listing_ttl']:
+            return entry[1]
+
+        result = coalesce(('listing', http_request), lambda: self._fetch(http_request))
+        with _shared_lock:
+            _shared['listings'][http_request] = (time.time(), result)
+
+        return result
+
+
+    #/************************************************************************/
+    #/*                          _fetch_coverage()                           */
+    #/************************************************************************/
+    def _fetch_coverage(self, http_request, outfile):
+        """
+            _fetch() of a coverage into the outfile - via the coverage cache (one download per
+            coverage, shared by all requesters), if the shared caches are set up; in-memory
+            (see: store_in_memory) if a memory budget is set
+            Returns:  HttpCode
+        """
+        coverage_dir = _shared['coverage_dir']
+        if coverage_dir is None:
+                # kept in memory if it fits into the budget - streamed to disk otherwise
+            status, nbytes = self._fetch(http_request, outfile, in_memory=_memory['budget'] > 0)
+            return status
+
+        cache_file = os.path.join(coverage_dir, hashlib.sha1(http_request).hexdigest()+os.path.splitext(outfile)[1])
+
+        def download():
+            if os.path.exists(cache_file):
+                    # the age of a cache entry counts from its last use (see: prune_shared_caches)
+                os.utime(cache_file, None)
+                return 200
+            try:
+                status, nbytes = self._fetch(http_request, cache_file+'.part')
+                os.rename(cache_file+'.part', cache_file)
+            finally:
+                if os.path.exists(cache_file+'.part'):
+                    os.remove(cache_file+'.part')
+            return status
+
+        status = coalesce(('coverage', http_request), download)
+        mem_path = reserve_memory(outfile, os.path.getsize(cache_file))
+        if mem_path is not None:
+            in_handle = open(cache_file, 'rb')
+            out_handle = MemoryOutfile(outfile, mem_path)
+            out_handle.write(in_handle.read())
+            in_handle.close()
+            out_handle.commit()
+            return status
+        link_file(cache_file, outfile)
+
+        return status
+
+
     #/************************************************************************/
     #/*                         _execute_xml_request()                       */
     #/************************************************************************/
@@ -592,22 +1942,20 @@ class wcsClient(object):
             Output: prints out the submitted http_request  or Error_XML in case of failure
         """
         try:
-                # access the url
-            request_handle = urllib2.urlopen(http_request)
-                # read the content of the url
-            result_xml = request_handle.read()
+                # access the url and read its content
+            status, result_xml = self._fetch_listing(http_request)
 
                 # extract only the CoverageIDs and provide them as a list for further usage
             if IDs_only == True:
                 cids = self._parse_xml(result_xml, self._xml_ID_tag[1])
-                request_handle.close()
                 # if no datasets are found return the XML
                 if len(cids) == 0 or cids is None:
                     cids = result_xml
+                else:
+                    register_mirror_coverages(http_request, cids)
                 
                 return cids
             else:
-                request_handle.close()
                 return result_xml
 
         except urllib2.URLError, url_ERROR:
@@ -669,26 +2017,8 @@ class wcsClient(object):
 
 
         try:
-            request_handle = urllib2.urlopen(http_request)
-            status = request_handle.code
-
-            try:
-                file_getcov = open(outfile, 'w+b')
-                file_getcov.write(request_handle.read())
-                file_getcov.flush()
-                os.fsync(file_getcov.fileno())
-                file_getcov.close()
-                request_handle.close()
-                return status
-
-            except IOError as (errno, strerror):
-                err_msg = "I/O error({0}): {1}".format(errno, strerror)
-                print_log(settings, err_msg)
-            except:
-                err_msg = "Unexpected error:", sys.exc_info()[0]
-                print_log(settings, err_msg)
-                raise
-
+            status = self._fetch_coverage(http_request, outfile)
+            return status
 
         except urllib2.URLError as url_ERROR:
             if hasattr(url_ERROR, 'reason'):
@@ -705,6 +2035,9 @@ class wcsClient(object):
                 print_log(settings, lmsg)
                 err_msg = str(url_ERROR.code)+'--'+url_ERROR.read()
                 return err_msg
+        except IOError as io_ERROR:
+            err_msg = "I/O error({0}): {1}".format(io_ERROR.errno, io_ERROR.strerror or io_ERROR)
+            print_log(settings, err_msg)
         except TypeError:
             pass
 